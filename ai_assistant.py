@@ -1,24 +1,34 @@
 import os
 import logging
+import threading
 
-# Try to initialize Gemini client, but handle missing API key gracefully
-client = None
-genai = None
-types = None
+# The Gemini client is built on the first chat request, so importing this
+# module (and booting a web worker) does not pay for google.genai
+_client = None
+_types = None
+_loaded = False
+_load_lock = threading.Lock()
 
-try:
-    from google import genai as google_genai
-    from google.genai import types as google_types
-    genai = google_genai
-    types = google_types
-    
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if api_key:
-        client = genai.Client(api_key=api_key)
-    else:
-        logging.warning("GEMINI_API_KEY not found. AI assistant will use fallback responses.")
-except ImportError:
-    logging.warning("Google GenAI package not found. AI assistant will use fallback responses.")
+
+def _load_client():
+    """Return (client, types), or (None, None) when the API key or package is missing"""
+    global _client, _types, _loaded
+    if not _loaded:
+        with _load_lock:
+            if not _loaded:
+                api_key = os.environ.get("GEMINI_API_KEY")
+                if not api_key:
+                    logging.warning("GEMINI_API_KEY not found. AI assistant will use fallback responses.")
+                else:
+                    try:
+                        from google import genai
+                        from google.genai import types
+                        _client = genai.Client(api_key=api_key)
+                        _types = types
+                    except ImportError:
+                        logging.warning("Google GenAI package not found. AI assistant will use fallback responses.")
+                _loaded = True
+    return _client, _types
 
 class EcoSwapAssistant:
     def __init__(self):
@@ -72,6 +82,7 @@ class EcoSwapAssistant:
     def get_response(self, user_message, conversation_history=None):
         """Get AI response for user message"""
         # If client or types are not available, use fallback responses
+        client, types = _load_client()
         if not client or not types:
             return self._get_fallback_response(user_message)
             
@@ -113,7 +124,7 @@ class EcoSwapAssistant:
             return response.text if response.text else "I'm sorry, I couldn't process your request. Please try again."
             
         except Exception as e:
-            logging.error(f"AI Assistant error: {e}")
+            logging.error("AI Assistant error: %s", e)
             return self._get_fallback_response(user_message)
     
     def _get_fallback_response(self, user_message):
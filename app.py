@@ -1,46 +1,113 @@
 import os
-import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager
-from flask_bcrypt import Bcrypt
+from flask_login import LoginManager, current_user
 from flask_wtf.csrf import CSRFProtect
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from passwords import PasswordHasher
+import database
+import metrics
+import logging_setup
+import realtime
+import wishlist_alerts
+import jobs
+import assets
+import compression
 
 class Base(DeclarativeBase):
     pass
 
 # Initialize extensions
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': database.RoutingSession})
 login_manager = LoginManager()
-bcrypt = Bcrypt()
+password_hasher = PasswordHasher()
 csrf = CSRFProtect()
 
 def create_app():
+    """Build the application without touching the database; see `flask db create`"""
     app = Flask(__name__)
     
+    # Structured logging; level comes from APP_ENV or LOG_LEVEL
+    logging_setup.configure_logging(app)
+    
     # Configuration
     app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///ecoswap.db")
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
-    }
+    # Database URLs, pool sizing and SQLite pragmas (see database.py)
+    database.load_database_config(app)
     app.config['UPLOAD_FOLDER'] = 'static/uploads'
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    # Uploads whose decoded pixels would need more memory than this are rejected
+    app.config['IMAGE_MAX_DECODE_MB'] = int(os.environ.get("IMAGE_MAX_DECODE_MB", "64"))
+    # New listings whose photos are within this many dHash bits of another listing's are flagged
+    app.config['DUPLICATE_IMAGE_DISTANCE'] = int(os.environ.get("DUPLICATE_IMAGE_DISTANCE", "6"))
+    
+    # Password hashing: bcrypt, pbkdf2 or scrypt; cost defaults per method
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get("PASSWORD_HASH_METHOD", "bcrypt")
+    app.config['PASSWORD_HASH_COST'] = os.environ.get("PASSWORD_HASH_COST")
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get("PASSWORD_HASH_WORKERS", "0"))
+    
+    # Request instrumentation exposed at /metrics
+    app.config['METRICS_ENABLED'] = os.environ.get("METRICS_ENABLED", "1") == "1"
+    app.config['METRICS_SERVER_TIMING'] = os.environ.get("METRICS_SERVER_TIMING", "0") == "1"
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get("SLOW_QUERY_MS", "0"))
+    
+    # Saved searches per user; each is matched against every new listing
+    app.config['MAX_SAVED_SEARCHES'] = int(os.environ.get("MAX_SAVED_SEARCHES", "20"))
+    
+    # Offers expire unanswered after this many hours (see `flask offers expire`)
+    app.config['OFFER_EXPIRY_HOURS'] = int(os.environ.get("OFFER_EXPIRY_HOURS", "72"))
+    
+    # Wishlist price-drop / back-in-stock alerts, at most one per user per window
+    app.config['WISHLIST_ALERTS_ENABLED'] = os.environ.get("WISHLIST_ALERTS_ENABLED", "1") == "1"
+    app.config['WISHLIST_ALERT_WINDOW_HOURS'] = float(os.environ.get("WISHLIST_ALERT_WINDOW_HOURS", "6"))
+    
+    # Background jobs (`flask jobs worker`); the embedded worker runs a thread per web process
+    app.config['JOBS_EMBEDDED_WORKER'] = os.environ.get("JOBS_EMBEDDED_WORKER", "0") == "1"
+    app.config['JOBS_LEASE_SECONDS'] = int(os.environ.get("JOBS_LEASE_SECONDS", "300"))
+    app.config['VIEW_FLUSH_SECONDS'] = float(os.environ.get("VIEW_FLUSH_SECONDS", "10"))
+    app.config['OFFER_SWEEP_SECONDS'] = int(os.environ.get("OFFER_SWEEP_SECONDS", "60"))
+    app.config['TRENDING_ROLLUP_SECONDS'] = int(os.environ.get("TRENDING_ROLLUP_SECONDS", "300"))
+    app.config['RETENTION_SECONDS'] = int(os.environ.get("RETENTION_SECONDS", "3600"))
+    app.config['ARCHIVE_SOLD_AFTER_DAYS'] = int(os.environ.get("ARCHIVE_SOLD_AFTER_DAYS", "90"))
+    app.config['MESSAGE_ARCHIVE_AFTER_DAYS'] = int(os.environ.get("MESSAGE_ARCHIVE_AFTER_DAYS", "365"))
+    app.config['NOTIFICATION_RETENTION_DAYS'] = int(os.environ.get("NOTIFICATION_RETENTION_DAYS", "30"))
+    
+    # Serve the output of `flask assets build` when present
+    app.config['ASSETS_USE_BUILD'] = os.environ.get("ASSETS_USE_BUILD", "1") == "1"
+    
+    # Compress HTML/JSON/text responses of at least this many bytes
+    app.config['COMPRESS_ENABLED'] = os.environ.get("COMPRESS_ENABLED", "1") == "1"
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get("COMPRESS_MIN_SIZE", "500"))
+    # Seconds browsers and proxies may reuse /api/quick_help answers
+    app.config['QUICK_HELP_MAX_AGE'] = int(os.environ.get("QUICK_HELP_MAX_AGE", "86400"))
+    
+    # Search suggestions (/api/suggest): words kept, how often new listings are
+    # folded in and the index rebuilt, and how long answers may be cached
+    app.config['SUGGEST_MAX_TERMS'] = int(os.environ.get("SUGGEST_MAX_TERMS", "200000"))
+    app.config['SUGGEST_REFRESH_SECONDS'] = float(os.environ.get("SUGGEST_REFRESH_SECONDS", "30"))
+    app.config['SUGGEST_REBUILD_SECONDS'] = float(os.environ.get("SUGGEST_REBUILD_SECONDS", "3600"))
+    app.config['SUGGEST_MAX_AGE'] = int(os.environ.get("SUGGEST_MAX_AGE", "60"))
+    
+    # Live badge updates over /events; "memory" for one process, "postgres" across servers
+    app.config['REALTIME_ENABLED'] = os.environ.get("REALTIME_ENABLED", "1") == "1"
+    app.config['REALTIME_BROKER'] = os.environ.get("REALTIME_BROKER", "memory")
     
     # Proxy fix for proper URL generation
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
     
     # Initialize extensions
     db.init_app(app)
+    database.init_app(app, db)
+    metrics.init_app(app, db)
     login_manager.init_app(app)
-    bcrypt.init_app(app)
+    password_hasher.init_app(app)
     csrf.init_app(app)
+    realtime.init_app(app)
+    wishlist_alerts.init_app(app, db)
+    jobs.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
     
     # Login manager configuration
     login_manager.login_view = 'login'
@@ -58,25 +125,33 @@ def create_app():
     with app.app_context():
         # Import models and register routes
         from models import (User, Product, Cart, PurchaseHistory, ProductImage, 
-                           Review, Wishlist, Offer, Message, Notification)
+                           Review, Wishlist, Offer, Message, Notification,
+                           Conversation, SavedSearch, Job, RollupWatermark,
+                           ArchivedProduct, ArchivedMessage, ImageHash)
         import routes
+        import commands
+        import tasks
+        import suggest
+        import shopping
         from utils import get_condition_badge_class, get_rating_stars
         
-        # Create database tables
-        db.create_all()
+        def cart_count():
+            """Items in the current user's cart; the navbar badge starts from it"""
+            return shopping.count_items(Cart, current_user.id)
         
         # Add utility functions to template context
         @app.context_processor
         def utility_processor():
             return dict(
                 get_condition_badge_class=get_condition_badge_class,
-                get_rating_stars=get_rating_stars
+                get_rating_stars=get_rating_stars,
+                cart_count=cart_count
             )
         
-        # Register routes
+        # Register routes and CLI commands
         routes.register_routes(app)
+        commands.register_commands(app)
+        tasks.init_app(app)
+        suggest.init_app(app)
     
     return app
-
-# Create the app instance
-app = create_app()
@@ -0,0 +1,92 @@
+"""Compare the HTML search page with the JSON catalog API.
+
+Usage: python benchmarks/bench_catalog.py [--requests 100] [--depth 50]
+
+Runs in-process against the database DATABASE_URL points at (fill it with
+generate_data.py first). Each variant requests the same searches, 12 results
+a page, at the first page and at page --depth:
+  html        - /search, rendered by enhanced_search.html
+  api         - /api/products with the default card fields
+  api-minimal - /api/products?fields=id,title,price
+Deep API pages follow next_cursor; the cursors are collected before timing.
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEARCH_TERMS = ('lamp', 'vintage', 'camera', 'chair', 'book', 'jacket', '')
+SORTS = ('newest', 'price_low', 'popular', 'rating')
+PER_PAGE = 12
+QUERIES_RE = re.compile(r'db;desc="(\d+) queries"')
+VARIANTS = {
+    'html': '/search?{query}&page={page}',
+    'api': '/api/products?{query}&per_page=12{cursor}',
+    'api-minimal': '/api/products?{query}&per_page=12&fields=id,title,price{cursor}',
+}
+
+
+def cursor_for(client, query, depth):
+    """next_cursor that starts page depth of the API results, or None if there are fewer pages"""
+    cursor = ''
+    for _ in range(depth - 1):
+        body = client.get(f'/api/products?{query}&per_page={PER_PAGE}&fields=id{cursor}').get_json()
+        if not body['next_cursor']:
+            return None
+        cursor = '&cursor=' + body['next_cursor']
+    return cursor
+
+
+def measure(client, urls):
+    latencies, sizes, queries = [], [], []
+    for url in urls:
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(response.data))
+        match = QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+        if match:
+            queries.append(int(match.group(1)))
+    latencies.sort()
+    return (statistics.median(latencies), latencies[int(0.95 * (len(latencies) - 1))],
+            statistics.mean(sizes), statistics.mean(queries) if queries else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100, help='Requests per variant and page')
+    parser.add_argument('--depth', type=int, default=50, help='Page number for the deep-page run')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from main import app
+    app.config['METRICS_SERVER_TIMING'] = True
+    client = app.test_client()
+    rng = random.Random(args.seed)
+
+    searches = [f'search={rng.choice(SEARCH_TERMS)}&sort_by={rng.choice(SORTS)}' for _ in range(args.requests)]
+    deep = {}
+    for query in dict.fromkeys(searches):
+        cursor = cursor_for(client, query, args.depth)
+        if cursor is not None:
+            deep[query] = cursor
+
+    print(f"{'variant':<14}{'page':>6}{'p50 ms':>10}{'p95 ms':>10}{'bytes':>10}{'queries':>9}")
+    for page, queries in ((1, searches), (args.depth, [query for query in searches if query in deep])):
+        if not queries:
+            print(f'no search has {args.depth} pages; pass a smaller --depth')
+            continue
+        for name, template in VARIANTS.items():
+            urls = [template.format(query=query, page=page, cursor=deep[query] if page > 1 else '')
+                    for query in queries]
+            p50, p95, size, count = measure(client, urls)
+            print(f'{name:<14}{page:>6}{p50:>10.1f}{p95:>10.1f}{size:>10.0f}{count:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Report peak memory and time per image for the upload resize path.
+
+Usage: python benchmarks/bench_images.py [--images 5] [--size 6000x4000]
+
+Each strategy runs in its own forked process, so peak RSS is per strategy:
+  full    - decode at native resolution, then thumbnail()
+  legacy  - thumbnail() on the lazily opened image (Pillow's own 2x draft)
+  current - utils.optimize_image: header sniffing, draft to the target
+            scale and EXIF orientation applied after the resize
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MAX_SIZE = (800, 800)
+
+
+def make_images(directory, width, height, count):
+    from PIL import Image
+    gradient = Image.radial_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    exif = img.getexif()
+    exif[0x0112] = 6  # phone photo taken in portrait
+    jpeg = os.path.join(directory, 'photo.jpg')
+    img.save(jpeg, quality=90, exif=exif)
+    png = os.path.join(directory, 'screenshot.png')
+    img.resize((width // 2, height // 2)).save(png)
+    return {'jpeg': [jpeg] * count, 'png': [png] * count}
+
+
+def full(path):
+    from PIL import Image
+    with Image.open(path) as img:
+        img.load()
+        img.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
+        img.save(path + '.out', format=img.format, optimize=True, quality=85)
+
+
+def legacy(path):
+    from PIL import Image
+    with Image.open(path) as img:
+        img.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
+        img.save(path + '.out', format=img.format, optimize=True, quality=85)
+
+
+def current(path):
+    import utils
+    shutil.copyfile(path, path + '.out')
+    utils.optimize_image(path + '.out', MAX_SIZE)
+
+
+STRATEGIES = {'full': full, 'legacy': legacy, 'current': current}
+
+
+def measure(func, paths):
+    """Fork, run func over paths and return (peak RSS growth in MB, ms per image)"""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        for path in paths:
+            func(path)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+        os.write(write_end, f'{peak / 1024} {elapsed * 1000 / len(paths)}'.encode())
+        os._exit(0)
+    os.close(write_end)
+    os.waitpid(pid, 0)
+    peak, ms = os.read(read_end, 64).split()
+    os.close(read_end)
+    return float(peak), float(ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=5, help='Images per strategy')
+    parser.add_argument('--size', default='6000x4000', help='WIDTHxHEIGHT of the JPEG; the PNG is half that')
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split('x'))
+
+    import utils  # noqa: F401 - loaded before forking so imports are not measured
+    from PIL import Image  # noqa: F401
+
+    workdir = tempfile.mkdtemp()
+    try:
+        images = make_images(workdir, width, height, args.images)
+        print(f"{'image':<8}{'strategy':<10}{'peak RSS MB':>14}{'ms/image':>10}")
+        for kind, paths in images.items():
+            for name, func in STRATEGIES.items():
+                peak, ms = measure(func, paths)
+                print(f'{kind:<8}{name:<10}{peak:>14.1f}{ms:>10.1f}')
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Report password verifications (logins) per second per core for each hash setting.
+
+Usage: python benchmarks/bench_passwords.py [--seconds 2] [--setting bcrypt:12 ...]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher
+
+DEFAULT_SETTINGS = ['bcrypt:10', 'bcrypt:12', 'pbkdf2:260000', 'pbkdf2:600000',
+                    'scrypt:16384', 'scrypt:32768']
+
+
+def bench(setting, seconds):
+    method, _, cost = setting.partition(':')
+    hasher = PasswordHasher(method=method, cost=cost or None)
+    password_hash = hasher.hash('correct horse battery staple')
+    count = 0
+    start = time.process_time()
+    while time.process_time() - start < seconds:
+        hasher.verify(password_hash, 'correct horse battery staple')
+        count += 1
+    elapsed = time.process_time() - start
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0, help='CPU seconds per setting')
+    parser.add_argument('--setting', action='append', help='method:cost, may be repeated')
+    args = parser.parse_args()
+
+    print(f"{'setting':<16}{'logins/sec/core':>18}{'ms/login':>12}")
+    for setting in args.setting or DEFAULT_SETTINGS:
+        rate = bench(setting, args.seconds)
+        print(f'{setting:<16}{rate:>18.1f}{1000 / rate:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
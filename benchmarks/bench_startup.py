@@ -0,0 +1,99 @@
+"""Measure how long a web worker takes to boot and serve its first request.
+
+Usage: python benchmarks/bench_startup.py [--runs 10] [--forks 4]
+
+Cold boot starts a fresh interpreter per run, imports main (which builds the
+app) and serves one request. Prefork imports the app once, the way gunicorn
+--preload does, then forks workers and times each child's first request. Both
+run against a throwaway SQLite database that is created before timing starts.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('PIL.Image', 'google.genai')
+
+SETUP = '''
+import database
+from app import db
+from main import app
+with app.app_context():
+    database.create_schema(db)
+'''
+
+COLD = '''
+import json, sys, time
+start = time.perf_counter()
+from main import app
+booted = time.perf_counter()
+heavy = [name for name in HEAVY if name in sys.modules]
+app.test_client().get('/')
+served = time.perf_counter()
+print(json.dumps({'boot': booted - start, 'first_request': served - booted, 'heavy': heavy}))
+'''
+
+PREFORK = '''
+import json, os, time
+from main import app
+from app import db
+with app.app_context():
+    pooled = sum(engine.pool.checkedin() + engine.pool.checkedout() for engine in db.engines.values())
+timings = []
+for _ in range(FORKS):
+    read_end, write_end = os.pipe()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        app.test_client().get('/')
+        os.write(write_end, str(time.perf_counter() - start).encode())
+        os._exit(0)
+    os.close(write_end)
+    os.waitpid(pid, 0)
+    timings.append(float(os.read(read_end, 64)))
+    os.close(read_end)
+print(json.dumps({'pooled_before_fork': pooled, 'children': timings}))
+'''
+
+
+def run_python(code, env):
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='Cold boots to time')
+    parser.add_argument('--forks', type=int, default=4, help='Workers forked from the preloaded app')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'startup.db'),
+               LOG_LEVEL='ERROR', PYTHONPATH=ROOT)
+    subprocess.run([sys.executable, '-c', SETUP], cwd=ROOT, env=env, check=True, capture_output=True)
+
+    heavy = f'HEAVY = {HEAVY_MODULES!r}\n'
+    cold = [run_python(heavy + COLD, env) for _ in range(args.runs)]
+    boot = [sample['boot'] * 1000 for sample in cold]
+    first = [sample['first_request'] * 1000 for sample in cold]
+    print(f"{'cold boot':<28}{'median ms':>12}{'max ms':>10}")
+    print(f"{'  import + create_app':<28}{statistics.median(boot):>12.1f}{max(boot):>10.1f}")
+    print(f"{'  first request':<28}{statistics.median(first):>12.1f}{max(first):>10.1f}")
+    print(f"  heavy modules loaded at boot: {', '.join(cold[0]['heavy']) or 'none'}")
+
+    prefork = run_python(f'FORKS = {args.forks}\n' + PREFORK, env)
+    children = [seconds * 1000 for seconds in prefork['children']]
+    print(f"{'prefork (--preload)':<28}{'median ms':>12}{'max ms':>10}")
+    print(f"{'  fork + first request':<28}{statistics.median(children):>12.1f}{max(children):>10.1f}")
+    print(f"  database connections opened before fork: {prefork['pooled_before_fork']}")
+
+
+if __name__ == '__main__':
+    main()
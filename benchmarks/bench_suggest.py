@@ -0,0 +1,86 @@
+"""Time /api/suggest lookups against an index of synthetic titles.
+
+Usage: python benchmarks/bench_suggest.py [--titles 1000000] [--queries 2000]
+
+Builds a suggest.SuggestIndex straight from generated titles, without a
+database. Titles mix generate_data.py's adjectives and nouns with a
+Zipf-distributed vocabulary of made-up words, so the index holds far more
+distinct words than the benchmark database. Each query is a prefix of a
+title word as typed, sometimes with one typo. Reports build time,
+peak memory and per-query latency percentiles.
+"""
+import argparse
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYLLABLES = [consonant + vowel for consonant in 'bdfgklmnprstvz' for vowel in 'aeiou']
+
+
+def vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def typo(rng, word):
+    i = rng.randrange(len(word))
+    return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=1000000)
+    parser.add_argument('--words', type=int, default=150000, help='Distinct made-up words')
+    parser.add_argument('--max-terms', type=int, default=200000, help='SUGGEST_MAX_TERMS')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from generate_data import ADJECTIVES, CATEGORIES, NOUNS, zipf_weights
+    from suggest import SuggestIndex
+
+    rng = random.Random(args.seed)
+    extra = vocabulary(rng, args.words)
+    weights = zipf_weights(len(extra))
+
+    def titles():
+        for product_id in range(1, args.titles + 1):
+            category = rng.choice(CATEGORIES)
+            words = rng.choices(extra, cum_weights=weights, k=rng.randint(1, 3))
+            yield product_id, f'{rng.choice(ADJECTIVES)} {" ".join(words)} {rng.choice(NOUNS[category])}', category
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    index = SuggestIndex.build(titles(), args.max_terms)
+    build_seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print(f'{args.titles} titles, {len(index.terms)} words: built in {build_seconds:.1f} s, '
+          f'peak RSS +{peak / 1024:.0f} MB')
+
+    sample = rng.choices(extra, cum_weights=weights, k=args.queries)
+    kinds = {
+        'prefix': [word[:rng.randint(1, len(word))] for word in sample],
+        'prefix+typo': [typo(rng, word)[:rng.randint(4, len(word))] for word in sample if len(word) > 4],
+        'phrase typo': [f'{typo(rng, word)} {rng.choice(ADJECTIVES).lower()[:3]}' for word in sample],
+    }
+    print(f"{'queries':<14}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, queries in kinds.items():
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.suggest(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        print(f'{name:<14}{statistics.median(latencies):>10.2f}'
+              f'{latencies[int(0.99 * (len(latencies) - 1))]:>10.2f}{latencies[-1]:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measure CPU time per add_product request with an image upload.
+
+Usage: python benchmarks/bench_upload.py [--requests 50] [--size 1600x1200]
+
+Runs against a throwaway SQLite database and removes the images it uploads.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--size', default='1600x1200', help='WIDTHxHEIGHT of the uploaded JPEG')
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split('x'))
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.chdir(ROOT)
+
+    from PIL import Image
+    from app import db, password_hasher
+    from main import app
+    from models import Product, ProductImage, User
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='benchseller', email='bench@example.com',
+                            password_hash=password_hasher.hash('benchpass')))
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'benchpass'})
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (120, 160, 90)).save(buffer, 'JPEG', quality=90)
+    payload = buffer.getvalue()
+
+    def post():
+        data = {'title': 'Bench lamp', 'description': 'A lamp used for benchmarking', 'category': 'Furniture',
+                'condition': 'Good', 'price': '12.50', 'location': 'Testville',
+                'image': (io.BytesIO(payload), 'bench.jpg'),
+                'additional_images': [(io.BytesIO(payload), 'extra.jpg')]}
+        response = client.post('/add_product', data=data, content_type='multipart/form-data')
+        assert response.status_code == 302, response.status_code
+
+    post()  # warm up
+    cpu = []
+    wall = []
+    for _ in range(args.requests):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        post()
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+
+    with app.app_context():
+        urls = [url for (url,) in db.session.query(Product.image_url)]
+        urls += [url for (url,) in db.session.query(ProductImage.image_url)]
+    for url in urls:
+        if url:
+            path = os.path.join(app.root_path, 'static', url)
+            if os.path.exists(path):
+                os.remove(path)
+
+    cpu.sort()
+    wall.sort()
+    print(f'{args.requests} uploads of {width}x{height} JPEG (main + 1 additional image)')
+    print(f'cpu  ms/request: mean {1000 * sum(cpu) / len(cpu):.1f}  p50 {1000 * cpu[len(cpu) // 2]:.1f}')
+    print(f'wall ms/request: mean {1000 * sum(wall) / len(wall):.1f}  p50 {1000 * wall[len(wall) // 2]:.1f}')
+
+
+if __name__ == '__main__':
+    main()
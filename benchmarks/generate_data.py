@@ -0,0 +1,244 @@
+"""Fill the database at DATABASE_URL with a synthetic marketplace.
+
+Usage: python benchmarks/generate_data.py --scale 10k [--seed 42]
+
+Scale is the number of products; every other table is sized from it with
+skewed (Zipf-like) distributions: a few sellers own most listings, a few
+listings get most views, wishlists, offers and messages. Messages are
+grouped into conversations with their summary fields filled in. All users share the
+password in PASSWORD so the benchmark runner can log in as any of them.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+PASSWORD = 'benchpass'
+CHUNK = 5000
+
+CATEGORIES = ['Electronics', 'Clothing', 'Furniture', 'Books', 'Sports', 'Home & Garden', 'Toys', 'Other']
+CATEGORY_WEIGHTS = [20, 25, 10, 15, 8, 10, 7, 5]
+CONDITIONS = ['New', 'Like New', 'Good', 'Fair', 'Poor']
+CONDITION_WEIGHTS = [5, 20, 45, 20, 10]
+ADJECTIVES = ['Vintage', 'Classic', 'Modern', 'Compact', 'Large', 'Wooden', 'Leather', 'Handmade',
+              'Retro', 'Portable', 'Cozy', 'Sturdy', 'Elegant', 'Rustic', 'Minimalist', 'Colorful']
+NOUNS = {
+    'Electronics': ['Camera', 'Headphones', 'Laptop', 'Speaker', 'Phone', 'Monitor', 'Keyboard', 'Radio'],
+    'Clothing': ['Jacket', 'Sweater', 'Dress', 'Jeans', 'Boots', 'Scarf', 'Coat', 'Shirt'],
+    'Furniture': ['Chair', 'Table', 'Lamp', 'Bookshelf', 'Desk', 'Sofa', 'Dresser', 'Stool'],
+    'Books': ['Novel', 'Cookbook', 'Atlas', 'Biography', 'Comic', 'Textbook', 'Poetry', 'Guide'],
+    'Sports': ['Bicycle', 'Racket', 'Skateboard', 'Helmet', 'Tent', 'Skis', 'Kayak', 'Dumbbells'],
+    'Home & Garden': ['Planter', 'Rug', 'Mirror', 'Vase', 'Toolset', 'Curtains', 'Kettle', 'Clock'],
+    'Toys': ['Puzzle', 'Board Game', 'Doll', 'Train Set', 'Blocks', 'Kite', 'Robot', 'Plush'],
+    'Other': ['Record', 'Painting', 'Suitcase', 'Instrument', 'Frame', 'Basket', 'Candle', 'Globe'],
+}
+CITIES = ['Portland, OR', 'Austin, TX', 'Denver, CO', 'Seattle, WA', 'Boston, MA', 'Chicago, IL',
+          'Madison, WI', 'Asheville, NC', 'Burlington, VT', 'Boulder, CO']
+
+
+def zipf_weights(n, s=1.1):
+    return list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def recent_date(rng, now, days=365):
+    # Square of a uniform draw skews timestamps toward the present
+    return now - timedelta(seconds=int((rng.random() ** 2) * days * 86400))
+
+
+def plan(products):
+    return {
+        'users': max(products // 10, 20),
+        'products': products,
+        'product_images': products * 3 // 2,
+        'wishlists': products * 2,
+        'offers': products // 2,
+        'messages': products,
+        'notifications': products * 2,
+        'sold_fraction': 0.3,
+        'review_fraction': 0.5,
+    }
+
+
+def insert_chunks(db, model, rows, label):
+    from sqlalchemy import insert
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK:
+            db.session.execute(insert(model), chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(model), chunk)
+        total += len(chunk)
+    db.session.commit()
+    print(f'  {label:<18}{total:>10}')
+    return total
+
+
+def next_id(db, model):
+    from sqlalchemy import func, select
+    return (db.session.scalar(select(func.max(model.id))) or 0) + 1
+
+
+def generate(scale, seed):
+    import database
+    import ratings
+    import trending
+    from app import db, password_hasher
+    from main import app
+    from models import (User, Product, ProductImage, Review, Wishlist, Offer, Message,
+                        Notification, PurchaseHistory, Conversation)
+
+    rng = random.Random(seed)
+    sizes = plan(SCALES[scale])
+    now = datetime.utcnow()
+
+    with app.app_context():
+        database.create_schema(db)
+        password_hash = password_hasher.hash(PASSWORD)
+        user_base = next_id(db, User)
+        product_base = next_id(db, Product)
+        n_users, n_products = sizes['users'], sizes['products']
+        user_ids = range(user_base, user_base + n_users)
+        product_ids = range(product_base, product_base + n_products)
+        print(f'Generating {scale} marketplace (seed {seed}):')
+
+        insert_chunks(db, User, ({
+            'id': uid, 'username': f'user{uid}', 'email': f'user{uid}@example.com',
+            'password_hash': password_hash, 'first_name': f'First{uid}', 'last_name': f'Last{uid}',
+            'location': rng.choice(CITIES), 'created_at': recent_date(rng, now, 730), 'last_active': now,
+        } for uid in user_ids), 'users')
+
+        # A few power sellers own most listings, a few listings get most attention
+        seller_weights = zipf_weights(n_users)
+        product_weights = zipf_weights(n_products)
+        owners = rng.choices(user_ids, cum_weights=seller_weights, k=n_products)
+        popularity = list(product_ids)
+        rng.shuffle(popularity)
+        sold = set(rng.sample(product_ids, int(n_products * sizes['sold_fraction'])))
+
+        def products():
+            for pid, owner in zip(product_ids, owners):
+                category = rng.choices(CATEGORIES, weights=CATEGORY_WEIGHTS)[0]
+                title = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS[category])}'
+                row = {
+                    'id': pid, 'title': title, 'description': f'{title} in great shape, pickup or shipping.',
+                    'category': category, 'price': round(rng.lognormvariate(3, 1), 2),
+                    'condition': rng.choices(CONDITIONS, weights=CONDITION_WEIGHTS)[0],
+                    'location': rng.choice(CITIES), 'views': int(rng.paretovariate(1.2) * 5),
+                    'created_at': recent_date(rng, now), 'is_sold': pid in sold,
+                    'is_featured': rng.random() < 0.05, 'owner_id': owner,
+                }
+                # Score the listing from its generated date rather than as listed just now
+                row['trending_score'] = trending.event_score('listed', row['created_at'])
+                yield row
+        insert_chunks(db, Product, products(), 'products')
+
+        insert_chunks(db, ProductImage, ({
+            'product_id': rng.choice(product_ids), 'image_url': f'uploads/synthetic-{i}.jpg', 'order_index': 1,
+        } for i in range(sizes['product_images'])), 'product_images')
+
+        def popular_products(k):
+            return rng.choices(popularity, cum_weights=product_weights, k=k)
+
+        def other_user(owner):
+            uid = rng.choice(user_ids)
+            return uid if uid != owner else user_ids[(uid - user_base + 1) % n_users]
+
+        owner_of = dict(zip(product_ids, owners))
+        buyers = {pid: other_user(owner_of[pid]) for pid in sorted(sold)}
+        insert_chunks(db, PurchaseHistory, ({
+            'user_id': buyer, 'product_id': pid, 'price_paid': round(rng.lognormvariate(3, 1), 2),
+            'purchase_date': recent_date(rng, now, 180),
+        } for pid, buyer in buyers.items()), 'purchase_history')
+
+        insert_chunks(db, Review, ({
+            'product_id': pid, 'user_id': buyer,
+            'rating': rng.choices([1, 2, 3, 4, 5], weights=[3, 4, 10, 33, 50])[0],
+            'comment': 'Exactly as described.', 'created_at': recent_date(rng, now, 180),
+        } for pid, buyer in buyers.items() if rng.random() < sizes['review_fraction']), 'reviews')
+        ratings.rebuild(batch_size=CHUNK)
+
+        seen = set()
+        def wishlists():
+            for pid in popular_products(sizes['wishlists']):
+                uid = other_user(owner_of[pid])
+                if (uid, pid) not in seen:
+                    seen.add((uid, pid))
+                    yield {'user_id': uid, 'product_id': pid, 'added_at': recent_date(rng, now, 90)}
+        insert_chunks(db, Wishlist, wishlists(), 'wishlists')
+        seen.clear()
+
+        insert_chunks(db, Offer, ({
+            'product_id': pid, 'user_id': other_user(owner_of[pid]), 'amount': round(rng.uniform(1, 200), 2),
+            'status': rng.choices(['pending', 'accepted', 'rejected', 'withdrawn'], weights=[60, 10, 25, 5])[0],
+            'created_at': recent_date(rng, now, 60), 'expires_at': now + timedelta(days=rng.randint(-30, 14)),
+        } for pid in popular_products(sizes['offers'])), 'offers')
+
+        # Messages are grouped into conversations with their summary fields precomputed
+        conversation_base = next_id(db, Conversation)
+        conversations = {}
+        messages = []
+        for pid in popular_products(sizes['messages']):
+            sender, recipient = other_user(owner_of[pid]), owner_of[pid]
+            low, high = min(sender, recipient), max(sender, recipient)
+            conversation = conversations.get((low, high, pid))
+            if conversation is None:
+                conversation = conversations[(low, high, pid)] = {
+                    'id': conversation_base + len(conversations), 'user_low_id': low, 'user_high_id': high,
+                    'product_id': pid, 'topic_key': pid, 'unread_low': 0, 'unread_high': 0,
+                    'last_message_at': datetime.min, 'last_message_preview': '', 'last_sender_id': None,
+                    'created_at': now,
+                }
+            message = {'conversation_id': conversation['id'], 'sender_id': sender, 'recipient_id': recipient,
+                       'product_id': pid, 'subject': 'Is this still available?',
+                       'content': 'Hi! Is this still available?', 'is_read': rng.random() < 0.7,
+                       'created_at': recent_date(rng, now, 120)}
+            messages.append(message)
+            if message['created_at'] > conversation['last_message_at']:
+                conversation.update(last_message_at=message['created_at'], last_sender_id=sender,
+                                    last_message_preview=message['content'])
+            if not message['is_read']:
+                conversation['unread_low' if recipient == low else 'unread_high'] += 1
+        insert_chunks(db, Conversation, iter(conversations.values()), 'conversations')
+        messages.sort(key=lambda m: m['created_at'])
+        insert_chunks(db, Message, iter(messages), 'messages')
+        del conversations, messages
+
+        notification_owners = rng.choices(user_ids, cum_weights=seller_weights, k=sizes['notifications'])
+        insert_chunks(db, Notification, ({
+            'user_id': uid, 'title': 'New Message', 'message': 'Someone sent you a message',
+            'type': 'info', 'is_read': rng.random() < 0.8, 'link': '/messages',
+            'created_at': recent_date(rng, now, 120),
+        } for uid in notification_owners), 'notifications')
+
+        print(f'  {"trending":<18}{trending.rollup(now):>10}')
+
+        if db.engine.dialect.name == 'postgresql':
+            # Explicit ids leave the serial sequences behind
+            for table in ('user', 'product', 'conversation'):
+                db.session.execute(db.text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT MAX(id) FROM \"{table}\"))"))
+            db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    generate(args.scale, args.seed)
+    print(f'Done in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
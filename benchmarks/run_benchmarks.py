@@ -0,0 +1,202 @@
+"""Drive the key pages and report latency percentiles and queries per request.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--requests 100] [--save NAME] [--compare NAME]
+    python benchmarks/run_benchmarks.py --url http://127.0.0.1:5000 ...
+
+Without --url the Flask test client is used in-process. With --url the
+server should run with METRICS_SERVER_TIMING=1 so queries per request can
+be read from its Server-Timing header. Either way DATABASE_URL must point
+at the database filled by generate_data.py, which is used to pick the
+accounts and products to request. Baselines are stored as JSON in
+benchmarks/baselines/ and compared endpoint by endpoint.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(ROOT))
+
+BASELINE_DIR = os.path.join(ROOT, 'baselines')
+ENDPOINTS = ('index', 'enhanced_search', 'product_detail', 'cart', 'checkout', 'analytics', 'messages')
+SEARCH_TERMS = ('lamp', 'vintage', 'camera', 'chair', 'book', 'jacket')
+QUERIES_RE = re.compile(r'db;desc="(\d+) queries"')
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['METRICS_SERVER_TIMING'] = True
+        self.client = app.test_client()
+
+    def login(self, email, password):
+        self.client.post('/login', data={'email': email, 'password': password})
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class HttpDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def login(self, email, password):
+        page = self.opener.open(self.base_url + '/login').read().decode()
+        token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page)
+        data = {'email': email, 'password': password, 'csrf_token': token.group(1) if token else ''}
+        self.opener.open(self.base_url + '/login', urllib.parse.urlencode(data).encode())
+
+    def get(self, path):
+        try:
+            response = self.opener.open(self.base_url + path)
+            response.read()
+            return response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Server-Timing', '')
+
+
+def pick_fixtures(rng):
+    """Choose the seller, buyer and products to request from the generated data"""
+    from sqlalchemy import func, select
+    from app import db
+    from main import app
+    from models import Message, Product, User
+
+    with app.app_context():
+        seller_id = db.session.scalar(
+            select(Product.owner_id).group_by(Product.owner_id).order_by(func.count().desc()).limit(1))
+        buyer_id = db.session.scalar(
+            select(Message.recipient_id).group_by(Message.recipient_id).order_by(func.count().desc()).limit(1))
+        seller = db.session.get(User, seller_id)
+        buyer = db.session.get(User, buyer_id)
+        unsold = db.session.scalars(
+            select(Product.id).where(Product.is_sold == False, Product.owner_id != buyer_id)  # noqa: E712
+            .order_by(func.random()).limit(2000)).all()
+        products = db.session.scalars(select(Product.id).order_by(func.random()).limit(2000)).all()
+    if not unsold or seller is None or buyer is None:
+        raise SystemExit('No data found; run benchmarks/generate_data.py first')
+    return seller.email, buyer.email, products, unsold
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(driver, requests, rng):
+    from generate_data import PASSWORD
+
+    seller_email, buyer_email, products, unsold = pick_fixtures(rng)
+    unsold = iter(unsold)
+
+    def as_buyer():
+        driver.login(buyer_email, PASSWORD)
+
+    def as_seller():
+        driver.login(seller_email, PASSWORD)
+
+    def add_to_cart():
+        driver.get(f'/add_to_cart/{next(unsold)}')
+
+    # endpoint -> (login, path factory, untimed setup before each request)
+    plans = {
+        'index': (as_buyer, lambda: f'/?page={rng.randint(1, 5)}', None),
+        'enhanced_search': (as_buyer, lambda: '/search?search={}&sort_by={}'.format(
+            rng.choice(SEARCH_TERMS), rng.choice(['newest', 'price_low', 'popular', 'rating'])), None),
+        'product_detail': (as_buyer, lambda: f'/product/{rng.choice(products)}', None),
+        'cart': (as_buyer, lambda: '/cart', None),
+        'checkout': (as_buyer, lambda: '/checkout', add_to_cart),
+        'analytics': (as_seller, lambda: '/analytics', None),
+        'messages': (as_buyer, lambda: '/messages', None),
+    }
+
+    results = {}
+    for endpoint in ENDPOINTS:
+        login, path, setup = plans[endpoint]
+        login()
+        for _ in range(3):
+            add_to_cart()  # give the cart page something to show
+        latencies, queries, errors = [], [], 0
+        for _ in range(requests):
+            if setup:
+                setup()
+            url = path()
+            start = time.perf_counter()
+            status, timing = driver.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors += 1
+            match = QUERIES_RE.search(timing)
+            if match:
+                queries.append(int(match.group(1)))
+        results[endpoint] = {
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries_per_request': round(sum(queries) / len(queries), 1) if queries else None,
+            'errors': errors,
+        }
+    return results
+
+
+def print_results(results, baseline=None):
+    print(f"{'endpoint':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}{'errors':>8}")
+    for endpoint, row in results.items():
+        line = (f"{endpoint:<18}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+                f"{row['queries_per_request'] if row['queries_per_request'] is not None else '-':>10}"
+                f"{row['errors']:>8}")
+        old = (baseline or {}).get(endpoint)
+        if old:
+            delta = (row['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+            line += f"   p95 {delta:+.0f}%"
+            if old.get('queries_per_request') != row['queries_per_request']:
+                line += f"   queries {old.get('queries_per_request')} -> {row['queries_per_request']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100, help='Requests per endpoint')
+    parser.add_argument('--url', help='Benchmark a running server instead of the test client')
+    parser.add_argument('--save', metavar='NAME', help='Store results as benchmarks/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='Show changes against a stored baseline')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.url:
+        driver = HttpDriver(args.url)
+    else:
+        from main import app
+        driver = TestClientDriver(app)
+
+    results = run(driver, args.requests, rng)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'{args.compare}.json')) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'{args.save}.json')
+        with open(path, 'w') as f:
+            json.dump({'requests': args.requests, 'url': args.url, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Saved baseline to {path}')
+
+
+if __name__ == '__main__':
+    main()
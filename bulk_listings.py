@@ -0,0 +1,311 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from werkzeug.datastructures import FileStorage, MultiDict
+
+from app import db
+from forms import ProductForm
+from models import Product, ProductImage, PurchaseHistory
+import jobs
+import ratings
+import retention
+from utils import allowed_file, save_image
+
+# Columns read from an import row; image columns are handled separately
+IMPORT_FIELDS = ('title', 'description', 'category', 'condition', 'price', 'location', 'is_featured')
+EXPORT_FIELDS = ('id', 'title', 'description', 'category', 'condition', 'price', 'location',
+                 'is_featured', 'is_sold', 'views', 'created_at', 'image', 'images')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+MAX_EXTRA_IMAGES = 5
+MAX_IMAGE_BYTES = 16 * 1024 * 1024
+
+
+def detect_format(filename, default='csv'):
+    """Return 'csv' or 'jsonl' based on a file name"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if ext == '.csv':
+        return 'csv'
+    return default
+
+
+def spool_upload(file_storage):
+    """Copy an uploaded file into a spooled temp file that outlives the request"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    shutil.copyfileobj(file_storage.stream, spooled)
+    spooled.seek(0)
+    return spooled
+
+
+def iter_rows(stream, fmt):
+    """Yield (row_number, dict) from a binary CSV or JSONL stream without loading it"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, row
+        return
+    for number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {'__error__': f'Invalid JSON: {e}'}
+        if not isinstance(row, dict):
+            row = {'__error__': 'Each line must be a JSON object'}
+        yield number, row
+
+
+def _image_names(row):
+    main = (row.get('image') or '').strip()
+    extra = row.get('images') or []
+    if isinstance(extra, str):
+        extra = [name.strip() for name in extra.split('|')]
+    return main, [name for name in extra if name][:MAX_EXTRA_IMAGES]
+
+
+class ImageSource:
+    """Resolve image names in an import file to bytes from a zip archive or a local directory"""
+
+    def __init__(self, archive=None, root=None):
+        self.archive = zipfile.ZipFile(archive) if archive is not None else None
+        self.root = os.path.realpath(root) if root else None
+        self._lock = threading.Lock()
+
+    def read(self, name):
+        if self.archive is not None:
+            with self._lock:
+                info = self.archive.getinfo(name)
+                if info.file_size > MAX_IMAGE_BYTES:
+                    raise ValueError('image is too large')
+                return self.archive.read(info)
+        if self.root:
+            path = os.path.realpath(os.path.join(self.root, name))
+            # Never read outside the configured image directory
+            if os.path.commonpath([self.root, path]) != self.root:
+                raise ValueError('image path is outside the import directory')
+            if os.path.getsize(path) > MAX_IMAGE_BYTES:
+                raise ValueError('image is too large')
+            with open(path, 'rb') as f:
+                return f.read()
+        raise ValueError('no image archive or directory was provided')
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+
+def _process_image(app, source, name):
+    if not allowed_file(name):
+        return '', f'{name}: file type not allowed'
+    try:
+        data = source.read(name)
+    except (KeyError, OSError, ValueError) as e:
+        return '', f'{name}: {e}'
+    with app.app_context():
+        image_url = save_image(FileStorage(io.BytesIO(data), filename=os.path.basename(name)))
+        # The image hash save_image recorded; this thread has its own session
+        db.session.commit()
+    return image_url, None if image_url else f'{name}: could not be processed'
+
+
+def validate_row(row):
+    """Validate one import row with the ProductForm rules, returning (values, errors)"""
+    if '__error__' in row:
+        return None, {'row': [row['__error__']]}
+    formdata = MultiDict()
+    for field in IMPORT_FIELDS:
+        value = row.get(field)
+        if value is None or value == '':
+            continue
+        if field == 'is_featured':
+            if str(value).strip().lower() in TRUE_VALUES:
+                formdata[field] = 'y'
+            continue
+        formdata[field] = str(value)
+    form = ProductForm(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    return {
+        'title': form.title.data,
+        'description': form.description.data,
+        'category': form.category.data,
+        'condition': form.condition.data,
+        'price': form.price.data,
+        'location': form.location.data or '',
+        'is_featured': bool(form.is_featured.data),
+    }, None
+
+
+def import_listings(owner_id, stream, fmt='csv', images=None, batch_size=500, workers=4):
+    """Import listings for owner_id, yielding one result dict per row and a final summary.
+
+    Rows are validated as they are read, their images are processed on a
+    thread pool while later rows are parsed, and products are inserted one
+    batch at a time.
+    """
+    app = current_app._get_current_object()
+    summary = {'rows': 0, 'imported': 0, 'failed': 0, 'image_errors': 0}
+    batch = []
+
+    def flush():
+        results = []
+        product_rows = []
+        for number, values, main_future, extra_futures in batch:
+            warnings = []
+            if main_future is not None:
+                values['image_url'], error = main_future.result()
+                if error:
+                    warnings.append(error)
+            extra_urls = []
+            for future in extra_futures:
+                url, error = future.result()
+                if url:
+                    extra_urls.append(url)
+                elif error:
+                    warnings.append(error)
+            values['owner_id'] = owner_id
+            product_rows.append(values)
+            results.append((number, extra_urls, warnings))
+
+        product_ids = db.session.scalars(
+            insert(Product).returning(Product.id, sort_by_parameter_order=True),
+            product_rows).all()
+        image_rows = [
+            {'product_id': product_id, 'image_url': url, 'order_index': index}
+            for product_id, (_, extra_urls, _) in zip(product_ids, results)
+            for index, url in enumerate(extra_urls, start=1)
+        ]
+        if image_rows:
+            db.session.execute(insert(ProductImage), image_rows)
+        jobs.enqueue('searches.match', product_ids)
+        db.session.commit()
+        batch.clear()
+
+        for product_id, (number, _, warnings) in zip(product_ids, results):
+            summary['imported'] += 1
+            summary['image_errors'] += len(warnings)
+            result = {'row': number, 'status': 'ok', 'product_id': product_id}
+            if warnings:
+                result['warnings'] = warnings
+            yield result
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for number, row in iter_rows(stream, fmt):
+            summary['rows'] += 1
+            values, errors = validate_row(row)
+            if errors:
+                summary['failed'] += 1
+                yield {'row': number, 'status': 'error', 'errors': errors}
+                continue
+
+            main_name, extra_names = _image_names(row)
+            if (main_name or extra_names) and images is None:
+                summary['failed'] += 1
+                yield {'row': number, 'status': 'error',
+                       'errors': {'image': ['Row references images but no image source was given']}}
+                continue
+            main_future = pool.submit(_process_image, app, images, main_name) if main_name else None
+            extra_futures = [pool.submit(_process_image, app, images, name) for name in extra_names]
+            batch.append((number, values, main_future, extra_futures))
+
+            if len(batch) >= batch_size:
+                yield from flush()
+        if batch:
+            yield from flush()
+
+    yield {'summary': summary}
+
+
+def export_listings(owner_id, fmt='csv', chunk_size=1000):
+    """Yield a seller's listings as CSV or JSONL text, one keyset-paginated chunk at a time"""
+    columns = (Product.id, Product.title, Product.description, Product.category, Product.condition,
+               Product.price, Product.location, Product.is_featured, Product.is_sold, Product.views,
+               Product.created_at, Product.image_url)
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        yield buffer.getvalue()
+
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(*columns)
+            .where(Product.owner_id == owner_id, Product.id > last_id)
+            .order_by(Product.id)
+            .limit(chunk_size)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        extra = {}
+        for product_id, image_url in db.session.execute(
+                select(ProductImage.product_id, ProductImage.image_url)
+                .where(ProductImage.product_id.in_([row.id for row in rows]))
+                .order_by(ProductImage.product_id, ProductImage.order_index)):
+            extra.setdefault(product_id, []).append(image_url)
+
+        if fmt == 'csv':
+            buffer.seek(0)
+            buffer.truncate()
+            for row in rows:
+                writer.writerow(list(row[:-1]) + [row.image_url or '', '|'.join(extra.get(row.id, []))])
+            yield buffer.getvalue()
+        else:
+            lines = []
+            for row in rows:
+                record = dict(zip(EXPORT_FIELDS, row))
+                record['created_at'] = row.created_at.isoformat() if row.created_at else None
+                record['image'] = row.image_url or ''
+                record['images'] = extra.get(row.id, [])
+                lines.append(json.dumps(record))
+            yield '\n'.join(lines) + '\n'
+
+
+def delete_listings(owner_id, product_ids, batch_size=500):
+    """Delete owner_id's listings among product_ids; returns the number deleted.
+
+    One DELETE per batch: the database removes cart, wishlist, offer, review
+    and image rows (ON DELETE CASCADE) without loading them. Listings someone
+    bought are archived instead, so purchase history keeps them. Image files
+    are removed afterwards by an uploads.delete job.
+    """
+    product_ids = sorted(set(product_ids))
+    deleted = 0
+    for start in range(0, len(product_ids), batch_size):
+        ids = db.session.scalars(
+            select(Product.id).where(Product.id.in_(product_ids[start:start + batch_size]),
+                                     Product.owner_id == owner_id)).all()
+        if not ids:
+            continue
+        purchased = set(db.session.scalars(
+            select(PurchaseHistory.product_id).where(PurchaseHistory.product_id.in_(ids)).distinct()))
+        removed = [product_id for product_id in ids if product_id not in purchased]
+        ratings.remove_products(ids)
+        if purchased:
+            retention.archive(sorted(purchased))
+        if removed:
+            paths = set(db.session.scalars(
+                select(Product.image_url).where(Product.id.in_(removed), Product.image_url != '')))
+            paths.update(db.session.scalars(
+                select(ProductImage.image_url).where(ProductImage.product_id.in_(removed))))
+            db.session.execute(delete(Product).where(Product.id.in_(removed)))
+            paths.discard(None)
+            if paths:
+                jobs.enqueue('uploads.delete', sorted(paths))
+        db.session.commit()
+        deleted += len(ids)
+    return deleted
@@ -0,0 +1,170 @@
+"""Catalog search filters and sorts, shared by the search page and /api/products.
+
+The API selects only the columns a client asks for (?fields=id,title,price),
+so rows come back as plain tuples and no Product objects are built. Pages
+are keyset cursors on (sort key, id), so page 50 costs the same as page 1
+and new listings do not shift the page boundaries. Responses are encoded
+with orjson when it is installed, otherwise with the standard json module.
+"""
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, select
+
+from app import db
+from models import Product, User
+
+try:
+    import orjson
+except ImportError:  # optional; json is used instead
+    orjson = None
+
+# sort_by value -> (column, descending); id breaks ties in the same direction
+SORTS = {
+    'newest': (Product.created_at, True),
+    'oldest': (Product.created_at, False),
+    'price_low': (Product.price, False),
+    'price_high': (Product.price, True),
+    'popular': (Product.trending_score, True),
+    'rating': (Product.rating_score, True),
+}
+
+FIELDS = {
+    'id': Product.id,
+    'title': Product.title,
+    'description': Product.description,
+    'price': Product.price,
+    'category': Product.category,
+    'condition': Product.condition,
+    'location': Product.location,
+    'image_url': Product.image_url,
+    'is_sold': Product.is_sold,
+    'created_at': Product.created_at,
+    'rating_score': Product.rating_score,
+    'rating_count': Product.rating_count,
+    'seller': User.username,
+}
+# What a product card shows
+DEFAULT_FIELDS = ('id', 'title', 'price', 'category', 'condition', 'location', 'image_url', 'seller')
+MAX_PER_PAGE = 100
+
+
+def search_args(args):
+    """Filters and sort from request args, with the types search_filters() expects"""
+    return {
+        'search': args.get('search', '', type=str),
+        'category': args.get('category', '', type=str),
+        'condition': args.get('condition', '', type=str),
+        'min_price': args.get('min_price', type=float),
+        'max_price': args.get('max_price', type=float),
+        'location': args.get('location', '', type=str),
+        'sort_by': args.get('sort_by', 'newest', type=str),
+    }
+
+
+def search_filters(values):
+    """WHERE conditions for unsold products matching the search values"""
+    conditions = [Product.is_sold == False]  # noqa: E712
+    if values['search']:
+        conditions.append(Product.title.contains(values['search']) | Product.description.contains(values['search']))
+    if values['category']:
+        conditions.append(Product.category == values['category'])
+    if values['condition']:
+        conditions.append(Product.condition == values['condition'])
+    if values['min_price'] is not None:
+        conditions.append(Product.price >= values['min_price'])
+    if values['max_price'] is not None:
+        conditions.append(Product.price <= values['max_price'])
+    if values['location']:
+        conditions.append(Product.location.contains(values['location']))
+    return conditions
+
+
+def sort_order(sort_by):
+    """ORDER BY clauses for sort_by; unknown values sort newest first"""
+    column, descending = SORTS.get(sort_by, SORTS['newest'])
+    if descending:
+        return [column.desc(), Product.id.desc()]
+    return [column.asc(), Product.id.asc()]
+
+
+def parse_fields(fields):
+    """Field names from a comma separated list; raises ValueError for unknown ones"""
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+    if not names:
+        return DEFAULT_FIELDS
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}; choose from {', '.join(FIELDS)}")
+    return names
+
+
+def encode_cursor(value, product_id):
+    value = value.isoformat() if isinstance(value, datetime) else repr(value)
+    return f'{value}_{product_id}'
+
+
+def decode_cursor(cursor, column):
+    """Parse a 'value_id' cursor for column, returning None for anything malformed"""
+    try:
+        value, product_id = cursor.rsplit('_', 1)
+        if column.type.python_type is datetime:
+            return datetime.fromisoformat(value), int(product_id)
+        return column.type.python_type(value), int(product_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _projection(fields):
+    stmt = select(*(FIELDS[name].label(name) for name in fields)).select_from(Product)
+    if 'seller' in fields:
+        stmt = stmt.join(User, User.id == Product.owner_id)
+    return stmt
+
+
+def _row_dict(row, fields, static_url):
+    item = dict(zip(fields, row))
+    if item.get('image_url'):
+        item['image_url'] = static_url + item['image_url']
+    elif 'image_url' in item:
+        item['image_url'] = None
+    return item
+
+
+def search(values, fields, cursor=None, per_page=24, static_url='/static/'):
+    """Return (items, next_cursor) for one page of search results"""
+    column, descending = SORTS.get(values['sort_by'], SORTS['newest'])
+    stmt = (_projection(fields).add_columns(column.label('_sort_key'), Product.id.label('_sort_id'))
+            .where(*search_filters(values)).order_by(*sort_order(values['sort_by'])))
+    position = decode_cursor(cursor, column) if cursor else None
+    if position:
+        value, product_id = position
+        if descending:
+            stmt = stmt.where(or_(column < value, and_(column == value, Product.id < product_id)))
+        else:
+            stmt = stmt.where(or_(column > value, and_(column == value, Product.id > product_id)))
+    rows = db.session.execute(stmt.limit(per_page + 1)).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1]._sort_key, rows[-1]._sort_id)
+    return [_row_dict(row[:len(fields)], fields, static_url) for row in rows], next_cursor
+
+
+def get_product(product_id, fields, static_url='/static/'):
+    """One product's fields as a dict, or None"""
+    row = db.session.execute(_projection(fields).where(Product.id == product_id)).first()
+    return _row_dict(row, fields, static_url) if row else None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(payload):
+    """Encode payload as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'), default=_default).encode()
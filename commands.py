@@ -0,0 +1,232 @@
+import click
+
+
+def register_commands(app):
+    """Register the flask CLI command groups"""
+
+    @app.cli.group('db')
+    def db_group():
+        """Database schema."""
+
+    @db_group.command('create')
+    def create_schema_command():
+        """Create missing tables, columns and indexes."""
+        import database
+        from app import db
+
+        database.create_schema(db)
+        click.echo('Schema is up to date')
+
+    @app.cli.group()
+    def listings():
+        """Bulk import and export of product listings."""
+
+    @listings.command('import')
+    @click.argument('username')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--images', 'images_path', type=click.Path(exists=True),
+                  help='ZIP archive or directory holding the images named in the file.')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+    @click.option('--batch-size', default=500, show_default=True)
+    @click.option('--workers', default=4, show_default=True, help='Threads used for image processing.')
+    def import_command(username, path, images_path, fmt, batch_size, workers):
+        """Import listings for USERNAME from a CSV or JSONL file at PATH."""
+        import os
+        from bulk_listings import ImageSource, detect_format, import_listings
+        from models import User
+
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'No user named {username}')
+
+        images = None
+        if images_path:
+            if os.path.isdir(images_path):
+                images = ImageSource(root=images_path)
+            else:
+                images = ImageSource(archive=images_path)
+
+        try:
+            with open(path, 'rb') as stream:
+                for result in import_listings(user.id, stream, fmt or detect_format(path),
+                                              images=images, batch_size=batch_size, workers=workers):
+                    if 'summary' in result:
+                        summary = result['summary']
+                        click.echo(f"Imported {summary['imported']} of {summary['rows']} rows, "
+                                   f"{summary['failed']} failed, {summary['image_errors']} image errors")
+                    elif result['status'] == 'error':
+                        click.echo(f"row {result['row']}: {result['errors']}", err=True)
+                    elif result.get('warnings'):
+                        click.echo(f"row {result['row']}: {'; '.join(result['warnings'])}", err=True)
+                    elif result['row'] % 1000 == 0:
+                        click.echo(f"... {result['row']} rows")
+        finally:
+            if images:
+                images.close()
+
+    @listings.command('delete')
+    @click.argument('username')
+    @click.option('--sold', is_flag=True, help='Only delete sold listings.')
+    @click.option('--batch-size', default=500, show_default=True)
+    def delete_command(username, sold, batch_size):
+        """Delete all of USERNAME's listings."""
+        from app import db
+        from bulk_listings import delete_listings
+        from models import Product, User
+
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'No user named {username}')
+        query = db.session.query(Product.id).filter(Product.owner_id == user.id)
+        if sold:
+            query = query.filter(Product.is_sold == True)  # noqa: E712
+        product_ids = [product_id for product_id, in query]
+        click.echo(f'Deleted {delete_listings(user.id, product_ids, batch_size)} listings')
+
+    @app.cli.group()
+    def messages():
+        """Messaging maintenance."""
+
+    @messages.command('backfill-conversations')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def backfill_conversations_command(batch_size):
+        """Group messages sent before conversations existed into threads."""
+        from messaging import backfill_conversations
+        click.echo(f'Linked {backfill_conversations(batch_size)} messages to conversations')
+
+    @app.cli.group()
+    def ratings():
+        """Product rating scores."""
+
+    @ratings.command('rebuild')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def rebuild_ratings_command(batch_size):
+        """Recompute every product's rating totals and Best Rated score from its reviews."""
+        from ratings import rebuild
+        click.echo(f'Rebuilt ratings for {rebuild(batch_size)} products')
+
+    @app.cli.group()
+    def offers():
+        """Offer expiry."""
+
+    @offers.command('expire')
+    @click.option('--batch-size', default=500, show_default=True)
+    def expire_command(batch_size):
+        """Expire pending offers past their expiry time (the job worker also does this)."""
+        from offers import expire_offers
+        # Notification links are built with url_for
+        with app.test_request_context():
+            click.echo(f'Expired {expire_offers(batch_size=batch_size)} offers')
+
+    @app.cli.group()
+    def retention():
+        """Archiving and pruning of old rows."""
+
+    @retention.command('run')
+    @click.option('--batch-size', type=int, help='Rows per transaction (defaults to RETENTION_BATCH_SIZE).')
+    def retention_run_command(batch_size):
+        """Archive old sold listings and messages and delete old read notifications."""
+        from retention import run
+        config = dict(app.config)
+        if batch_size:
+            config['RETENTION_BATCH_SIZE'] = batch_size
+        counts = run(config)
+        click.echo(f"Archived {counts['products']} products and {counts['messages']} messages, "
+                   f"deleted {counts['notifications']} notifications")
+
+    @retention.command('status')
+    def retention_status_command():
+        """Show row counts of the hot tables and their archives."""
+        from retention import table_sizes
+        for name, count in table_sizes().items():
+            click.echo(f'{name:<20}{count:>10}')
+
+    @app.cli.group()
+    def jobs():
+        """Background job queue."""
+
+    @jobs.command('worker')
+    @click.option('--lane', 'lanes', multiple=True, type=click.Choice(['high', 'default', 'low']),
+                  help='Only run jobs from this lane (repeatable). Defaults to all lanes.')
+    @click.option('--processes', default=0, show_default=True,
+                  help='Process pool size for CPU-bound jobs (0 = run them in this process).')
+    @click.option('--batch-size', default=10, show_default=True, help='Jobs claimed per poll.')
+    @click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when idle.')
+    @click.option('--burst', is_flag=True, help='Exit once no jobs are due.')
+    def worker_command(lanes, processes, batch_size, poll_interval, burst):
+        """Run queued jobs until stopped."""
+        from jobs import Worker
+        Worker(app, lanes=lanes or None, processes=processes, batch_size=batch_size,
+               poll_interval=poll_interval).run(burst=burst)
+
+    @jobs.command('status')
+    def status_command():
+        """Show job counts by status and lane."""
+        from jobs import stats
+        counts = stats()
+        if not counts:
+            click.echo('No jobs')
+        for (status, lane), count in sorted(counts.items()):
+            click.echo(f'{status:<10}{lane:<10}{count:>8}')
+
+    @jobs.command('prune')
+    @click.option('--days', default=7, show_default=True, help='Keep finished jobs this many days.')
+    def prune_command(days):
+        """Delete finished and failed jobs older than --days."""
+        from jobs import prune
+        click.echo(f'Removed {prune(days)} jobs')
+
+    @app.cli.group()
+    def images():
+        """Uploaded images."""
+
+    @images.command('backfill-hashes')
+    @click.option('--batch-size', default=500, show_default=True)
+    @click.option('--queue', is_flag=True, help='Enqueue an images.backfill_hashes job instead of running here.')
+    def backfill_hashes_command(batch_size, queue):
+        """Record duplicate-detection hashes for uploads saved before they existed."""
+        import os
+        from app import db
+        from jobs import enqueue
+        if queue:
+            enqueue('images.backfill_hashes')
+            db.session.commit()
+            click.echo('Enqueued images.backfill_hashes')
+            return
+        from duplicates import backfill
+        hashed = backfill(os.path.join(app.root_path, 'static', 'uploads'), batch_size,
+                          app.config['IMAGE_MAX_DECODE_MB'] * 1024 * 1024)
+        click.echo(f'Hashed {hashed} images')
+
+    @app.cli.group()
+    def assets():
+        """Static asset pipeline."""
+
+    @assets.command('build')
+    def build_command():
+        """Minify, fingerprint and precompress static assets into static/dist."""
+        from assets import brotli, build
+        for name, (built, original, minified, gzipped, brotli_size) in build(app.static_folder).items():
+            click.echo(f'{name} -> {built}: {original} bytes, {minified} minified, {gzipped} gzip'
+                       + (f', {brotli_size} brotli' if brotli_size is not None else ''))
+        if brotli is None:
+            click.echo('brotli is not installed; only gzip variants were written', err=True)
+        click.echo('Restart the app to serve the new build')
+
+    @listings.command('export')
+    @click.argument('username')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+    def export_command(username, path, fmt):
+        """Export all listings of USERNAME to PATH."""
+        from bulk_listings import detect_format, export_listings
+        from models import User
+
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'No user named {username}')
+
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for chunk in export_listings(user.id, fmt or detect_format(path)):
+                f.write(chunk)
+        click.echo(f'Exported listings of {username} to {path}')
@@ -0,0 +1,119 @@
+"""Response compression and cache validators for dynamic responses.
+
+Every HTML, JSON and text response of at least COMPRESS_MIN_SIZE bytes is
+compressed with the best encoding the client accepts. That is brotli when the
+optional ``brotli`` package is installed, otherwise gzip. Streamed responses
+(listing import and export) are compressed chunk by chunk and flushed after
+each one, so progress still reaches the client as it is produced. The
+/events stream is never touched.
+
+Complete 200 JSON, CSS and JavaScript responses to GET, such as
+/api/quick_help and /api/products, also get a weak ETag computed from the
+uncompressed body. A matching If-None-Match turns them into a 304 with no body.
+The ETag is weak so one tag covers every encoding of the same content. HTML
+pages get none: their CSRF token differs per session, so the tag would never
+match and only cost a hash of every page.
+"""
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used instead
+    brotli = None
+
+COMPRESSIBLE = {'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript',
+                'application/json', 'application/javascript', 'application/x-ndjson', 'application/xml'}
+# Response types that get ETags; HTML pages carry a per-session CSRF token
+ETAGGED = {'application/json', 'text/css', 'text/javascript', 'application/javascript'}
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _closing(chunks, source):
+    """Yield from chunks, closing the original response iterable afterwards"""
+    try:
+        yield from chunks
+    finally:
+        close = getattr(source, 'close', None)
+        if close is not None:
+            close()
+
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(response, encoding, level, brotli_quality):
+    """Compress response in place with encoding ('gzip' or 'br')"""
+    if response.is_streamed:
+        source = response.response
+        if encoding == 'br':
+            chunks = _brotli_stream(response.iter_encoded(), brotli_quality)
+        else:
+            chunks = _gzip_stream(response.iter_encoded(), level)
+        response.response = _closing(chunks, source)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=brotli_quality))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+    response.headers['Content-Encoding'] = encoding
+
+
+def init_app(app):
+    """Add ETags and compression to responses; see COMPRESS_* settings"""
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+    if not app.config['COMPRESS_ENABLED']:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if (response.mimetype not in COMPRESSIBLE or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return response
+
+        if (response.mimetype in ETAGGED and not response.is_streamed and response.status_code == 200
+                and request.method in ('GET', 'HEAD')):
+            response.add_etag(weak=True)
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+
+        response.vary.add('Accept-Encoding')
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return response
+        if not response.is_streamed and response.content_length < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is not None:
+            compress(response, encoding, app.config['COMPRESS_LEVEL'], app.config['COMPRESS_BROTLI_QUALITY'])
+        return response
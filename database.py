@@ -0,0 +1,245 @@
+import os
+import sqlite3
+
+import sqlalchemy as sa
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_KEY = 'replica'
+
+# Endpoints that only read and may be served from the replica
+READ_ONLY_ENDPOINTS = ('index', 'enhanced_search', 'product_detail', 'user_profile',
+                       'api_products', 'api_product', 'api_suggest')
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def load_database_config(app):
+    """Fill database settings from the environment, keeping anything already set"""
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.environ.get('DATABASE_URL', 'sqlite:///ecoswap.db'))
+    app.config.setdefault('DATABASE_REPLICA_URL', os.environ.get('DATABASE_REPLICA_URL'))
+    app.config.setdefault('DATABASE_READ_ONLY_ENDPOINTS', READ_ONLY_ENDPOINTS)
+
+    # Server databases (Postgres)
+    app.config.setdefault('DB_POOL_SIZE', _env_int('DB_POOL_SIZE', 10))
+    app.config.setdefault('DB_MAX_OVERFLOW', _env_int('DB_MAX_OVERFLOW', 20))
+    app.config.setdefault('DB_POOL_TIMEOUT', _env_int('DB_POOL_TIMEOUT', 10))
+    app.config.setdefault('DB_POOL_RECYCLE', _env_int('DB_POOL_RECYCLE', 300))
+    app.config.setdefault('DB_CONNECT_TIMEOUT', _env_int('DB_CONNECT_TIMEOUT', 5))
+    app.config.setdefault('DB_STATEMENT_TIMEOUT_MS', _env_int('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+    # SQLite
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config.setdefault('SQLITE_MMAP_SIZE', _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    app.config.setdefault('SQLITE_CACHE_SIZE_KB', _env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    if app.config['DATABASE_REPLICA_URL']:
+        replica_url = app.config['DATABASE_REPLICA_URL']
+        app.config.setdefault('SQLALCHEMY_BINDS', {})
+        app.config['SQLALCHEMY_BINDS'][REPLICA_BIND_KEY] = dict(
+            url=replica_url, **engine_options(replica_url, app.config))
+
+
+def engine_options(url, config):
+    """Return create_engine() options tuned for the backend behind url"""
+    url = sa.engine.make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        # Pragmas are applied per connection in init_app; a file database keeps
+        # SQLAlchemy's default QueuePool, an in-memory one must share one connection
+        options = {'connect_args': {'check_same_thread': False,
+                                    'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}}
+        if url.database in (None, '', ':memory:'):
+            options['poolclass'] = sa.pool.StaticPool
+        return options
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+    if url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {
+            'connect_timeout': config['DB_CONNECT_TIMEOUT'],
+            'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}",
+        }
+    return options
+
+
+def _sqlite_pragmas(config):
+    pragmas = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        'PRAGMA temp_store=MEMORY',
+        # ON DELETE CASCADE / SET NULL only apply with enforcement on
+        'PRAGMA foreign_keys=ON',
+    ]
+
+    def on_connect(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return on_connect
+
+
+def init_app(app, db):
+    """Attach SQLite pragmas and replica routing once db.init_app() has run"""
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _sqlite_pragmas(app.config))
+
+    if not app.config.get('DATABASE_REPLICA_URL'):
+        return
+
+    read_only_endpoints = frozenset(app.config['DATABASE_READ_ONLY_ENDPOINTS'])
+
+    @app.before_request
+    def route_reads_to_replica():
+        g.db_use_replica = request.endpoint in read_only_endpoints
+
+
+def _use_replica():
+    return has_app_context() and g.get('db_use_replica', False)
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica bind during read-only requests.
+
+    Flushes and bulk UPDATE/DELETE statements always go to the primary, so a
+    read-only route that still bumps a counter keeps working.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing
+                and not isinstance(clause, sa.sql.dml.UpdateBase) and _use_replica()):
+            engine = self._db.engines.get(REPLICA_BIND_KEY)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _foreign_keys(specs):
+    """{(columns, referred table): ON DELETE action} with NO ACTION as None"""
+    keys = {}
+    for columns, referred_table, ondelete in specs:
+        ondelete = (ondelete or '').upper()
+        keys[(tuple(columns), referred_table)] = None if ondelete in ('', 'NO ACTION') else ondelete
+    return keys
+
+
+def _sync_foreign_keys(connection, inspector, table):
+    """Drop, add or rebuild foreign keys until they match the model, ON DELETE included"""
+    reflected = inspector.get_foreign_keys(table.name)
+    existing = _foreign_keys((fk['constrained_columns'], fk['referred_table'], fk['options'].get('ondelete'))
+                             for fk in reflected)
+    declared = _foreign_keys(([column.name for column in constraint.columns], constraint.referred_table.name,
+                              constraint.ondelete) for constraint in table.foreign_key_constraints)
+    if existing == declared:
+        return
+    if connection.dialect.name == 'sqlite':
+        _rebuild_sqlite_table(connection, table)
+        return
+    preparer = connection.dialect.identifier_preparer
+    for fk in reflected:
+        key = (tuple(fk['constrained_columns']), fk['referred_table'])
+        if fk['name'] and declared.get(key, False) != existing[key]:
+            connection.execute(sa.text(
+                f'ALTER TABLE {preparer.format_table(table)} DROP CONSTRAINT {preparer.quote(fk["name"])}'))
+    for constraint in table.foreign_key_constraints:
+        key = (tuple(column.name for column in constraint.columns), constraint.referred_table.name)
+        if existing.get(key, False) != declared[key]:
+            connection.execute(sa.schema.AddConstraint(constraint))
+
+
+def _rebuild_sqlite_table(connection, table):
+    """SQLite cannot alter constraints, so copy the rows into a table created from the model.
+
+    Runs with foreign key enforcement off (see sync_schema), as SQLite
+    recommends, so dropping the old table does not cascade.
+    """
+    metadata = sa.MetaData()
+    for other in table.metadata.sorted_tables:
+        other.to_metadata(metadata)
+    replacement = table.to_metadata(metadata, name=f'_rebuild_{table.name}')
+    preparer = connection.dialect.identifier_preparer
+    columns = ', '.join(preparer.format_column(column) for column in table.columns)
+    connection.execute(sa.schema.CreateTable(replacement))
+    connection.execute(sa.text(f'INSERT INTO {preparer.format_table(replacement)} ({columns}) '
+                               f'SELECT {columns} FROM {preparer.format_table(table)}'))
+    connection.execute(sa.text(f'DROP TABLE {preparer.format_table(table)}'))
+    connection.execute(sa.text(f'ALTER TABLE {preparer.format_table(replacement)} '
+                               f'RENAME TO {preparer.format_table(table)}'))
+    for index in table.indexes:
+        index.create(connection)
+
+
+def sync_schema(db):
+    """Add columns and indexes that models gained after their table was created.
+
+    db.create_all() only creates missing tables. New columns are added as
+    nullable (or with their server default) so existing rows stay valid.
+    Foreign keys are brought in line with the models, including their ON
+    DELETE action; on SQLite that means rebuilding the table. Returns the
+    columns added, as 'table.column' names.
+    """
+    added = set()
+    inspector = sa.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    with db.engine.connect() as connection:
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            # Can only change outside a transaction
+            connection.execute(sa.text('PRAGMA foreign_keys=OFF'))
+            connection.commit()
+        with connection.begin():
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    ddl = f'ALTER TABLE {connection.dialect.identifier_preparer.format_table(table)} ' \
+                          f'ADD COLUMN {connection.dialect.identifier_preparer.format_column(column)} {column_type}'
+                    if column.server_default is not None:
+                        ddl += f' DEFAULT {column.server_default.arg}'
+                    connection.execute(sa.text(ddl))
+                    added.add(f'{table.name}.{column.name}')
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
+                _sync_foreign_keys(connection, inspector, table)
+        if sqlite:
+            connection.execute(sa.text('PRAGMA foreign_keys=ON'))
+            connection.commit()
+    return added
+
+
+def backfill(added):
+    """Fill columns that existing rows gained empty from the data already there"""
+    if {'product.rating_count', 'user.seller_rating_count'} & added:
+        import ratings
+        ratings.rebuild()
+    if 'message.conversation_id' in added:
+        import messaging
+        messaging.backfill_conversations()
+
+
+def create_schema(db):
+    """Create missing tables, then add and backfill missing columns and indexes (`flask db create`)"""
+    db.create_all()
+    backfill(sync_schema(db))
@@ -0,0 +1,154 @@
+"""Duplicate listing detection from perceptual image hashes.
+
+Every upload gets a 64-bit dHash (utils.image_dhash). save_image() records
+it straight away unless the caller defers it. Deferred uploads are hashed by
+the listings.duplicates job, which hashes a new listing's photos and then
+tells the seller about likely duplicates.
+Photos of the same item, re-saved, resized or cropped a little, land within a
+few bits of each other. A new listing whose photos are within
+DUPLICATE_IMAGE_DISTANCE bits of another listing's is probably the same item
+listed again.
+
+Lookups use multi-index hashing. Each hash is stored as four indexed 16-bit
+chunks, and two hashes within distance d share a chunk that differs in at
+most d // 4 bits. The candidates are therefore the rows matching one of a
+handful of values in any chunk (17 per chunk for distances up to 7), and only
+those are compared bit by bit. The cost follows the number of near matches,
+not the number of images stored.
+
+Uploads saved before hashes were recorded are covered by
+`flask images backfill-hashes` or the images.backfill_hashes job.
+"""
+import logging
+import os
+import time
+from itertools import combinations
+
+from sqlalchemy import or_, select, union
+
+from app import db
+from models import ImageHash, Product, ProductImage
+from utils import DEFAULT_MAX_DECODE_BYTES, HASH_DECODE_SIZE, allowed_file, image_dhash, open_image, upload_path
+
+logger = logging.getLogger(__name__)
+
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+HASH_MASK = (1 << 64) - 1
+# Files this new may still be waiting for the commit or job that records their hash
+BACKFILL_SKIP_SECONDS = 600
+
+
+def split(value):
+    """The four 16-bit chunks of a 64-bit hash, lowest first"""
+    return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+def _neighbours(chunk, radius):
+    """Every chunk value within radius bits of chunk, itself included"""
+    values = [chunk]
+    for bits in range(1, radius + 1):
+        for positions in combinations(range(CHUNK_BITS), bits):
+            flipped = chunk
+            for position in positions:
+                flipped ^= 1 << position
+            values.append(flipped)
+    return values
+
+
+def distance(a, b):
+    return bin((a ^ b) & HASH_MASK).count('1')
+
+
+def record(image_url, value):
+    """Add the hash of a saved upload to the session; the caller commits"""
+    signed = value - (1 << 64) if value >= 1 << 63 else value
+    db.session.add(ImageHash(image_url=image_url, hash=signed,
+                             **{f'chunk_{i}': chunk for i, chunk in enumerate(split(value))}))
+
+
+def similar_images(value, max_distance):
+    """{image_url: distance} of the stored hashes within max_distance bits of value"""
+    radius = max_distance // CHUNKS
+    conditions = [getattr(ImageHash, f'chunk_{i}').in_(_neighbours(chunk, radius))
+                  for i, chunk in enumerate(split(value))]
+    matches = {}
+    for image_url, other in db.session.execute(select(ImageHash.image_url, ImageHash.hash).where(or_(*conditions))):
+        bits = distance(value, other)
+        if bits <= max_distance:
+            matches[image_url] = bits
+    return matches
+
+
+def hash_listing(product, max_decode_bytes=DEFAULT_MAX_DECODE_BYTES):
+    """Record the hashes of product's photos that have none yet; the caller commits"""
+    images = set(product.all_images)
+    known = set(db.session.scalars(select(ImageHash.image_url).where(ImageHash.image_url.in_(images))))
+    hashed = 0
+    for image_url in sorted(images - known):
+        try:
+            with open(upload_path(image_url), 'rb') as f:
+                value = image_dhash(open_image(f, HASH_DECODE_SIZE, max_decode_bytes))
+        except (OSError, ValueError) as e:
+            logger.warning('Not hashing %s: %s', image_url, e)
+            continue
+        record(image_url, value)
+        hashed += 1
+    return hashed
+
+
+def find_duplicates(product, max_distance, limit=5):
+    """Other listings whose photos are within max_distance bits of product's.
+
+    Returns (Product, distance) pairs, closest first.
+    """
+    own_images = set(product.all_images)
+    if not own_images or max_distance < 0:
+        return []
+    nearest = {}
+    # A hash of 0 is a blank or flat image, which says nothing about the item
+    for value in db.session.scalars(select(ImageHash.hash).where(ImageHash.image_url.in_(own_images),
+                                                                 ImageHash.hash != 0)):
+        for image_url, bits in similar_images(value & HASH_MASK, max_distance).items():
+            if image_url not in own_images and bits < nearest.get(image_url, 65):
+                nearest[image_url] = bits
+    if not nearest:
+        return []
+    owners = union(select(Product.id, Product.image_url).where(Product.image_url.in_(nearest)),
+                   select(ProductImage.product_id, ProductImage.image_url).where(ProductImage.image_url.in_(nearest)))
+    distances = {}
+    for product_id, image_url in db.session.execute(owners):
+        if product_id != product.id:
+            distances[product_id] = min(distances.get(product_id, 65), nearest[image_url])
+    closest = sorted(distances, key=lambda product_id: (distances[product_id], -product_id))[:limit]
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(closest))}
+    return [(products[product_id], distances[product_id]) for product_id in closest]
+
+
+def backfill(upload_dir, batch_size=500, max_decode_bytes=DEFAULT_MAX_DECODE_BYTES):
+    """Hash the images in upload_dir that have no image_hash row; returns the number hashed"""
+    if not os.path.isdir(upload_dir):
+        return 0
+    cutoff = time.time() - BACKFILL_SKIP_SECONDS
+    names = sorted(name for name in os.listdir(upload_dir) if allowed_file(name))
+    hashed = 0
+    for start in range(0, len(names), batch_size):
+        batch = {f'uploads/{name}': name for name in names[start:start + batch_size]}
+        known = set(db.session.scalars(select(ImageHash.image_url).where(ImageHash.image_url.in_(batch))))
+        for image_url, name in batch.items():
+            path = os.path.join(upload_dir, name)
+            if image_url in known:
+                continue
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                with open(path, 'rb') as f:
+                    value = image_dhash(open_image(f, HASH_DECODE_SIZE, max_decode_bytes))
+            except (OSError, ValueError) as e:
+                logger.warning('Not hashing %s: %s', image_url, e)
+                continue
+            record(image_url, value)
+            hashed += 1
+        db.session.commit()
+    return hashed
@@ -1,11 +1,12 @@
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed, MultipleFileField
+from flask_wtf.file import FileField, FileAllowed, FileRequired, MultipleFileField
 from wtforms import (StringField, TextAreaField, SelectField, FloatField, PasswordField, 
                      SubmitField, IntegerField, BooleanField, HiddenField)
 from wtforms.validators import DataRequired, Email, Length, NumberRange, EqualTo, ValidationError, Optional
 from models import User
+from utils import check_image
 
-# Custom validator for images
+# Custom validator for images: checks the file's header, not just its name
 def validate_image_file(form, field):
     if field.data:
         filename = field.data.filename
@@ -13,6 +14,10 @@ def validate_image_file(form, field):
             allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
             if '.' in filename and filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
                 raise ValidationError('Only PNG, JPG, JPEG, and GIF images are allowed!')
+            try:
+                check_image(field.data)
+            except ValueError as e:
+                raise ValidationError(str(e))
 
 def validate_multiple_images(form, field):
     if field.data:
@@ -22,6 +27,10 @@ def validate_multiple_images(form, field):
                 allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
                 if '.' in filename and filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
                     raise ValidationError(f'File {filename}: Only PNG, JPG, JPEG, and GIF images are allowed!')
+                try:
+                    check_image(file_data)
+                except ValueError as e:
+                    raise ValidationError(f'File {filename}: {e}')
 
 class LoginForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email()])
@@ -82,6 +91,13 @@ class ProductForm(FlaskForm):
     is_featured = BooleanField('Feature this product (premium listing)')
     submit = SubmitField('Add Product')
 
+class BulkImportForm(FlaskForm):
+    listings_file = FileField('Listings File (CSV or JSONL)',
+                              validators=[FileRequired(), FileAllowed(['csv', 'jsonl', 'ndjson'], 'CSV or JSONL files only!')])
+    images_archive = FileField('Images Archive (ZIP, optional)',
+                               validators=[Optional(), FileAllowed(['zip'], 'ZIP archives only!')])
+    submit = SubmitField('Import Listings')
+
 class SearchForm(FlaskForm):
     search = StringField('Search Products', validators=[Length(max=100)])
     category = SelectField('Category', 
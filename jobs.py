@@ -0,0 +1,392 @@
+"""Database-backed job queue for work that should not hold up a request.
+
+enqueue() adds a row to the job table in the caller's session, so the job is
+committed or rolled back together with the change that caused it. Workers
+(``flask jobs worker``) claim due jobs with a conditional UPDATE. Any number
+of workers can therefore share the table on SQLite or Postgres without
+locking tricks.
+
+- Lanes: every job runs in a lane (high, default or low). Lower lanes wait
+  while higher ones have due work, and a worker can be limited to some lanes.
+- Retries: a failed job is retried with exponential backoff until
+  max_attempts, then it is kept as 'failed' with its last error.
+- Idempotency keys: an idempotency key makes enqueue() return the existing
+  job instead of adding a second one.
+- Process pool: jobs registered with cpu=True run in a process pool. They
+  must be plain importable functions that do not touch the database.
+
+Jobs run at least once: a worker renews the lease of the jobs it is running,
+but one that dies mid-job leaves them to be picked up again once their lease
+expires, so job functions should be safe to repeat.
+"""
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import g, has_app_context
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+LANES = {'high': 0, 'default': 1, 'low': 2}
+
+
+class JobSpec:
+    def __init__(self, name, func, lane, max_attempts, cpu):
+        self.name = name
+        self.func = func
+        self.lane = lane
+        self.max_attempts = max_attempts
+        self.cpu = cpu
+
+
+registry = {}
+schedule = {}  # job name -> interval in seconds
+
+
+def job(name, lane='default', max_attempts=5, cpu=False):
+    """Register func as the job called name"""
+    if lane not in LANES:
+        raise ValueError(f'Unknown job lane: {lane}')
+
+    def decorator(func):
+        registry[name] = JobSpec(name, func, lane, max_attempts, cpu)
+        return func
+    return decorator
+
+
+def every(seconds, name):
+    """Have workers enqueue the registered job name once per interval"""
+    schedule[name] = seconds
+
+
+def enqueue(name, *args, key=None, lane=None, delay=0, now=None):
+    """Add a job to the current session; the caller commits it.
+
+    With key, an existing job carrying the same idempotency key is returned
+    instead (keys stay taken until `flask jobs prune` removes the job).
+    """
+    from app import db
+    from models import Job
+
+    spec = registry[name]
+    now = now or datetime.utcnow()
+    job = Job(name=name, args=json.dumps(args), priority=LANES[lane or spec.lane], status='queued',
+              attempts=0, max_attempts=spec.max_attempts, idempotency_key=key,
+              run_at=now + timedelta(seconds=delay), created_at=now)
+    if key is None:
+        db.session.add(job)
+        return job
+
+    existing = Job.query.filter_by(idempotency_key=key).first()
+    if existing:
+        return existing
+    try:
+        with db.session.begin_nested():
+            db.session.add(job)
+    except IntegrityError:
+        # Another process enqueued it first
+        job = Job.query.filter_by(idempotency_key=key).one()
+    return job
+
+
+def current_time():
+    """The running worker's clock inside a job, so scheduled jobs follow a worker's fake clock"""
+    clock = g.get('job_clock') if has_app_context() else None
+    return clock() if clock is not None else datetime.utcnow()
+
+
+def backoff(attempts, base, cap):
+    """Seconds to wait before retry number attempts, with up to 10% jitter"""
+    delay = min(base * 2 ** (attempts - 1), cap)
+    return delay * (1 + random.random() / 10)
+
+
+class Worker:
+    """Claims and runs due jobs until stopped (or, with burst, until none are left)"""
+
+    def __init__(self, app, lanes=None, processes=0, batch_size=10, poll_interval=1.0, clock=datetime.utcnow):
+        self.app = app
+        self.priorities = [LANES[lane] for lane in lanes] if lanes else None
+        self.processes = processes
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.name = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self.lease = timedelta(seconds=app.config['JOBS_LEASE_SECONDS'])
+        self.stopping = False
+        self._pool = None
+        self._inflight = {}  # future -> job id
+        self._claimed = set()  # ids of claimed jobs this thread has yet to finish
+        self._running_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._scheduled = {}  # job name -> last slot enqueued
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        return self._pool
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self, burst=False):
+        from app import db
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+        logger.info('Job worker %s started', self.name)
+        self._stopped.clear()
+        threading.Thread(target=self._renew_leases, name='job-heartbeat', daemon=True).start()
+        try:
+            while not self.stopping:
+                try:
+                    self.recover_expired()
+                    self.enqueue_scheduled()
+                    self.collect()
+                    ran = self.run_batch()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Job worker loop failed')
+                    ran = 0
+                if not ran and not self._inflight:
+                    if burst:
+                        break
+                    time.sleep(self.poll_interval)
+                elif not ran:
+                    time.sleep(min(self.poll_interval, 0.1))
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self.collect()
+            self._stopped.set()
+            logger.info('Job worker %s stopped', self.name)
+
+    def running(self):
+        """Ids of the jobs this worker is running, in this thread or the process pool"""
+        with self._running_lock:
+            return set(self._inflight.values()) | self._claimed
+
+    def heartbeat(self):
+        """Renew the lease of every job this worker is running; returns the number renewed"""
+        from app import db
+        from models import Job
+
+        ids = self.running()
+        if not ids:
+            return 0
+        renewed = db.session.execute(
+            update(Job).where(Job.id.in_(ids), Job.status == 'running', Job.locked_by == self.name)
+            .values(locked_at=self.clock())).rowcount
+        db.session.commit()
+        return renewed
+
+    def _renew_leases(self):
+        # Long jobs keep their lease, so recover_expired() only takes jobs whose worker died
+        interval = self.lease.total_seconds() / 3
+        while not self._stopped.wait(interval):
+            try:
+                with self.app.app_context():
+                    self.heartbeat()
+            except Exception:
+                logger.exception('Renewing job leases failed')
+
+    def claim(self, limit, exclude=()):
+        """Mark up to limit due jobs as running for this worker and return them"""
+        from app import db
+        from models import Job
+
+        now = self.clock()
+        query = select(Job.id).where(Job.status == 'queued', Job.run_at <= now)
+        if self.priorities is not None:
+            query = query.where(Job.priority.in_(self.priorities))
+        if exclude:
+            query = query.where(Job.name.notin_(exclude))
+        candidates = db.session.scalars(query.order_by(Job.priority, Job.run_at, Job.id).limit(limit)).all()
+        claimed = []
+        for job_id in candidates:
+            # Only one worker's UPDATE can still see the job as queued
+            if db.session.execute(
+                    update(Job).where(Job.id == job_id, Job.status == 'queued')
+                    .values(status='running', locked_by=self.name, locked_at=now,
+                            attempts=Job.attempts + 1)).rowcount:
+                claimed.append(job_id)
+        db.session.commit()
+        if not claimed:
+            return []
+        return Job.query.filter(Job.id.in_(claimed)).order_by(Job.priority, Job.run_at, Job.id).all()
+
+    def run_batch(self):
+        exclude = ()
+        if self.processes and len(self._inflight) >= self.processes * 2:
+            # Pool is saturated; only take jobs that run in this process
+            exclude = [name for name, spec in registry.items() if spec.cpu]
+        jobs = self.claim(self.batch_size, exclude)
+        with self._running_lock:
+            self._claimed = {job.id for job in jobs}
+        try:
+            for job in jobs:
+                self.execute(job)
+                if self.stopping:
+                    break
+        finally:
+            with self._running_lock:
+                self._claimed = set()
+        return len(jobs)
+
+    def execute(self, job):
+        from app import db
+
+        spec = registry.get(job.name)
+        if spec is None:
+            self.finish(job.id, error=f'No job registered as {job.name}', retry=False)
+            return
+        args = json.loads(job.args)
+        if spec.cpu and self.processes:
+            future = self.pool.submit(spec.func, *args)
+            with self._running_lock:
+                self._inflight[future] = job.id
+                self._claimed.discard(job.id)
+            return
+        start = time.perf_counter()
+        try:
+            # Request context so jobs can build links with url_for
+            with self.app.test_request_context():
+                g.job_clock = self.clock
+                spec.func(*args)
+        except Exception:
+            db.session.rollback()
+            logger.exception('Job %s (%s) failed', job.id, job.name)
+            self.finish(job.id, error=traceback.format_exc())
+        else:
+            logger.debug('Job %s (%s) done in %.1f ms', job.id, job.name, (time.perf_counter() - start) * 1000)
+            self.finish(job.id)
+        finally:
+            with self._running_lock:
+                self._claimed.discard(job.id)
+
+    def collect(self):
+        """Record the outcome of finished process-pool jobs"""
+        for future in [f for f in self._inflight if f.done()]:
+            with self._running_lock:
+                job_id = self._inflight.pop(future)
+            error = future.exception()
+            if error is not None:
+                logger.error('Job %s failed: %r', job_id, error)
+                self.finish(job_id, error=''.join(traceback.format_exception(error)))
+            else:
+                self.finish(job_id)
+
+    def finish(self, job_id, error=None, retry=True):
+        from app import db
+        from models import Job
+
+        now = self.clock()
+        job = db.session.get(Job, job_id)
+        if error is None:
+            job.status = 'done'
+            job.finished_at = now
+            job.last_error = None
+        elif retry and job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = now + timedelta(seconds=backoff(
+                job.attempts, self.app.config['JOBS_BACKOFF_SECONDS'], self.app.config['JOBS_BACKOFF_MAX_SECONDS']))
+            job.last_error = error
+        else:
+            job.status = 'failed'
+            job.finished_at = now
+            job.last_error = error
+        job.locked_by = None
+        job.locked_at = None
+        db.session.commit()
+
+    def recover_expired(self):
+        """Requeue (or fail) running jobs whose worker stopped renewing their lease (see heartbeat)"""
+        from app import db
+        from models import Job
+
+        now = self.clock()
+        expired = Job.query.filter(Job.status == 'running', Job.locked_at < now - self.lease)
+        failed = expired.filter(Job.attempts >= Job.max_attempts).update(
+            {'status': 'failed', 'locked_by': None, 'last_error': 'Lease expired', 'finished_at': now},
+            synchronize_session=False)
+        requeued = expired.update({'status': 'queued', 'locked_by': None, 'locked_at': None},
+                                  synchronize_session=False)
+        db.session.commit()
+        if failed or requeued:
+            logger.warning('Recovered %s expired jobs (%s failed)', failed + requeued, failed)
+
+    def enqueue_scheduled(self):
+        """Enqueue each scheduled job once per interval, whichever worker gets there first"""
+        from app import db
+
+        now = self.clock()
+        added = False
+        for name, seconds in schedule.items():
+            slot = int(now.timestamp() // seconds)
+            if self._scheduled.get(name) == slot:
+                continue
+            enqueue(name, key=f'{name}@{slot}', now=now)
+            self._scheduled[name] = slot
+            added = True
+        if added:
+            db.session.commit()
+
+
+def stats():
+    """Job counts by status and lane"""
+    from app import db
+    from models import Job
+
+    lanes = {priority: lane for lane, priority in LANES.items()}
+    rows = db.session.execute(
+        select(Job.status, Job.priority, func.count()).group_by(Job.status, Job.priority)).all()
+    return {(status, lanes.get(priority, priority)): count for status, priority, count in rows}
+
+
+def prune(older_than_days, now=None):
+    """Delete finished jobs older than the given age; returns the number removed"""
+    from app import db
+    from models import Job
+
+    cutoff = (now or datetime.utcnow()) - timedelta(days=older_than_days)
+    removed = Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff).delete(
+        synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def init_app(app):
+    """Job queue settings; optionally run a worker thread inside each web process"""
+    app.config.setdefault('JOBS_LEASE_SECONDS', 300)
+    app.config.setdefault('JOBS_BACKOFF_SECONDS', 10)
+    app.config.setdefault('JOBS_BACKOFF_MAX_SECONDS', 3600)
+    app.config.setdefault('JOBS_EMBEDDED_WORKER', False)
+    if not app.config['JOBS_EMBEDDED_WORKER']:
+        return
+
+    started = threading.Lock()
+    state = {'thread': None}
+
+    def work():
+        with app.app_context():
+            Worker(app).run()
+
+    @app.before_request
+    def start_embedded_worker():
+        # Started from the first request so each forked server process gets its own
+        if state['thread'] is None:
+            with started:
+                if state['thread'] is None:
+                    state['thread'] = threading.Thread(target=work, name='job-worker', daemon=True)
+                    state['thread'].start()
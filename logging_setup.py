@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request, session
+
+# Default level per APP_ENV; LOG_LEVEL overrides it
+ENV_LOG_LEVELS = {
+    'development': 'DEBUG',
+    'testing': 'WARNING',
+    'production': 'INFO',
+}
+
+# Chatty third-party loggers kept at WARNING unless LOG_LEVEL asks for less
+QUIET_LOGGERS = ('werkzeug', 'PIL', 'sqlalchemy.engine', 'urllib3')
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach request id, user id and route to records logged during a request.
+
+    Filters on a handler only run for records that passed the level check,
+    so nothing here costs anything for suppressed debug calls.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.route = request.endpoint
+            user = g.get('_login_user')
+            record.user_id = user.get_id() if user is not None else session.get('_user_id')
+        else:
+            record.request_id = record.route = record.user_id = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key in ('request_id', 'user_id', 'route'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+
+def configure_logging(app):
+    """Set up root logging from APP_ENV, LOG_LEVEL and LOG_FORMAT (json or text)"""
+    env = app.config.setdefault('APP_ENV', os.environ.get('APP_ENV', 'production'))
+    level = app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', ENV_LOG_LEVELS.get(env, 'INFO'))).upper()
+    levels = logging.getLevelNamesMapping()
+    unknown_level = None
+    if level not in levels:
+        unknown_level, level = level, 'INFO'
+        app.config['LOG_LEVEL'] = level
+    log_format = app.config.setdefault('LOG_FORMAT', os.environ.get('LOG_FORMAT', 'json'))
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.WARNING, levels[level]))
+    # Let app.logger propagate to the root handler instead of Flask's default one
+    app.logger.handlers.clear()
+    app.logger.setLevel(level)
+    if unknown_level is not None:
+        logging.getLogger(__name__).warning('Unknown LOG_LEVEL %r, logging at INFO', unknown_level)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+
+    @app.after_request
+    def echo_request_id(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
@@ -0,0 +1,182 @@
+from datetime import datetime
+
+from sqlalchemy import and_, literal_column, or_, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from app import db
+from models import ArchivedMessage, Conversation, Message, Product, User
+
+PREVIEW_LENGTH = 200
+
+
+def _pair(user_a, user_b):
+    return (user_a, user_b) if user_a < user_b else (user_b, user_a)
+
+
+def get_or_create_conversation(user_a, user_b, product_id=None):
+    """Return the conversation between two users about product_id, creating it if needed"""
+    low, high = _pair(user_a, user_b)
+    topic_key = product_id or 0
+    conversation = Conversation.query.filter_by(
+        user_low_id=low, user_high_id=high, topic_key=topic_key).first()
+    if conversation:
+        return conversation
+
+    conversation = Conversation(user_low_id=low, user_high_id=high, product_id=product_id or None,
+                                topic_key=topic_key, unread_low=0, unread_high=0)
+    try:
+        with db.session.begin_nested():
+            db.session.add(conversation)
+    except IntegrityError:
+        # Another request created it first
+        conversation = Conversation.query.filter_by(
+            user_low_id=low, user_high_id=high, topic_key=topic_key).one()
+    return conversation
+
+
+def record_message(conversation, message):
+    """Attach message to conversation and update the denormalized summary in one UPDATE"""
+    message.conversation_id = conversation.id
+    created_at = message.created_at or datetime.utcnow()
+    message.created_at = created_at
+    db.session.add(message)
+
+    unread_column = 'unread_low' if message.recipient_id == conversation.user_low_id else 'unread_high'
+    db.session.execute(
+        db.update(Conversation)
+        .where(Conversation.id == conversation.id)
+        .values({
+            'last_message_at': created_at,
+            'last_message_preview': (message.content or '')[:PREVIEW_LENGTH],
+            'last_sender_id': message.sender_id,
+            unread_column: getattr(Conversation, unread_column) + 1,
+        }))
+    db.session.expire(conversation)
+
+
+def mark_conversation_read(conversation, user_id):
+    """Mark every message to user_id in the conversation as read"""
+    Message.query.filter_by(conversation_id=conversation.id, recipient_id=user_id, is_read=False).update(
+        {'is_read': True}, synchronize_session=False)
+    unread_column = 'unread_low' if user_id == conversation.user_low_id else 'unread_high'
+    Conversation.query.filter_by(id=conversation.id).update({unread_column: 0}, synchronize_session=False)
+    db.session.expire(conversation)
+
+
+def mark_message_read(message):
+    """Mark a single message read and decrement its conversation's unread counter"""
+    if message.is_read:
+        return
+    message.is_read = True
+    if message.conversation_id is None:
+        return
+    conversation = db.session.get(Conversation, message.conversation_id)
+    unread_column = 'unread_low' if message.recipient_id == conversation.user_low_id else 'unread_high'
+    column = getattr(Conversation, unread_column)
+    Conversation.query.filter(Conversation.id == conversation.id, column > 0).update(
+        {unread_column: column - 1}, synchronize_session=False)
+
+
+def encode_cursor(when, row_id):
+    return f'{when.isoformat()}_{row_id}'
+
+
+def decode_cursor(cursor):
+    """Parse a 'timestamp_id' cursor, returning None for anything malformed"""
+    try:
+        when, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(when), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def inbox(user_id, cursor=None, per_page=20):
+    """Return (rows, next_cursor) for user_id's conversations, newest first.
+
+    Each side of the ordered pair has its own (user, last_message_at, id)
+    index, so the query is a union of two index range scans.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    other = aliased(User)
+
+    def side(user_column, other_column, unread_column):
+        query = (select(Conversation.id, Conversation.last_message_at, Conversation.last_message_preview,
+                        Conversation.last_sender_id, Conversation.product_id,
+                        unread_column.label('unread'), other_column.label('other_id'),
+                        other.username.label('other_username'), Product.title.label('product_title'))
+                 .join(other, other.id == other_column)
+                 .outerjoin(Product, Product.id == Conversation.product_id)
+                 .where(user_column == user_id))
+        if position:
+            when, row_id = position
+            query = query.where(or_(Conversation.last_message_at < when,
+                                    and_(Conversation.last_message_at == when, Conversation.id < row_id)))
+        return query.order_by(Conversation.last_message_at.desc(), Conversation.id.desc()).limit(per_page + 1)
+
+    # Each side is wrapped so its ORDER BY/LIMIT is allowed inside the UNION
+    union = union_all(
+        select(side(Conversation.user_low_id, Conversation.user_high_id, Conversation.unread_low).subquery()),
+        select(side(Conversation.user_high_id, Conversation.user_low_id, Conversation.unread_high).subquery()),
+    ).subquery()
+    rows = db.session.execute(
+        select(union).order_by(literal_column('last_message_at').desc(), literal_column('id').desc())
+        .limit(per_page + 1)).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1].last_message_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def thread(conversation, before=None, per_page=20):
+    """Return (messages oldest-first, cursor for older messages) for one page of a thread.
+
+    Pages continue into archived_message once the thread's rows in the message
+    table run out (see retention.py).
+    """
+    query = Message.query.filter_by(conversation_id=conversation.id)
+    if before:
+        query = query.filter(Message.id < before)
+    page = query.order_by(Message.id.desc()).limit(per_page + 1).all()
+    if len(page) <= per_page:
+        archived = ArchivedMessage.query.filter_by(conversation_id=conversation.id)
+        boundary = page[-1].id if page else before
+        if boundary:
+            archived = archived.filter(ArchivedMessage.id < boundary)
+        page += archived.order_by(ArchivedMessage.id.desc()).limit(per_page + 1 - len(page)).all()
+    older = None
+    if len(page) > per_page:
+        page = page[:per_page]
+        older = page[-1].id
+    page.reverse()
+    return page, older
+
+
+def unread_count(user_id):
+    """Total unread messages for user_id, from the conversation counters"""
+    low = select(db.func.coalesce(db.func.sum(Conversation.unread_low), 0)).where(Conversation.user_low_id == user_id)
+    high = select(db.func.coalesce(db.func.sum(Conversation.unread_high), 0)).where(Conversation.user_high_id == user_id)
+    return db.session.scalar(low) + db.session.scalar(high)
+
+
+def backfill_conversations(batch_size=1000):
+    """Group messages created before conversations existed into threads; returns messages updated"""
+    updated = 0
+    while True:
+        messages = (Message.query.filter(Message.conversation_id.is_(None))
+                    .order_by(Message.id).limit(batch_size).all())
+        if not messages:
+            return updated
+        for message in messages:
+            conversation = get_or_create_conversation(message.sender_id, message.recipient_id, message.product_id)
+            record_message(conversation, message)
+            if message.is_read:
+                # record_message counted it as unread
+                mark_read_column = 'unread_low' if message.recipient_id == conversation.user_low_id else 'unread_high'
+                column = getattr(Conversation, mark_read_column)
+                Conversation.query.filter_by(id=conversation.id).update(
+                    {mark_read_column: column - 1}, synchronize_session=False)
+        db.session.commit()
+        updated += len(messages)
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_app_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name -> (help text, buckets, key in the per-request sample)
+HISTOGRAMS = {
+    'ecoswap_request_duration_seconds': ('Wall time per request.', TIME_BUCKETS, 'wall'),
+    'ecoswap_request_sql_queries': ('SQL statements executed per request.', COUNT_BUCKETS, 'sql_count'),
+    'ecoswap_request_sql_duration_seconds': ('Total SQL time per request.', TIME_BUCKETS, 'sql'),
+    'ecoswap_request_template_seconds': ('Template render time per request.', TIME_BUCKETS, 'template'),
+    'ecoswap_request_image_seconds': ('Image processing time per request.', TIME_BUCKETS, 'image'),
+}
+
+# Server-Timing metric names for the per-request sample
+SERVER_TIMING = (('sql', 'sql'), ('template', 'tpl'), ('image', 'img'), ('wall', 'total'))
+
+SKIPPED_ENDPOINTS = {'static', 'dist_asset', 'metrics', 'events'}
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram with fixed buckets"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Per-process store of histograms keyed by metric name and endpoint.
+
+    Each worker process keeps its own registry; scrape every worker or run a
+    single worker per metrics target.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, endpoint, sample):
+        with self._lock:
+            for name, (_, buckets, key) in HISTOGRAMS.items():
+                histogram = self._histograms.get((name, endpoint))
+                if histogram is None:
+                    histogram = self._histograms[(name, endpoint)] = Histogram(buckets)
+                histogram.observe(sample[key])
+
+    def render(self):
+        """Return all histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, endpoint), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{endpoint="{endpoint}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _sample():
+    if has_app_context():
+        return g.get('_metrics')
+    return None
+
+
+@contextmanager
+def track(key):
+    """Add the time spent in the block to the current request's sample"""
+    sample = _sample()
+    if sample is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample[key] += time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own context, so a statement that raises leaves nothing behind
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute_factory(slow_query_seconds):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        sample = _sample()
+        if sample is not None:
+            sample['sql_count'] += 1
+            sample['sql'] += elapsed
+        if slow_query_seconds and elapsed >= slow_query_seconds:
+            logger.warning('Slow query (%.1f ms) on %s: %s',
+                           elapsed * 1000, request.endpoint if sample is not None else '-', statement)
+    return after_cursor_execute
+
+
+def _before_render(sender, template, context, **extra):
+    sample = _sample()
+    if sample is not None:
+        sample['_template_start'] = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    sample = _sample()
+    if sample is not None and '_template_start' in sample:
+        sample['template'] += time.perf_counter() - sample.pop('_template_start')
+
+
+def init_app(app, db):
+    """Record per-endpoint timings, expose them at /metrics and in Server-Timing.
+
+    Settings: METRICS_ENABLED, METRICS_SERVER_TIMING and SLOW_QUERY_MS
+    (0 disables slow-query logging).
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    slow_query_seconds = (app.config.get('SLOW_QUERY_MS') or 0) / 1000
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute_factory(slow_query_seconds))
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_request_metrics():
+        if request.endpoint in SKIPPED_ENDPOINTS:
+            return
+        g._metrics = {'start': time.perf_counter(), 'sql_count': 0, 'sql': 0.0,
+                      'template': 0.0, 'image': 0.0}
+
+    @app.after_request
+    def record_request_metrics(response):
+        sample = g.pop('_metrics', None)
+        if sample is None:
+            return response
+        sample['wall'] = time.perf_counter() - sample['start']
+        registry.observe(request.endpoint or 'unmatched', sample)
+        if app.config.get('METRICS_SERVER_TIMING'):
+            timings = [f'{label};dur={sample[key] * 1000:.1f}' for key, label in SERVER_TIMING]
+            timings.append(f"db;desc=\"{sample['sql_count']} queries\"")
+            response.headers.add('Server-Timing', ', '.join(timings))
+        return response
+
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
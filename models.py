@@ -1,6 +1,8 @@
+import json
 from datetime import datetime
 from flask_login import UserMixin
 from app import db
+import trending
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -18,6 +20,10 @@ class User(UserMixin, db.Model):
     total_purchases = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_active = db.Column(db.DateTime, default=datetime.utcnow)
+    last_wishlist_alert_at = db.Column(db.DateTime)  # rate limits wishlist alerts
+    # Totals of the reviews on this user's products, kept by ratings.record_review
+    seller_rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    seller_rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     products = db.relationship('Product', backref='owner', lazy=True, cascade='all, delete-orphan')
@@ -35,16 +41,9 @@ class User(UserMixin, db.Model):
     @property
     def average_rating(self):
         # Average rating from reviews of products they sold
-        try:
-            product_reviews = []
-            for product in self.products:
-                if hasattr(product, 'reviews'):
-                    product_reviews.extend(product.reviews)
-            if not product_reviews:
-                return 0
-            return sum(review.rating for review in product_reviews) / len(product_reviews)
-        except:
+        if not self.seller_rating_count:
             return 0
+        return self.seller_rating_sum / self.seller_rating_count
     
     @property
     def unread_notifications_count(self):
@@ -56,6 +55,12 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+# Prior for Product.rating_score (see ratings.py): an unrated product scores
+# RATING_PRIOR_MEAN, and it takes about RATING_PRIOR_WEIGHT reviews for a
+# product's own ratings to outweigh it
+RATING_PRIOR_MEAN = 3.0
+RATING_PRIOR_WEIGHT = 5
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -69,27 +74,48 @@ class Product(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_sold = db.Column(db.Boolean, default=False)
     is_featured = db.Column(db.Boolean, default=False)
+    # Review totals and their Bayesian average, kept up to date by ratings.record_review
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_score = db.Column(db.Float, nullable=False, default=RATING_PRIOR_MEAN,
+                             server_default=str(RATING_PRIOR_MEAN))
+    # log2 of the time-decayed activity sum (see trending.py) and views not yet rolled into it
+    trending_score = db.Column(db.Float, nullable=False, default=trending.new_listing_score, server_default='0')
+    pending_views = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Foreign key
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
-    # Relationships
-    cart_items = db.relationship('Cart', backref='product', lazy=True, cascade='all, delete-orphan')
-    purchase_history = db.relationship('PurchaseHistory', backref='product', lazy=True)
-    images = db.relationship('ProductImage', backref='product', lazy=True, cascade='all, delete-orphan')
-    reviews = db.relationship('Review', backref='product', lazy=True, cascade='all, delete-orphan')
-    wishlists = db.relationship('Wishlist', backref='product', lazy=True, cascade='all, delete-orphan')
-    offers = db.relationship('Offer', backref='product', lazy=True, cascade='all, delete-orphan')
+    # Relationships. The database deletes the child rows (ON DELETE CASCADE),
+    # so deleting a product never loads them
+    cart_items = db.relationship('Cart', backref='product', lazy=True, cascade='all, delete-orphan',
+                                 passive_deletes=True)
+    purchase_history = db.relationship('PurchaseHistory', backref='product', lazy=True,
+                                       primaryjoin='Product.id == foreign(PurchaseHistory.product_id)')
+    images = db.relationship('ProductImage', backref='product', lazy=True, cascade='all, delete-orphan',
+                            passive_deletes=True)
+    reviews = db.relationship('Review', backref='product', lazy=True, cascade='all, delete-orphan',
+                             passive_deletes=True)
+    wishlists = db.relationship('Wishlist', backref='product', lazy=True, cascade='all, delete-orphan',
+                               passive_deletes=True)
+    offers = db.relationship('Offer', backref='product', lazy=True, cascade='all, delete-orphan',
+                            passive_deletes=True)
+    
+    # "Best Rated" search order (WHERE is_sold = false ORDER BY rating_score DESC, id DESC),
+    # the homepage feed (optionally per category), the trending rollup's scan for views
+    # and a seller's listings
+    __table_args__ = (db.Index('ix_product_rating', 'is_sold', 'rating_score', 'id'),
+                      db.Index('ix_product_trending', 'is_sold', 'trending_score', 'id'),
+                      db.Index('ix_product_category_trending', 'category', 'is_sold', 'trending_score', 'id'),
+                      db.Index('ix_product_pending_views', 'pending_views'),
+                      db.Index('ix_product_owner', 'owner_id', 'is_sold', 'created_at'),
+                      db.Index('ix_product_image_url', 'image_url'))
     
     @property
     def average_rating(self):
-        try:
-            if not hasattr(self, 'reviews') or not self.reviews:
-                return 0
-            total_rating = sum(review.rating for review in self.reviews)
-            return total_rating / len(self.reviews)
-        except:
+        if not self.rating_count:
             return 0
+        return self.rating_sum / self.rating_count
     
     @property
     def all_images(self):
@@ -106,7 +132,7 @@ class Product(db.Model):
 class Cart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Ensure a user can't add the same product twice
@@ -118,27 +144,39 @@ class Cart(db.Model):
 class PurchaseHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    # No foreign key: old sold listings move to archived_product under the same id
+    product_id = db.Column(db.Integer, nullable=False, index=True)
     purchase_date = db.Column(db.DateTime, default=datetime.utcnow)
     price_paid = db.Column(db.Float, nullable=False)
     
+    archived_product = db.relationship('ArchivedProduct', viewonly=True,
+                                       primaryjoin='foreign(PurchaseHistory.product_id) == ArchivedProduct.id')
+    
+    @property
+    def listing(self):
+        """The purchased product, live or archived"""
+        return self.product or self.archived_product
+    
     def __repr__(self):
         return f'<Purchase User:{self.user_id} Product:{self.product_id}>'
 
 class ProductImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
     image_url = db.Column(db.String(200), nullable=False)
     is_primary = db.Column(db.Boolean, default=False)
     order_index = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Listings showing an upload (duplicate detection, upload cleanup)
+    __table_args__ = (db.Index('ix_product_image_image_url', 'image_url'),)
+    
     def __repr__(self):
         return f'<ProductImage {self.id}>'
 
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
     comment = db.Column(db.Text)
@@ -147,47 +185,107 @@ class Review(db.Model):
     # Relationship
     reviewer = db.relationship('User', backref='reviews_written')
     
+    # A product's reviews, newest first (also used by the seller review feed)
+    __table_args__ = (db.Index('ix_review_product_created', 'product_id', 'created_at', 'id'),)
+    
     def __repr__(self):
         return f'<Review {self.id}>'
 
 class Wishlist(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Ensure a user can't add the same product twice to wishlist
-    __table_args__ = (db.UniqueConstraint('user_id', 'product_id', name='unique_wishlist'),)
+    # Ensure a user can't add the same product twice to wishlist; the index
+    # finds a product's wishlisters in user order for alert fan-out
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'product_id', name='unique_wishlist'),
+        db.Index('ix_wishlist_product_user', 'product_id', 'user_id'),
+    )
     
     def __repr__(self):
         return f'<Wishlist User:{self.user_id} Product:{self.product_id}>'
 
 class Offer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     message = db.Column(db.Text)
-    status = db.Column(db.String(20), default='pending')  # pending, accepted, rejected, withdrawn
+    status = db.Column(db.String(20), default='pending')  # pending, accepted, rejected, withdrawn, expired
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime)
+    resolved_at = db.Column(db.DateTime)
     
     # Relationship
     buyer = db.relationship('User', backref='offers_made')
     
+    # The expiry sweeper range-scans pending offers by expires_at;
+    # accepting an offer looks up the product's other pending offers
+    __table_args__ = (
+        db.Index('ix_offer_status_expires', 'status', 'expires_at'),
+        db.Index('ix_offer_product_status', 'product_id', 'status'),
+    )
+    
     def __repr__(self):
         return f'<Offer {self.id}>'
 
+class Conversation(db.Model):
+    """Thread between two users, optionally about one product.
+    
+    The pair is stored ordered (user_low_id < user_high_id) so each thread has
+    exactly one row; last-message and unread fields are kept up to date by
+    messaging.record_message() so the inbox never touches the message table.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='SET NULL'))
+    topic_key = db.Column(db.Integer, nullable=False, default=0)  # product_id or 0, for the unique key
+    last_message_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_message_preview = db.Column(db.String(200), default='')
+    last_sender_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    unread_low = db.Column(db.Integer, default=0, nullable=False)  # unread by user_low
+    unread_high = db.Column(db.Integer, default=0, nullable=False)  # unread by user_high
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', 'topic_key', name='unique_conversation'),
+        db.Index('ix_conversation_low_inbox', 'user_low_id', 'last_message_at', 'id'),
+        db.Index('ix_conversation_high_inbox', 'user_high_id', 'last_message_at', 'id'),
+    )
+    
+    # Relationships
+    user_low = db.relationship('User', foreign_keys=[user_low_id])
+    user_high = db.relationship('User', foreign_keys=[user_high_id])
+    product = db.relationship('Product')
+    
+    def other_user(self, user_id):
+        return self.user_high if user_id == self.user_low_id else self.user_low
+    
+    def has_participant(self, user_id):
+        return user_id in (self.user_low_id, self.user_high_id)
+    
+    def __repr__(self):
+        return f'<Conversation {self.user_low_id}:{self.user_high_id}:{self.topic_key}>'
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'))
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'))  # Optional: message about specific product
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='SET NULL'))  # Optional: message about specific product
     subject = db.Column(db.String(200))
     content = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Thread pages are read newest-first by id within a conversation;
+    # retention archives by age
+    __table_args__ = (db.Index('ix_message_conversation_id', 'conversation_id', 'id'),
+                      db.Index('ix_message_created', 'created_at'))
+    
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     recipient = db.relationship('User', foreign_keys=[recipient_id], backref='received_messages')
@@ -205,5 +303,143 @@ class Notification(db.Model):
     link = db.Column(db.String(200))  # Optional link to navigate to
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Unread badge counts, and retention's scan for old read notifications
+    __table_args__ = (db.Index('ix_notification_user_unread', 'user_id', 'is_read'),
+                      db.Index('ix_notification_read_created', 'is_read', 'created_at'))
+    
     def __repr__(self):
         return f'<Notification {self.id}>'
+
+class ArchivedProduct(db.Model):
+    """A sold listing moved out of the product table by retention.archive_products.
+    
+    It keeps its product id, so PurchaseHistory rows still find it, along with
+    what purchase history and seller analytics show. Extra images are kept as a
+    JSON list of upload paths.
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    image_url = db.Column(db.String(200), default='')
+    image_urls = db.Column(db.Text, nullable=False, default='[]')
+    condition = db.Column(db.String(20))
+    location = db.Column(db.String(100))
+    views = db.Column(db.Integer, nullable=False, default=0)
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    owner = db.relationship('User')
+    
+    # Seller analytics
+    __table_args__ = (db.Index('ix_archived_product_owner', 'owner_id', 'category'),)
+    
+    is_sold = True
+    
+    @property
+    def all_images(self):
+        images = [self.image_url] if self.image_url else []
+        images.extend(json.loads(self.image_urls))
+        return images
+    
+    def __repr__(self):
+        return f'<ArchivedProduct {self.title}>'
+
+class ArchivedMessage(db.Model):
+    """A message moved out of the message table by retention.archive_messages; same id"""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'))
+    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product_id = db.Column(db.Integer)
+    subject = db.Column(db.String(200))
+    content = db.Column(db.Text, nullable=False)
+    is_read = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Older pages of a thread continue here once the message table runs out
+    __table_args__ = (db.Index('ix_archived_message_conversation_id', 'conversation_id', 'id'),)
+    
+    sender = db.relationship('User', foreign_keys=[sender_id])
+    recipient = db.relationship('User', foreign_keys=[recipient_id])
+    
+    def __repr__(self):
+        return f'<ArchivedMessage {self.id}>'
+
+class SavedSearch(db.Model):
+    """EnhancedSearchForm filters a user wants to hear about.
+    
+    index_key is the one posting a search is filed under (its rarest-looking
+    term, else its category or condition, else '*'), so a new listing only
+    looks at searches filed under its own words and filters.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    search = db.Column(db.String(100))
+    category = db.Column(db.String(50))
+    condition = db.Column(db.String(20))
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+    location = db.Column(db.String(100))
+    index_key = db.Column(db.String(120), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    user = db.relationship('User', backref='saved_searches')
+    
+    __table_args__ = (db.Index('ix_saved_search_index_key', 'index_key', 'id'),)
+    
+    def __repr__(self):
+        return f'<SavedSearch {self.id}>'
+
+class Job(db.Model):
+    """Deferred work picked up by `flask jobs worker` (see jobs.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    args = db.Column(db.Text, nullable=False, default='[]')  # JSON list
+    priority = db.Column(db.Integer, nullable=False, default=1)  # lane: 0 high, 1 default, 2 low
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    idempotency_key = db.Column(db.String(200), unique=True)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    # Workers scan due jobs lane by lane
+    __table_args__ = (db.Index('ix_job_queue', 'status', 'priority', 'run_at', 'id'),)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name}>'
+
+class RollupWatermark(db.Model):
+    """How far a background rollup (such as trending.rollup) has processed events"""
+    name = db.Column(db.String(50), primary_key=True)
+    until = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<RollupWatermark {self.name} {self.until}>'
+
+class ImageHash(db.Model):
+    """Perceptual hash (64-bit dHash) of an uploaded image, for duplicates.py.
+    
+    The hash is also stored as four 16-bit chunks, each indexed. Two hashes
+    within Hamming distance d share a chunk that differs in at most d // 4
+    bits, so near matches are found with four index lookups.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    image_url = db.Column(db.String(200), nullable=False, unique=True)
+    hash = db.Column(db.BigInteger, nullable=False)  # signed, to fit a Postgres bigint
+    chunk_0 = db.Column(db.Integer, nullable=False, index=True)
+    chunk_1 = db.Column(db.Integer, nullable=False, index=True)
+    chunk_2 = db.Column(db.Integer, nullable=False, index=True)
+    chunk_3 = db.Column(db.Integer, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ImageHash {self.image_url} {self.hash & 0xFFFFFFFFFFFFFFFF:016x}>'
@@ -0,0 +1,161 @@
+"""Offer lifecycle: accept, reject and expire offers with set-based updates.
+
+Every state change is a conditional UPDATE on status='pending', so two
+sellers' clicks, a double submit or the expiry sweeper racing an accept can
+never resolve the same offer twice. RETURNING reports which offers an update
+resolved; MySQL has no UPDATE ... RETURNING, so there the offers are locked
+and read first. Functions take an optional ``now`` so callers (and tests) can
+supply their own clock. The offers.expire job passes the clock of the worker
+running it (``jobs.Worker(app, clock=...)``).
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app, url_for
+from sqlalchemy import and_, or_, select, update
+
+from app import db
+from models import Offer, Product, PurchaseHistory, User
+from utils import create_notifications
+
+
+class OfferError(Exception):
+    """The offer can no longer change state (already resolved, expired or sold)"""
+
+
+def utcnow():
+    return datetime.utcnow()
+
+
+def default_expiry(now=None):
+    """Expiry time for an offer made at now"""
+    now = now or utcnow()
+    return now + timedelta(hours=current_app.config['OFFER_EXPIRY_HOURS'])
+
+
+def _still_open(now):
+    return and_(Offer.status == 'pending', or_(Offer.expires_at.is_(None), Offer.expires_at > now))
+
+
+def _resolve(condition, status, now, *columns):
+    """Resolve the offers matching condition as status; returns their columns"""
+    stmt = update(Offer).where(condition).values(status=status, resolved_at=now)
+    if db.session.get_bind(clause=Offer.__table__).dialect.update_returning:
+        return db.session.execute(stmt.returning(*columns)).all()
+    rows = db.session.execute(select(Offer.id, *columns).where(condition).with_for_update()).all()
+    if rows:
+        db.session.execute(update(Offer).where(Offer.id.in_([row.id for row in rows]))
+                           .values(status=status, resolved_at=now))
+    return rows
+
+
+def _product_link(product_id):
+    return url_for('product_detail', id=product_id)
+
+
+def accept_offer(offer, now=None):
+    """Accept offer, sell its product and reject every competing pending offer.
+
+    Raises OfferError if the offer was resolved or expired, or the product sold,
+    in the meantime. The caller's session is committed.
+    """
+    now = now or utcnow()
+    accepted = db.session.execute(
+        update(Offer).where(Offer.id == offer.id, _still_open(now))
+        .values(status='accepted', resolved_at=now)).rowcount
+    if not accepted:
+        db.session.rollback()
+        raise OfferError('This offer is no longer open.')
+    sold = db.session.execute(
+        update(Product).where(Product.id == offer.product_id, Product.is_sold == False)  # noqa: E712
+        .values(is_sold=True)).rowcount
+    if not sold:
+        db.session.rollback()
+        raise OfferError('This product has already been sold.')
+
+    losers = _resolve(and_(Offer.product_id == offer.product_id, Offer.status == 'pending'),
+                      'rejected', now, Offer.user_id)
+
+    db.session.add(PurchaseHistory(user_id=offer.user_id, product_id=offer.product_id,
+                                   price_paid=offer.amount, purchase_date=now))
+    db.session.execute(update(User).where(User.id == offer.product.owner_id)
+                       .values(total_sales=User.total_sales + 1))
+    db.session.execute(update(User).where(User.id == offer.user_id)
+                       .values(total_purchases=User.total_purchases + 1))
+
+    title = offer.product.title
+    notifications = [dict(user_id=offer.user_id, title='Offer Accepted!',
+                          message=f'Your offer for "{title}" has been accepted!',
+                          type='success', link=url_for('purchase_history'))]
+    # The buyer's own other offers are closed without telling them they lost
+    notifications += [dict(user_id=user_id, title='Offer Declined',
+                           message=f'"{title}" was sold to another buyer.',
+                           type='info', link=_product_link(offer.product_id))
+                      for user_id in {row.user_id for row in losers} - {offer.user_id}]
+    # Commits the offer updates together with the notifications
+    create_notifications(notifications)
+    db.session.expire_all()
+    return len(losers)
+
+
+def reject_offer(offer, now=None):
+    """Decline a single pending offer; raises OfferError if it is no longer open"""
+    now = now or utcnow()
+    rejected = db.session.execute(
+        update(Offer).where(Offer.id == offer.id, _still_open(now))
+        .values(status='rejected', resolved_at=now)).rowcount
+    if not rejected:
+        db.session.rollback()
+        raise OfferError('This offer is no longer open.')
+    create_notifications([dict(user_id=offer.user_id, title='Offer Declined',
+                               message=f'Your offer for "{offer.product.title}" was declined.',
+                               type='info', link=_product_link(offer.product_id))])
+    db.session.expire(offer)
+
+
+def decline_offers_for_sold(product_ids, now=None):
+    """Decline pending offers on products sold through checkout and notify the bidders"""
+    now = now or utcnow()
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    declined = _resolve(and_(Offer.product_id.in_(product_ids), Offer.status == 'pending'),
+                        'rejected', now, Offer.user_id, Offer.product_id)
+    titles = dict(db.session.execute(
+        select(Product.id, Product.title).where(Product.id.in_({row.product_id for row in declined}))).all())
+    create_notifications(
+        dict(user_id=row.user_id, title='Offer Declined',
+             message=f'"{titles[row.product_id]}" was sold to another buyer.',
+             type='info', link=_product_link(row.product_id))
+        for row in declined)
+    db.session.commit()
+    return len(declined)
+
+
+def expire_offers(now=None, batch_size=500):
+    """Mark pending offers past their expiry as expired and notify the bidders.
+
+    Walks the (status, expires_at) index in batches so each transaction stays
+    short; returns the number of offers expired.
+    """
+    now = now or utcnow()
+    total = 0
+    while True:
+        due = db.session.scalars(
+            select(Offer.id).where(Offer.status == 'pending', Offer.expires_at <= now)
+            .order_by(Offer.expires_at).limit(batch_size)).all()
+        if not due:
+            return total
+        expired = _resolve(and_(Offer.id.in_(due), Offer.status == 'pending'),
+                           'expired', now, Offer.user_id, Offer.product_id)
+        titles = dict(db.session.execute(
+            select(Product.id, Product.title).where(Product.id.in_({row.product_id for row in expired}))).all())
+        create_notifications(
+            dict(user_id=row.user_id, title='Offer Expired',
+                 message=f'Your offer for "{titles.get(row.product_id, "a listing")}" expired without a reply.',
+                 type='warning', link=_product_link(row.product_id))
+            for row in expired)
+        db.session.commit()
+        total += len(expired)
+        if len(due) < batch_size:
+            return total
+
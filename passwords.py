@@ -0,0 +1,124 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt as _bcrypt
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Default cost per algorithm: bcrypt log rounds, pbkdf2 iterations, scrypt N
+DEFAULT_COSTS = {
+    'bcrypt': 12,
+    'pbkdf2': 600000,
+    'scrypt': 32768,
+}
+
+
+def _bcrypt_input(password):
+    # bcrypt only looks at the first 72 bytes and newer releases reject longer input
+    return password.encode('utf-8')[:72]
+
+
+class PasswordHasher:
+    """Single place for hashing, verifying and upgrading user passwords.
+
+    Configured through ``PASSWORD_HASH_METHOD`` (bcrypt, pbkdf2 or scrypt),
+    ``PASSWORD_HASH_COST`` and ``PASSWORD_HASH_WORKERS``. Hashes written by
+    older settings keep verifying and are upgraded after a successful login.
+    """
+
+    def __init__(self, app=None, method='bcrypt', cost=None, workers=0):
+        self.app = None
+        self.configure(method, cost, workers)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'bcrypt')
+        app.config.setdefault('PASSWORD_HASH_COST', None)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 0)
+        self.configure(app.config['PASSWORD_HASH_METHOD'],
+                       app.config['PASSWORD_HASH_COST'],
+                       app.config['PASSWORD_HASH_WORKERS'])
+        self.app = app
+
+    def configure(self, method, cost=None, workers=0):
+        if method not in DEFAULT_COSTS:
+            raise ValueError(f'Unsupported password hash method: {method}')
+        self.method = method
+        self.cost = int(cost) if cost else DEFAULT_COSTS[method]
+        self.workers = int(workers or 0)
+        self._executor = None
+
+    @property
+    def executor(self):
+        # Created lazily so forking servers don't inherit live threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers or 1,
+                                                thread_name_prefix='password-hash')
+        return self._executor
+
+    def hash(self, password):
+        """Hash a password with the configured method and cost"""
+        if self.method == 'bcrypt':
+            salt = _bcrypt.gensalt(rounds=self.cost)
+            return _bcrypt.hashpw(_bcrypt_input(password), salt).decode('utf-8')
+        if self.method == 'pbkdf2':
+            return generate_password_hash(password, method=f'pbkdf2:sha256:{self.cost}')
+        return generate_password_hash(password, method=f'scrypt:{self.cost}:8:1')
+
+    def _verify(self, password_hash, password):
+        if not password_hash:
+            return False
+        if password_hash.startswith('$2'):
+            try:
+                return _bcrypt.checkpw(_bcrypt_input(password), password_hash.encode('utf-8'))
+            except ValueError:
+                return False
+        return check_password_hash(password_hash, password)
+
+    def verify(self, password_hash, password):
+        """Check a password, on the hashing pool when PASSWORD_HASH_WORKERS is set.
+
+        The pool bounds how many hashes run at once, so a burst of logins
+        queues instead of starving every other request of CPU.
+        """
+        if self.workers:
+            return self.executor.submit(self._verify, password_hash, password).result()
+        return self._verify(password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Return True if the hash was made with a different method or cost"""
+        if not password_hash:
+            return False
+        if password_hash.startswith('$2'):
+            parts = password_hash.split('$')
+            return self.method != 'bcrypt' or len(parts) < 3 or parts[2] != f'{self.cost:02d}'
+        method = password_hash.split('$', 1)[0]
+        if self.method == 'pbkdf2':
+            return method != f'pbkdf2:sha256:{self.cost}'
+        if self.method == 'scrypt':
+            return method != f'scrypt:{self.cost}:8:1'
+        return True
+
+    def rehash_later(self, user_id, old_hash, password):
+        """Upgrade a user's stored hash on the hashing pool after login"""
+        app = self.app
+        if app is None:
+            return None
+
+        def _rehash():
+            new_hash = self.hash(password)
+            with app.app_context():
+                from app import db
+                from models import User
+                try:
+                    # Only replace the hash we verified against, never a newer one
+                    User.query.filter_by(id=user_id, password_hash=old_hash).update(
+                        {'password_hash': new_hash}, synchronize_session=False)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Password rehash failed for user %s', user_id)
+
+        return self.executor.submit(_rehash)
@@ -0,0 +1,116 @@
+"""Bayesian product ratings stored on the product row for the "Best Rated" sort.
+
+    rating_score = (RATING_PRIOR_WEIGHT * RATING_PRIOR_MEAN + rating_sum)
+                   / (RATING_PRIOR_WEIGHT + rating_count)
+
+A single 5-star review therefore ranks below forty reviews averaging 4.8,
+and unrated products sit at the prior mean. record_review() updates the
+counters and the score in one UPDATE, so concurrent reviews do not lose each
+other's increments. Sorting is then a plain ORDER BY on ix_product_rating.
+Sellers keep plain review totals (User.seller_rating_count/sum) that are
+updated the same way. Their profile shows the average straight from those
+columns. The review feed and histogram are SQL over Review joined to the
+seller's products.
+
+Run ``flask ratings rebuild`` after changing the prior or loading reviews in bulk.
+"""
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import contains_eager, joinedload
+
+from app import db
+from messaging import decode_cursor, encode_cursor
+from models import RATING_PRIOR_MEAN, RATING_PRIOR_WEIGHT, Product, Review, User
+
+
+def bayesian_score(rating_sum, rating_count):
+    """Score for the given totals; works on numbers and on SQL expressions"""
+    return (RATING_PRIOR_WEIGHT * RATING_PRIOR_MEAN + rating_sum) / (RATING_PRIOR_WEIGHT + rating_count)
+
+
+def record_review(product_id, rating):
+    """Add one rating to the product's and its seller's totals; the caller commits"""
+    rating_sum = Product.rating_sum + rating
+    rating_count = Product.rating_count + 1
+    db.session.execute(
+        update(Product).where(Product.id == product_id)
+        .values(rating_sum=rating_sum, rating_count=rating_count,
+                rating_score=bayesian_score(rating_sum, rating_count)))
+    owner_id = select(Product.owner_id).where(Product.id == product_id).scalar_subquery()
+    db.session.execute(
+        update(User).where(User.id == owner_id)
+        .values(seller_rating_sum=User.seller_rating_sum + rating,
+                seller_rating_count=User.seller_rating_count + 1))
+
+
+def remove_products(product_ids):
+    """Take products about to be deleted, reviews and all, out of their sellers' totals; the caller commits"""
+    for owner_id, count, total in db.session.execute(
+            select(Product.owner_id, func.sum(Product.rating_count), func.sum(Product.rating_sum))
+            .where(Product.id.in_(product_ids), Product.rating_count > 0).group_by(Product.owner_id)):
+        db.session.execute(
+            update(User).where(User.id == owner_id)
+            .values(seller_rating_sum=User.seller_rating_sum - total,
+                    seller_rating_count=User.seller_rating_count - count))
+
+
+def rebuild(batch_size=1000):
+    """Recompute product totals and scores, then seller totals, from the reviews; returns products updated"""
+    updated = 0
+    last_id = 0
+    while True:
+        product_ids = db.session.scalars(
+            select(Product.id).where(Product.id > last_id).order_by(Product.id).limit(batch_size)).all()
+        if not product_ids:
+            rebuild_sellers()
+            return updated
+        totals = {product_id: (count, total) for product_id, count, total in db.session.execute(
+            select(Review.product_id, func.count(), func.sum(Review.rating))
+            .where(Review.product_id.in_(product_ids)).group_by(Review.product_id))}
+        rows = []
+        for product_id in product_ids:
+            count, total = totals.get(product_id, (0, 0))
+            rows.append({'id': product_id, 'rating_count': count, 'rating_sum': total,
+                         'rating_score': bayesian_score(total, count)})
+        # Bulk UPDATE by primary key
+        db.session.execute(update(Product), rows)
+        db.session.commit()
+        updated += len(product_ids)
+        last_id = product_ids[-1]
+
+
+def _owner_total(column):
+    return select(func.coalesce(func.sum(column), 0)).where(Product.owner_id == User.id).scalar_subquery()
+
+
+def rebuild_sellers():
+    """Recompute seller totals from the product totals in one UPDATE"""
+    db.session.execute(update(User).values(seller_rating_count=_owner_total(Product.rating_count),
+                                           seller_rating_sum=_owner_total(Product.rating_sum)))
+    db.session.commit()
+
+
+def seller_reviews(seller_id, cursor=None, per_page=10):
+    """Return (reviews newest first, next_cursor) for reviews of seller_id's products"""
+    position = decode_cursor(cursor) if cursor else None
+    query = (select(Review).join(Product, Product.id == Review.product_id)
+             .where(Product.owner_id == seller_id)
+             .options(contains_eager(Review.product), joinedload(Review.reviewer)))
+    if position:
+        when, review_id = position
+        query = query.where(or_(Review.created_at < when, and_(Review.created_at == when, Review.id < review_id)))
+    reviews = db.session.scalars(
+        query.order_by(Review.created_at.desc(), Review.id.desc()).limit(per_page + 1)).all()
+
+    next_cursor = None
+    if len(reviews) > per_page:
+        reviews = reviews[:per_page]
+        next_cursor = encode_cursor(reviews[-1].created_at, reviews[-1].id)
+    return reviews, next_cursor
+
+
+def rating_histogram(seller_id):
+    """{stars: number of reviews} for 5 down to 1 stars of seller_id's products"""
+    counts = dict(db.session.execute(
+        select(Review.rating, func.count()).join(Product, Product.id == Review.product_id)
+        .where(Product.owner_id == seller_id).group_by(Review.rating)).all())
+    return {stars: counts.get(stars, 0) for stars in range(5, 0, -1)}
@@ -0,0 +1,215 @@
+import importlib
+import json
+import logging
+import queue
+import threading
+import time
+
+from flask import Response, current_app
+from flask_login import current_user, login_required
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    """Queue of events for one connected client"""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fan events out to subscribers in this process; enough for a single node.
+
+    Multi-node deployments swap in a broker with the same publish/subscribe
+    methods (see PostgresBroker) via the REALTIME_BROKER setting.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def is_listening(self, user_id):
+        """Whether an event for user_id could reach anyone; lets callers skip building it"""
+        return user_id in self._subscribers
+
+    def publish(self, user_id, event, data):
+        self.deliver(user_id, event, data)
+
+    def deliver(self, user_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait((event, data))
+            except queue.Full:
+                # A stalled client drops events; counts are absolute so the next one catches up
+                pass
+
+
+class PostgresBroker(InProcessBroker):
+    """Broker for several app servers sharing one Postgres database.
+
+    Events go out with pg_notify() and every process runs one LISTEN thread
+    that hands them to its local subscribers.
+    """
+
+    CHANNEL = 'ecoswap_events'
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.app = app
+        self._listener = None
+
+    def _ensure_listener(self):
+        if self._listener is None or not self._listener.is_alive():
+            self._listener = threading.Thread(target=self._listen, name='realtime-listen', daemon=True)
+            self._listener.start()
+
+    def is_listening(self, user_id):
+        # Subscribers may be connected to another server
+        return True
+
+    def subscribe(self, user_id):
+        # Started on first use so forked workers each get their own connection
+        self._ensure_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, user_id, event, data):
+        from app import db
+        payload = json.dumps({'user_id': user_id, 'event': event, 'data': data})
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql('SELECT pg_notify(%s, %s)', (self.CHANNEL, payload))
+            connection.commit()
+
+    def _listen(self):
+        import select
+        from app import db
+        while True:
+            try:
+                with self.app.app_context():
+                    connection = db.engine.raw_connection()
+                # Kept out of the pool: it stays in autocommit and blocks in LISTEN
+                connection.detach()
+                try:
+                    connection.set_isolation_level(0)  # autocommit
+                    cursor = connection.cursor()
+                    cursor.execute(f'LISTEN {self.CHANNEL}')
+                    raw = connection.driver_connection
+                    while True:
+                        if select.select([raw], [], [], HEARTBEAT_SECONDS) == ([], [], []):
+                            continue
+                        raw.poll()
+                        while raw.notifies:
+                            message = json.loads(raw.notifies.pop(0).payload)
+                            self.deliver(message['user_id'], message['event'], message['data'])
+                finally:
+                    connection.close()
+            except Exception:
+                logger.exception('Realtime listener failed, reconnecting')
+                time.sleep(1)
+
+
+def _load_broker(app):
+    name = app.config.get('REALTIME_BROKER', 'memory')
+    if name == 'memory':
+        return InProcessBroker(app)
+    if name == 'postgres':
+        return PostgresBroker(app)
+    module_name, _, class_name = name.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)(app)
+
+
+def publish(user_id, event, data):
+    """Push an event to every open connection of user_id; never fails the caller"""
+    broker = current_app.extensions.get('realtime')
+    if broker is None:
+        return
+    try:
+        broker.publish(user_id, event, data)
+    except Exception:
+        logger.exception('Failed to publish %s event', event)
+
+
+def badge_counts(user_id):
+    """Unread notification and message counts for the navbar badges"""
+    from app import db
+    from messaging import unread_count
+    from models import Notification
+    notifications = db.session.scalar(
+        db.select(db.func.count()).select_from(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read == False))  # noqa: E712
+    return {'notifications': notifications, 'messages': unread_count(user_id)}
+
+
+def publish_counts(user_id):
+    """Send fresh badge counts to user_id"""
+    broker = current_app.extensions.get('realtime')
+    if broker is None or not broker.is_listening(user_id):
+        return
+    publish(user_id, 'counts', badge_counts(user_id))
+
+
+def _format(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def init_app(app):
+    """Register the broker and the /events server-sent events stream"""
+    if not app.config.get('REALTIME_ENABLED', True):
+        return
+    broker = app.extensions['realtime'] = _load_broker(app)
+
+    @login_required
+    def events():
+        # Subscribe before reading the counts so nothing published in between is lost
+        subscription = broker.subscribe(current_user.id)
+        initial = badge_counts(current_user.id)
+
+        def stream():
+            yield 'retry: 5000\n\n'
+            yield _format('counts', initial)
+            while True:
+                item = subscription.get(timeout=HEARTBEAT_SECONDS)
+                if item is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _format(*item)
+
+        # The stream needs no request context, so the request (and its database
+        # session) ends as soon as the headers are sent
+        response = Response(stream(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.call_on_close(subscription.close)
+        return response
+
+    app.add_url_rule('/events', 'events', events)
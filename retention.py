@@ -0,0 +1,137 @@
+"""Retention: keep the product, message and notification tables to recent rows.
+
+- Sold listings whose last sale is older than ARCHIVE_SOLD_AFTER_DAYS move
+  to archived_product under the same id. Purchase history still finds them
+  through PurchaseHistory.listing. Their cart, wishlist and offer rows are
+  deleted with them, and their extra images are folded into the archived row.
+  Listings with reviews or message threads stay put, since the seller profile
+  and the inbox link to them.
+- Messages older than MESSAGE_ARCHIVE_AFTER_DAYS move to archived_message,
+  where messaging.thread() reads older pages from.
+- Read notifications older than NOTIFICATION_RETENTION_DAYS are deleted.
+
+Each step works in batches of RETENTION_BATCH_SIZE rows, one short
+transaction per batch, so it never holds locks on a hot table for long. A
+setting of 0 turns its step off. The retention.run job applies all three every
+RETENTION_SECONDS; `flask retention run` does the same on demand.
+"""
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, exists, func, insert, literal, select
+
+from app import db
+from models import (ArchivedMessage, ArchivedProduct, Conversation, Message, Notification, Product, ProductImage,
+                    PurchaseHistory, Review)
+
+ARCHIVED_PRODUCT_COLUMNS = ('id', 'title', 'description', 'category', 'price', 'image_url', 'condition',
+                            'location', 'views', 'owner_id', 'created_at')
+ARCHIVED_MESSAGE_COLUMNS = ('id', 'conversation_id', 'sender_id', 'recipient_id', 'product_id', 'subject',
+                            'content', 'is_read', 'created_at')
+
+
+def _archivable_products(cutoff, batch_size):
+    """Ids of sold products last sold before cutoff that nothing visible links to"""
+    return db.session.scalars(
+        select(Product.id).where(
+            Product.is_sold == True,  # noqa: E712
+            Product.created_at < cutoff,
+            ~exists().where(PurchaseHistory.product_id == Product.id, PurchaseHistory.purchase_date >= cutoff),
+            ~exists().where(Review.product_id == Product.id),
+            ~exists().where(Conversation.product_id == Product.id),
+            ~exists().where(Message.product_id == Product.id))
+        .order_by(Product.id).limit(batch_size)).all()
+
+
+def archive(product_ids, now=None):
+    """Move products to archived_product; the caller commits.
+
+    Their cart, wishlist, offer, review and image rows are deleted with them
+    (ON DELETE CASCADE); the image paths are kept on the archived row.
+    """
+    now = now or datetime.utcnow()
+    images = {}
+    for product_id, image_url in db.session.execute(
+            select(ProductImage.product_id, ProductImage.image_url).where(ProductImage.product_id.in_(product_ids))
+            .order_by(ProductImage.product_id, ProductImage.order_index, ProductImage.id)):
+        images.setdefault(product_id, []).append(image_url)
+    columns = [getattr(Product, name) for name in ARCHIVED_PRODUCT_COLUMNS]
+    rows = [dict(row._mapping, image_urls=json.dumps(images.get(row.id, [])), archived_at=now)
+            for row in db.session.execute(select(*columns).where(Product.id.in_(product_ids)))]
+    if rows:
+        db.session.execute(insert(ArchivedProduct), rows)
+        db.session.execute(delete(Product).where(Product.id.in_(product_ids)))
+
+
+def archive_products(older_than_days, batch_size=500, now=None):
+    """Move old sold listings to archived_product; returns the number moved"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        ids = _archivable_products(cutoff, batch_size)
+        if not ids:
+            return total
+        archive(ids, now)
+        db.session.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+
+def archive_messages(older_than_days, batch_size=500, now=None):
+    """Move messages older than the given age to archived_message; returns the number moved"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        ids = db.session.scalars(
+            select(Message.id).where(Message.created_at < cutoff).order_by(Message.created_at).limit(batch_size)).all()
+        if not ids:
+            return total
+        columns = [getattr(Message, name) for name in ARCHIVED_MESSAGE_COLUMNS]
+        db.session.execute(
+            insert(ArchivedMessage).from_select(
+                ARCHIVED_MESSAGE_COLUMNS + ('archived_at',),
+                select(*columns, literal(now)).where(Message.id.in_(ids))))
+        db.session.execute(delete(Message).where(Message.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+
+def prune_notifications(older_than_days, batch_size=500, now=None):
+    """Delete read notifications older than the given age; returns the number removed"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        ids = db.session.scalars(
+            select(Notification.id).where(Notification.is_read == True, Notification.created_at < cutoff)  # noqa: E712
+            .limit(batch_size)).all()
+        if not ids:
+            return total
+        db.session.execute(delete(Notification).where(Notification.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+
+def run(config, now=None):
+    """Apply every retention step enabled in config; returns rows handled per step"""
+    batch_size = config['RETENTION_BATCH_SIZE']
+    steps = (('products', archive_products, config['ARCHIVE_SOLD_AFTER_DAYS']),
+             ('messages', archive_messages, config['MESSAGE_ARCHIVE_AFTER_DAYS']),
+             ('notifications', prune_notifications, config['NOTIFICATION_RETENTION_DAYS']))
+    return {name: step(days, batch_size=batch_size, now=now) if days else 0 for name, step, days in steps}
+
+
+def table_sizes():
+    """Row counts of the hot tables and their archives"""
+    counts = {}
+    for name, model in (('product', Product), ('archived_product', ArchivedProduct), ('message', Message),
+                        ('archived_message', ArchivedMessage), ('notification', Notification)):
+        counts[name] = db.session.scalar(select(func.count()).select_from(model))
+    return counts
@@ -1,17 +1,31 @@
 import os
-from flask import render_template, flash, redirect, url_for, request, current_app
+import json
+from flask import (render_template, flash, redirect, url_for, request, current_app,
+                   Response, stream_with_context, abort, make_response)
 from flask_login import login_user, logout_user, current_user, login_required
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from app import db, bcrypt, csrf
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import joinedload
+from app import db, csrf, password_hasher
 from models import (User, Product, Cart, PurchaseHistory, ProductImage, Review, 
-                    Wishlist, Offer, Message, Notification)
+                    Wishlist, Offer, Message, Notification, Conversation, SavedSearch, ArchivedProduct)
 from forms import (LoginForm, RegistrationForm, EditProfileForm, ChangePasswordForm, 
                    ProductForm, SearchForm, ChatForm, EnhancedSearchForm, ReviewForm,
-                   OfferForm, MessageForm)
+                   OfferForm, MessageForm, BulkImportForm)
 from utils import (allowed_file, save_image, save_multiple_images, create_notification,
                    get_condition_badge_class, get_rating_stars)
 from ai_assistant import assistant
+import bulk_listings
+import catalog
+import messaging
+import realtime
+import jobs
+import ratings
+import saved_searches
+import shopping
+import suggest
+from tasks import view_counter
+from offers import OfferError, accept_offer, decline_offers_for_sold, default_expiry, reject_offer
 
 def register_routes(app):
     
@@ -31,11 +45,14 @@ def register_routes(app):
         if category:
             query = query.filter_by(category=category)
         
-        products = query.order_by(Product.created_at.desc()).paginate(
+        # Trending first; reads ix_product_trending (or its per-category twin) in order
+        products = query.order_by(Product.trending_score.desc(), Product.id.desc()).paginate(
             page=page, per_page=12, error_out=False)
+        did_you_mean = suggest.did_you_mean(search) if search and not products.items else None
         
         return render_template('index.html', title='EcoSwap - Sustainable Marketplace', 
-                             products=products, form=form, search=search, category=category)
+                             products=products, form=form, search=search, category=category,
+                             did_you_mean=did_you_mean)
 
     @app.route('/login', methods=['GET', 'POST'])
     def login():
@@ -45,8 +62,11 @@ def register_routes(app):
         form = LoginForm()
         if form.validate_on_submit():
             user = User.query.filter_by(email=form.email.data).first()
-            if user and user.password_hash and check_password_hash(user.password_hash, form.password.data):
+            if user and user.password_hash and password_hasher.verify(user.password_hash, form.password.data):
                 login_user(user)
+                # Upgrade hashes made with an older method or cost off the request path
+                if password_hasher.needs_rehash(user.password_hash):
+                    password_hasher.rehash_later(user.id, user.password_hash, form.password.data)
                 next_page = request.args.get('next')
                 flash('Login successful!', 'success')
                 return redirect(next_page) if next_page else redirect(url_for('index'))
@@ -64,7 +84,7 @@ def register_routes(app):
             user = User()
             user.username = form.username.data
             user.email = form.email.data
-            user.password_hash = generate_password_hash(form.password.data)
+            user.password_hash = password_hasher.hash(form.password.data)
             db.session.add(user)
             db.session.commit()
             flash('Registration successful!', 'success')
@@ -105,8 +125,8 @@ def register_routes(app):
     def change_password():
         form = ChangePasswordForm()
         if form.validate_on_submit():
-            if current_user.password_hash and check_password_hash(current_user.password_hash, form.current_password.data):
-                current_user.password_hash = generate_password_hash(form.new_password.data)
+            if current_user.password_hash and password_hasher.verify(current_user.password_hash, form.current_password.data):
+                current_user.password_hash = password_hasher.hash(form.new_password.data)
                 db.session.commit()
                 flash('Your password has been updated!', 'success')
                 return redirect(url_for('dashboard'))
@@ -119,27 +139,13 @@ def register_routes(app):
     @login_required
     def add_product():
         form = ProductForm()
-        current_app.logger.info(f"Add product request - Method: {request.method}, User: {current_user.username}")
-        
-        if request.method == 'POST':
-            current_app.logger.info("Form data received:")
-            current_app.logger.info(f"Title: {form.title.data}")
-            current_app.logger.info(f"Description: {form.description.data}")
-            current_app.logger.info(f"Price: {form.price.data}")
-            current_app.logger.info(f"Category: {form.category.data}")
-            current_app.logger.info(f"Has image: {bool(form.image.data)}")
-            current_app.logger.info(f"Form is valid: {form.validate()}")
         
         if form.validate_on_submit():
-            # Save main image with detailed logging
+            # Save main image
             image_url = ''
             if form.image.data:
-                current_app.logger.info(f"Processing main image: {form.image.data.filename}")
-                image_url = save_image(form.image.data)
-                if image_url:
-                    current_app.logger.info(f"Main image saved successfully: {image_url}")
-                else:
-                    current_app.logger.error(f"Failed to save main image: {form.image.data.filename}")
+                image_url = save_image(form.image.data, defer=True)
+                if not image_url:
                     flash('Main image could not be saved. Please try again with a different image.', 'warning')
             
             # Create product
@@ -156,11 +162,9 @@ def register_routes(app):
             db.session.add(product)
             db.session.flush()  # To get the product ID
             
-            # Save additional images with detailed logging
+            # Save additional images
             if form.additional_images.data:
-                current_app.logger.info(f"Processing additional images: {len(form.additional_images.data)} files")
-                additional_image_urls = save_multiple_images(form.additional_images.data)
-                current_app.logger.info(f"Successfully saved {len(additional_image_urls)} additional images")
+                additional_image_urls = save_multiple_images(form.additional_images.data, defer=True)
                 for i, img_url in enumerate(additional_image_urls):
                     product_image = ProductImage()
                     product_image.product_id = product.id
@@ -168,16 +172,15 @@ def register_routes(app):
                     product_image.order_index = i + 1
                     db.session.add(product_image)
             
+            jobs.enqueue('searches.match', [product.id])
+            # Hashes the photos, then warns the seller about listings with the same ones
+            jobs.enqueue('listings.duplicates', product.id)
             db.session.commit()
+            current_app.logger.info('Product %s listed', product.id)
             flash('Your product has been listed!', 'success')
             return redirect(url_for('my_listings'))
-        else:
-            # Log form validation errors for debugging
-            if form.errors:
-                current_app.logger.warning(f"Form validation errors: {form.errors}")
-                for field, errors in form.errors.items():
-                    for error in errors:
-                        current_app.logger.warning(f"Field {field}: {error}")
+        elif form.errors:
+            current_app.logger.debug('Add product validation failed: %s', form.errors)
         
         return render_template('add_product.html', title='Add Product', form=form)
 
@@ -197,7 +200,8 @@ def register_routes(app):
             product.price = form.price.data
             
             if form.image.data:
-                product.image_url = save_image(form.image.data)
+                product.image_url = save_image(form.image.data, defer=True)
+                jobs.enqueue('listings.duplicates', product.id)
             
             db.session.commit()
             flash('Product updated successfully!', 'success')
@@ -218,18 +222,28 @@ def register_routes(app):
             flash('You can only delete your own products.', 'danger')
             return redirect(url_for('index'))
         
-        db.session.delete(product)
-        db.session.commit()
+        bulk_listings.delete_listings(current_user.id, [product.id])
         flash('Product deleted successfully!', 'success')
         return redirect(url_for('my_listings'))
 
+    @app.route('/delete_listings', methods=['POST'])
+    @login_required
+    def delete_listings():
+        product_ids = request.form.getlist('product_ids', type=int)
+        if not product_ids:
+            flash('Select the listings to delete.', 'warning')
+            return redirect(url_for('my_listings'))
+        deleted = bulk_listings.delete_listings(current_user.id, product_ids)
+        flash(f'Deleted {deleted} listing{"s" if deleted != 1 else ""}.', 'success')
+        return redirect(url_for('my_listings'))
+
     @app.route('/product/<int:id>')
     def product_detail(id):
         product = Product.query.get_or_404(id)
         
-        # Increment view count
-        product.views += 1
-        db.session.commit()
+        # Views are buffered and added by a views.flush job
+        if view_counter.record(id):
+            db.session.commit()
         
         # Get reviews for this product
         reviews = Review.query.filter_by(product_id=id).order_by(Review.created_at.desc()).all()
@@ -267,11 +281,52 @@ def register_routes(app):
         
         return render_template('my_listings.html', title='My Listings', products=products)
 
+    @app.route('/import_listings', methods=['GET', 'POST'])
+    @login_required
+    def import_listings():
+        form = BulkImportForm()
+        if form.validate_on_submit():
+            fmt = bulk_listings.detect_format(form.listings_file.data.filename)
+            # Uploaded files are closed with the request, so keep private copies for the stream
+            listings_file = bulk_listings.spool_upload(form.listings_file.data)
+            images = None
+            if form.images_archive.data:
+                images = bulk_listings.ImageSource(archive=bulk_listings.spool_upload(form.images_archive.data))
+            owner_id = current_user.id
+            
+            def generate():
+                # One JSON line per row so progress shows while the import runs
+                try:
+                    for result in bulk_listings.import_listings(owner_id, listings_file, fmt, images=images):
+                        yield json.dumps(result) + '\n'
+                finally:
+                    listings_file.close()
+                    if images:
+                        images.close()
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        return render_template('import_listings.html', title='Import Listings', form=form)
+
+    @app.route('/export_listings/<fmt>')
+    @login_required
+    def export_listings(fmt):
+        if fmt not in ('csv', 'jsonl'):
+            abort(404)
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(bulk_listings.export_listings(current_user.id, fmt)), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename=listings.{fmt}'})
+
     @app.route('/add_to_cart/<int:id>')
     @login_required
     def add_to_cart(id):
+        if shopping.add_items(Cart, current_user.id, [id]):
+            db.session.commit()
+            flash('Product added to cart!', 'success')
+            return redirect(url_for('cart'))
+
+        # Nothing was inserted; work out why
         product = Product.query.get_or_404(id)
-        
         if product.owner == current_user:
             flash('You cannot add your own product to cart.', 'warning')
             return redirect(url_for('product_detail', id=id))
@@ -280,17 +335,7 @@ def register_routes(app):
             flash('This product is already sold.', 'warning')
             return redirect(url_for('product_detail', id=id))
         
-        existing_cart_item = Cart.query.filter_by(user_id=current_user.id, product_id=id).first()
-        if existing_cart_item:
-            flash('Product is already in your cart.', 'info')
-            return redirect(url_for('cart'))
-        
-        cart_item = Cart()
-        cart_item.user_id = current_user.id
-        cart_item.product_id = id
-        db.session.add(cart_item)
-        db.session.commit()
-        flash('Product added to cart!', 'success')
+        flash('Product is already in your cart.', 'info')
         return redirect(url_for('cart'))
 
     @app.route('/remove_from_cart/<int:id>')
@@ -305,9 +350,12 @@ def register_routes(app):
     @app.route('/cart')
     @login_required
     def cart():
-        cart_items = Cart.query.filter_by(user_id=current_user.id).all()
-        total = sum(item.product.price for item in cart_items if not item.product.is_sold)
-        return render_template('cart.html', title='Shopping Cart', cart_items=cart_items, total=total)
+        cart_items = (Cart.query.filter_by(user_id=current_user.id)
+                      .options(joinedload(Cart.product).joinedload(Product.owner))
+                      .order_by(Cart.added_at.desc(), Cart.id.desc()).all())
+        summary = shopping.summary(Cart, current_user.id)
+        return render_template('cart.html', title='Shopping Cart', cart_items=cart_items,
+                               summary=summary, total=summary['total'])
 
     @app.route('/checkout')
     @login_required
@@ -319,8 +367,10 @@ def register_routes(app):
             return redirect(url_for('cart'))
         
         # Process purchase
+        sold = []
         for cart_item in cart_items:
             if not cart_item.product.is_sold:
+                sold.append(cart_item.product_id)
                 # Create purchase history
                 purchase = PurchaseHistory()
                 purchase.user_id = current_user.id
@@ -335,6 +385,8 @@ def register_routes(app):
                 db.session.delete(cart_item)
         
         db.session.commit()
+        # Buyers with pending offers on these products are told they sold
+        decline_offers_for_sold(sold)
         flash('Purchase completed successfully!', 'success')
         return redirect(url_for('purchase_history'))
 
@@ -342,7 +394,9 @@ def register_routes(app):
     @login_required
     def purchase_history():
         page = request.args.get('page', 1, type=int)
-        purchases = PurchaseHistory.query.filter_by(user_id=current_user.id).order_by(
+        purchases = PurchaseHistory.query.filter_by(user_id=current_user.id).options(
+            joinedload(PurchaseHistory.product).joinedload(Product.owner),
+            joinedload(PurchaseHistory.archived_product).joinedload(ArchivedProduct.owner)).order_by(
             PurchaseHistory.purchase_date.desc()).paginate(
             page=page, per_page=10, error_out=False)
         
@@ -401,11 +455,14 @@ def register_routes(app):
     def api_quick_help(topic):
         """API endpoint for quick help responses"""
         try:
-            response = assistant.get_quick_help(topic)
-            return {
-                'response': response,
+            response = make_response({
+                'response': assistant.get_quick_help(topic),
                 'status': 'success'
-            }
+            })
+            # The answer only depends on the topic
+            response.cache_control.public = True
+            response.cache_control.max_age = current_app.config['QUICK_HELP_MAX_AGE']
+            return response
         except Exception as e:
             return {'error': 'Failed to get help', 'status': 'error'}, 500
 
@@ -415,49 +472,101 @@ def register_routes(app):
         form = EnhancedSearchForm()
         page = request.args.get('page', 1, type=int)
         
-        # Get search parameters
-        search = request.args.get('search', '', type=str)
-        category = request.args.get('category', '', type=str)
-        condition = request.args.get('condition', '', type=str)
-        min_price = request.args.get('min_price', type=float)
-        max_price = request.args.get('max_price', type=float)
-        location = request.args.get('location', '', type=str)
-        sort_by = request.args.get('sort_by', 'newest', type=str)
-        
-        # Build query
-        query = Product.query.filter_by(is_sold=False)
-        
-        if search:
-            query = query.filter(Product.title.contains(search) | Product.description.contains(search))
-        if category:
-            query = query.filter_by(category=category)
-        if condition:
-            query = query.filter_by(condition=condition)
-        if min_price is not None:
-            query = query.filter(Product.price >= min_price)
-        if max_price is not None:
-            query = query.filter(Product.price <= max_price)
-        if location:
-            query = query.filter(Product.location.contains(location))
-        
-        # Apply sorting
-        if sort_by == 'oldest':
-            query = query.order_by(Product.created_at.asc())
-        elif sort_by == 'price_low':
-            query = query.order_by(Product.price.asc())
-        elif sort_by == 'price_high':
-            query = query.order_by(Product.price.desc())
-        elif sort_by == 'popular':
-            query = query.order_by(Product.views.desc())
-        else:  # newest
-            query = query.order_by(Product.created_at.desc())
-        
+        values = catalog.search_args(request.args)
+        query = Product.query.filter(*catalog.search_filters(values)).order_by(*catalog.sort_order(values['sort_by']))
         products = query.paginate(page=page, per_page=12, error_out=False)
+        did_you_mean = None
+        if values['search'] and not products.items:
+            did_you_mean = suggest.did_you_mean(values['search'])
         
         return render_template('enhanced_search.html', title='Advanced Search', 
-                             products=products, form=form, search=search, 
-                             category=category, condition=condition, min_price=min_price,
-                             max_price=max_price, location=location, sort_by=sort_by)
+                             products=products, form=form, did_you_mean=did_you_mean, **values)
+
+    @app.route('/api/products')
+    def api_products():
+        """Search results as JSON: the search page's filters and sorts, ?fields= and ?cursor="""
+        try:
+            fields = catalog.parse_fields(request.args.get('fields', '', type=str))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        per_page = min(max(request.args.get('per_page', 24, type=int), 1), catalog.MAX_PER_PAGE)
+        items, next_cursor = catalog.search(catalog.search_args(request.args), fields,
+                                            cursor=request.args.get('cursor'), per_page=per_page,
+                                            static_url=url_for('static', filename=''))
+        return Response(catalog.dumps({'items': items, 'next_cursor': next_cursor}),
+                        mimetype='application/json')
+
+    @app.route('/api/products/<int:id>')
+    def api_product(id):
+        try:
+            fields = catalog.parse_fields(request.args.get('fields', '', type=str))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        item = catalog.get_product(id, fields, static_url=url_for('static', filename=''))
+        if item is None:
+            return {'error': 'Product not found'}, 404
+        return Response(catalog.dumps(item), mimetype='application/json')
+
+    @app.route('/api/suggest')
+    def api_suggest():
+        """Completions, typo fixes and categories for a partly typed search (?q=)"""
+        query = request.args.get('q', '', type=str)[:100]
+        limit = min(max(request.args.get('limit', 8, type=int), 1), suggest.MAX_SUGGESTIONS)
+        response = Response(catalog.dumps(dict(suggest.suggest(query, limit), query=query)),
+                            mimetype='application/json')
+        # Answers only change as listings come and go; not while the index is still being built
+        if suggest.suggester.index is not None:
+            response.cache_control.public = True
+            response.cache_control.max_age = current_app.config['SUGGEST_MAX_AGE']
+        return response
+
+    # Saved Searches
+    @app.route('/saved_searches')
+    @login_required
+    def saved_search_list():
+        searches = SavedSearch.query.filter_by(user_id=current_user.id).order_by(SavedSearch.created_at.desc()).all()
+        return render_template('saved_searches.html', title='Saved Searches', searches=searches,
+                             describe=saved_searches.describe)
+
+    @app.route('/saved_searches', methods=['POST'])
+    @login_required
+    def save_search():
+        values = {field: request.form.get(field, '').strip() for field in saved_searches.FILTER_FIELDS}
+        for field in ('min_price', 'max_price'):
+            try:
+                values[field] = float(values[field]) if values[field] else None
+            except ValueError:
+                values[field] = None
+        if not saved_searches.has_filters(values):
+            flash('Choose at least one keyword or filter before saving a search.', 'warning')
+            return redirect(url_for('enhanced_search'))
+        if SavedSearch.query.filter_by(user_id=current_user.id).count() >= current_app.config['MAX_SAVED_SEARCHES']:
+            flash('You have reached the limit of saved searches. Delete one to save another.', 'warning')
+            return redirect(url_for('saved_search_list'))
+        
+        search = saved_searches.save_search(current_user.id, values)
+        db.session.commit()
+        flash("Search saved! We'll notify you when new listings match.", 'success')
+        return redirect(url_for('enhanced_search', **saved_searches.search_args(search)))
+
+    @app.route('/saved_searches/<int:search_id>')
+    @login_required
+    def run_saved_search(search_id):
+        search = SavedSearch.query.get_or_404(search_id)
+        if search.user_id != current_user.id:
+            abort(404)
+        return redirect(url_for('enhanced_search', **saved_searches.search_args(search)))
+
+    @app.route('/saved_searches/<int:search_id>/delete', methods=['POST'])
+    @login_required
+    def delete_saved_search(search_id):
+        search = SavedSearch.query.get_or_404(search_id)
+        if search.user_id != current_user.id:
+            abort(404)
+        db.session.delete(search)
+        db.session.commit()
+        flash('Saved search deleted.', 'info')
+        return redirect(url_for('saved_search_list'))
 
     # Wishlist Routes
     @app.route('/wishlist')
@@ -472,23 +581,16 @@ def register_routes(app):
     @app.route('/add_to_wishlist/<int:id>')
     @login_required
     def add_to_wishlist(id):
+        if shopping.add_items(Wishlist, current_user.id, [id]):
+            db.session.commit()
+            flash('Product added to wishlist!', 'success')
+            return redirect(url_for('product_detail', id=id))
+
         product = Product.query.get_or_404(id)
-        
         if product.owner == current_user:
             flash('You cannot add your own product to wishlist.', 'warning')
-            return redirect(url_for('product_detail', id=id))
-        
-        existing_item = Wishlist.query.filter_by(user_id=current_user.id, product_id=id).first()
-        if existing_item:
-            flash('Product is already in your wishlist.', 'info')
         else:
-            wishlist_item = Wishlist()
-            wishlist_item.user_id = current_user.id
-            wishlist_item.product_id = id
-            db.session.add(wishlist_item)
-            db.session.commit()
-            flash('Product added to wishlist!', 'success')
-        
+            flash('Product is already in your wishlist.', 'info')
         return redirect(url_for('product_detail', id=id))
 
     @app.route('/remove_from_wishlist/<int:id>')
@@ -500,6 +602,40 @@ def register_routes(app):
         flash('Product removed from wishlist.', 'info')
         return redirect(url_for('wishlist'))
 
+    @app.route('/api/<any(cart, wishlist):kind>')
+    def api_shopping_list(kind):
+        """Items in the cart or wishlist with their totals"""
+        if not current_user.is_authenticated:
+            return {'error': 'Login required'}, 401
+        model = shopping.LISTS[kind]
+        return {'items': shopping.list_items(model, current_user.id),
+                'summary': shopping.summary(model, current_user.id)}
+
+    @app.route('/api/<any(cart, wishlist):kind>/items', methods=['POST', 'DELETE'])
+    def api_shopping_list_items(kind):
+        """Add (POST) or remove (DELETE) {"product_ids": [...]} in one request"""
+        if not current_user.is_authenticated:
+            return {'error': 'Login required'}, 401
+        data = request.get_json(silent=True)
+        product_ids = data.get('product_ids') if isinstance(data, dict) else None
+        if (not isinstance(product_ids, list) or not product_ids
+                or not all(type(product_id) is int for product_id in product_ids)):
+            return {'error': 'product_ids must be a non-empty list of integers'}, 400
+        if len(product_ids) > shopping.MAX_BATCH:
+            return {'error': f'At most {shopping.MAX_BATCH} product ids per request'}, 400
+
+        model = shopping.LISTS[kind]
+        if request.method == 'POST':
+            changed = shopping.add_items(model, current_user.id, product_ids)
+            result = {'added': changed}
+        else:
+            changed = shopping.remove_items(model, current_user.id, product_ids)
+            result = {'removed': changed}
+        result['skipped'] = sorted(set(product_ids) - set(changed))
+        result['summary'] = shopping.summary(model, current_user.id)
+        db.session.commit()
+        return result
+
     # Review Routes
     @app.route('/add_review/<int:product_id>', methods=['GET', 'POST'])
     @login_required
@@ -527,6 +663,7 @@ def register_routes(app):
                 comment=form.comment.data
             )
             db.session.add(review)
+            ratings.record_review(product_id, review.rating)
             db.session.commit()
             
             # Create notification for product owner
@@ -563,7 +700,8 @@ def register_routes(app):
                 product_id=product_id,
                 user_id=current_user.id,
                 amount=form.amount.data,
-                message=form.message.data
+                message=form.message.data,
+                expires_at=default_expiry()
             )
             db.session.add(offer)
             db.session.commit()
@@ -591,45 +729,20 @@ def register_routes(app):
             flash('You can only respond to offers on your products.', 'danger')
             return redirect(url_for('index'))
         
-        if action == 'accept':
-            offer.status = 'accepted'
-            # Mark product as sold
-            offer.product.is_sold = True
-            # Create purchase history
-            purchase = PurchaseHistory(
-                user_id=offer.user_id,
-                product_id=offer.product_id,
-                price_paid=offer.amount
-            )
-            db.session.add(purchase)
-            # Update user stats
-            current_user.total_sales += 1
-            offer.buyer.total_purchases += 1
-            
-            # Create notification for buyer
-            create_notification(
-                offer.user_id,
-                'Offer Accepted!',
-                f'Your offer for "{offer.product.title}" has been accepted!',
-                'success',
-                url_for('purchase_history')
-            )
-            
-            flash('Offer accepted! Product marked as sold.', 'success')
-        elif action == 'reject':
-            offer.status = 'rejected'
-            # Create notification for buyer
-            create_notification(
-                offer.user_id,
-                'Offer Declined',
-                f'Your offer for "{offer.product.title}" was declined.',
-                'info',
-                url_for('product_detail', id=offer.product_id)
-            )
-            flash('Offer rejected.', 'info')
-        
-        db.session.commit()
-        return redirect(url_for('product_detail', id=offer.product_id))
+        product_id = offer.product_id
+        try:
+            if action == 'accept':
+                # Also declines every competing offer and notifies those buyers
+                declined = accept_offer(offer)
+                flash('Offer accepted! Product marked as sold.'
+                      + (f' {declined} other offer(s) were declined.' if declined else ''), 'success')
+            elif action == 'reject':
+                reject_offer(offer)
+                flash('Offer rejected.', 'info')
+        except OfferError as e:
+            flash(str(e), 'warning')
+        
+        return redirect(url_for('product_detail', id=product_id))
 
     # User Profile Routes
     @app.route('/profile/<username>')
@@ -641,27 +754,43 @@ def register_routes(app):
         products = Product.query.filter_by(owner_id=user.id, is_sold=False).order_by(
             Product.created_at.desc()).paginate(page=page, per_page=8, error_out=False)
         
-        # Get user's reviews (as seller)
-        seller_reviews = []
-        for product in user.products:
-            seller_reviews.extend(product.reviews)
+        # Get user's reviews (as seller), one page at a time
+        cursor = request.args.get('cursor')
+        seller_reviews, next_cursor = ratings.seller_reviews(user.id, cursor=cursor)
+        histogram = ratings.rating_histogram(user.id)
         
         return render_template('user_profile.html', title=f'{user.username} - Profile', 
-                             user=user, products=products, seller_reviews=seller_reviews)
+                             user=user, products=products, seller_reviews=seller_reviews,
+                             histogram=histogram, cursor=cursor, next_cursor=next_cursor)
 
     # Messaging Routes
     @app.route('/messages')
     @login_required
     def messages():
-        page = request.args.get('page', 1, type=int)
-        received_messages = Message.query.filter_by(recipient_id=current_user.id).order_by(
-            Message.created_at.desc()).paginate(page=page, per_page=10, error_out=False)
-        
-        sent_messages = Message.query.filter_by(sender_id=current_user.id).order_by(
-            Message.created_at.desc()).all()
+        cursor = request.args.get('cursor')
+        conversations, next_cursor = messaging.inbox(current_user.id, cursor=cursor)
         
         return render_template('messages.html', title='Messages', 
-                             received_messages=received_messages, sent_messages=sent_messages)
+                             conversations=conversations, next_cursor=next_cursor, cursor=cursor)
+
+    @app.route('/messages/<int:conversation_id>')
+    @login_required
+    def conversation(conversation_id):
+        thread = Conversation.query.get_or_404(conversation_id)
+        if not thread.has_participant(current_user.id):
+            flash('Access denied.', 'danger')
+            return redirect(url_for('messages'))
+        
+        before = request.args.get('before', type=int)
+        thread_messages, older = messaging.thread(thread, before=before)
+        if not before:
+            messaging.mark_conversation_read(thread, current_user.id)
+            db.session.commit()
+            realtime.publish_counts(current_user.id)
+        
+        return render_template('conversation.html', title='Conversation', conversation=thread,
+                             other_user=thread.other_user(current_user.id),
+                             thread_messages=thread_messages, older=older)
 
     @app.route('/send_message/<int:recipient_id>', methods=['GET', 'POST'])
     @app.route('/send_message/<int:recipient_id>/<int:product_id>', methods=['GET', 'POST'])
@@ -679,13 +808,17 @@ def register_routes(app):
         if form.validate_on_submit():
             message = Message(
                 sender_id=current_user.id,
-                recipient_id=form.recipient_id.data,
-                product_id=form.product_id.data if form.product_id.data else None,
+                recipient_id=recipient_id,
+                product_id=product.id if product else None,
                 subject=form.subject.data,
                 content=form.content.data
             )
-            db.session.add(message)
+            thread = messaging.get_or_create_conversation(current_user.id, recipient_id, message.product_id)
+            messaging.record_message(thread, message)
             db.session.commit()
+            realtime.publish(recipient_id, 'message', {
+                'conversation_id': thread.id, 'from': current_user.username,
+                'preview': message.content[:messaging.PREVIEW_LENGTH]})
             
             # Create notification
             create_notification(
@@ -693,11 +826,11 @@ def register_routes(app):
                 'New Message',
                 f'{current_user.username} sent you a message',
                 'info',
-                url_for('messages')
+                url_for('conversation', conversation_id=thread.id)
             )
             
             flash('Message sent successfully!', 'success')
-            return redirect(url_for('messages'))
+            return redirect(url_for('conversation', conversation_id=thread.id))
         
         return render_template('send_message.html', title='Send Message', 
                              form=form, recipient=recipient, product=product)
@@ -711,8 +844,9 @@ def register_routes(app):
             flash('Access denied.', 'danger')
             return redirect(url_for('messages'))
         
-        message.is_read = True
+        messaging.mark_message_read(message)
         db.session.commit()
+        realtime.publish_counts(current_user.id)
         return redirect(url_for('messages'))
 
     # Notifications Routes
@@ -737,6 +871,7 @@ def register_routes(app):
         
         notification.is_read = True
         db.session.commit()
+        realtime.publish_counts(current_user.id)
         
         if notification.link:
             return redirect(notification.link)
@@ -747,6 +882,7 @@ def register_routes(app):
     def mark_all_notifications_read():
         Notification.query.filter_by(user_id=current_user.id, is_read=False).update({'is_read': True})
         db.session.commit()
+        realtime.publish_counts(current_user.id)
         flash('All notifications marked as read.', 'success')
         return redirect(url_for('notifications'))
 
@@ -762,6 +898,22 @@ def register_routes(app):
         total_views = sum(p.views for p in current_user.products)
         total_revenue = sum(p.purchase_history[0].price_paid for p in current_user.products if p.purchase_history)
         
+        # Listings moved to the archive by retention still count as sold
+        archived = db.session.execute(
+            select(ArchivedProduct.category, func.count(), func.coalesce(func.sum(ArchivedProduct.views), 0))
+            .where(ArchivedProduct.owner_id == current_user.id).group_by(ArchivedProduct.category)).all()
+        archived_count = sum(count for _, count, _ in archived)
+        total_products += archived_count
+        sold_products += archived_count
+        total_views += sum(views for _, _, views in archived)
+        if archived_count:
+            total_revenue += db.session.scalar(
+                select(func.coalesce(func.sum(PurchaseHistory.price_paid), 0))
+                .join(ArchivedProduct, ArchivedProduct.id == PurchaseHistory.product_id)
+                .where(ArchivedProduct.owner_id == current_user.id))
+        sold_ids = union_all(select(Product.id).where(Product.owner_id == current_user.id),
+                             select(ArchivedProduct.id).where(ArchivedProduct.owner_id == current_user.id))
+        
         # Get monthly sales data (last 6 months)
         from datetime import datetime, timedelta
         import calendar
@@ -777,8 +929,8 @@ def register_routes(app):
             month_start = date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
             next_month = month_start.replace(month=month_start.month + 1) if month_start.month < 12 else month_start.replace(year=month_start.year + 1, month=1)
             
-            sales_count = PurchaseHistory.query.join(Product).filter(
-                Product.owner_id == current_user.id,
+            sales_count = PurchaseHistory.query.filter(
+                PurchaseHistory.product_id.in_(sold_ids),
                 PurchaseHistory.purchase_date >= month_start,
                 PurchaseHistory.purchase_date < next_month
             ).count()
@@ -793,6 +945,10 @@ def register_routes(app):
             category_stats[product.category]['total'] += 1
             if product.is_sold:
                 category_stats[product.category]['sold'] += 1
+        for category, count, _ in archived:
+            stats = category_stats.setdefault(category, {'total': 0, 'sold': 0})
+            stats['total'] += count
+            stats['sold'] += count
         
         return render_template('analytics.html', title='Analytics Dashboard',
                              total_products=total_products, sold_products=sold_products,
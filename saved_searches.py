@@ -0,0 +1,140 @@
+"""Saved searches and matching new listings against them.
+
+Each saved search is filed under a single index key. The key is its longest
+search word, else its category, else its condition, else '*'. A new
+listing builds the keys it could be filed under: its words, its category
+and condition, plus '*'. It then fetches candidates with one
+``index_key IN (...)`` lookup on the index. The work per listing grows with
+the searches that share its words, not with the total number of saved searches.
+
+Search words match whole words of the title or description, case-insensitively
+and in any order, which is what the word index can answer. The search page
+matches the search text as a substring instead, so running a saved search can
+show more listings than it alerts about; the saved searches page says so.
+"""
+import re
+from collections import defaultdict
+
+from flask import url_for
+from sqlalchemy import select
+
+from app import db
+from models import Product, SavedSearch
+from utils import create_notifications
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+FILTER_FIELDS = ('search', 'category', 'condition', 'min_price', 'max_price', 'location')
+MATCH_CHUNK = 200
+
+
+def tokenize(text):
+    return set(WORD_RE.findall((text or '').lower()))
+
+
+def index_key(search):
+    words = tokenize(search.search)
+    if words:
+        # Longer words are usually rarer, which keeps posting lists short
+        return 't:' + max(sorted(words), key=len)
+    if search.category:
+        return 'c:' + search.category
+    if search.condition:
+        return 'k:' + search.condition
+    return '*'
+
+
+def listing_keys(product, words):
+    return {'t:' + word for word in words} | {'c:' + product.category, 'k:' + product.condition, '*'}
+
+
+def has_filters(values):
+    return any(values.get(field) not in (None, '') for field in FILTER_FIELDS)
+
+
+def save_search(user_id, values):
+    """Create a SavedSearch for user_id from a dict of EnhancedSearchForm values"""
+    search = SavedSearch(user_id=user_id, **{field: values.get(field) or None for field in FILTER_FIELDS})
+    search.index_key = index_key(search)
+    db.session.add(search)
+    return search
+
+
+def search_args(search):
+    """Query string arguments that re-run search on the enhanced search page"""
+    return {field: getattr(search, field) for field in FILTER_FIELDS if getattr(search, field) not in (None, '')}
+
+
+def matches(search, product, words):
+    """Whether product (with its title/description words) satisfies every filter of search"""
+    if search.category and search.category != product.category:
+        return False
+    if search.condition and search.condition != product.condition:
+        return False
+    if search.min_price is not None and product.price < search.min_price:
+        return False
+    if search.max_price is not None and product.price > search.max_price:
+        return False
+    if search.location and search.location.lower() not in (product.location or '').lower():
+        return False
+    return tokenize(search.search) <= words
+
+
+def describe(search):
+    """Short human label for a saved search"""
+    parts = []
+    if search.search:
+        parts.append(f'"{search.search}"')
+    if search.category:
+        parts.append(f'in {search.category}')
+    if search.condition:
+        parts.append(search.condition)
+    if search.min_price is not None or search.max_price is not None:
+        low = f'${search.min_price:.2f}' if search.min_price is not None else '$0'
+        high = f'${search.max_price:.2f}' if search.max_price is not None else 'any'
+        parts.append(f'{low}-{high}')
+    if search.location:
+        parts.append(f'near {search.location}')
+    return ' '.join(parts) or 'for everything'
+
+
+def match_new_listings(product_ids):
+    """Notify owners of saved searches that match the new products; returns notifications sent.
+
+    One notification goes out per saved search, however many of the products match it.
+    """
+    hits = defaultdict(list)
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), MATCH_CHUNK):
+        products = db.session.scalars(
+            select(Product).where(Product.id.in_(product_ids[start:start + MATCH_CHUNK]),
+                                  Product.is_sold == False)).all()  # noqa: E712
+        if not products:
+            continue
+        words = {product.id: tokenize(f'{product.title} {product.description}') for product in products}
+        keys = {product.id: listing_keys(product, words[product.id]) for product in products}
+        candidates = db.session.scalars(
+            select(SavedSearch).where(SavedSearch.index_key.in_(set().union(*keys.values())))).all()
+        by_key = defaultdict(list)
+        for search in candidates:
+            by_key[search.index_key].append(search)
+        for product in products:
+            for key in keys[product.id]:
+                for search in by_key.get(key, ()):
+                    if search.user_id != product.owner_id and matches(search, product, words[product.id]):
+                        hits[search].append(product)
+
+    notifications = []
+    for search, products in hits.items():
+        label = describe(search)
+        if len(products) == 1:
+            notifications.append(dict(
+                user_id=search.user_id, title='New Match for Your Search', type='info',
+                message=f'"{products[0].title}" matches your saved search {label}.',
+                link=url_for('product_detail', id=products[0].id)))
+        else:
+            notifications.append(dict(
+                user_id=search.user_id, title='New Matches for Your Search', type='info',
+                message=f'{len(products)} new listings match your saved search {label}.',
+                link=url_for('run_saved_search', search_id=search.id)))
+    return create_notifications(notifications)
+
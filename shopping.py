@@ -0,0 +1,100 @@
+"""Batch cart and wishlist changes for the JSON API.
+
+add_items() inserts any number of products with one INSERT ... SELECT ...
+ON CONFLICT DO NOTHING. The SELECT drops ids that do not exist, belong to the
+user or (for the cart) are sold. The unique constraint drops ids already
+present, so double clicks and concurrent tabs need no existence check.
+RETURNING reports which ids were really added; MySQL has no RETURNING, so
+there the ids are compared before and after the statement. summary() counts items and
+totals the available ones in a single aggregate over the join with Product.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from models import Cart, Product, Wishlist
+
+# Most product ids one request may add or remove
+MAX_BATCH = 100
+
+LISTS = {'cart': Cart, 'wishlist': Wishlist}
+
+
+def _dialect(table):
+    return db.session.get_bind(clause=table).dialect
+
+
+def _insert_ignore(table):
+    """INSERT that skips rows violating a unique constraint"""
+    dialect = _dialect(table).name
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return insert(table).prefix_with('IGNORE')
+    raise NotImplementedError(f'No INSERT ... ON CONFLICT DO NOTHING for {dialect}')
+
+
+def _present(model, user_id, product_ids):
+    return set(db.session.scalars(select(model.product_id).where(
+        model.user_id == user_id, model.product_id.in_(product_ids))))
+
+
+def add_items(model, user_id, product_ids):
+    """Add products to the user's cart or wishlist; returns the ids added"""
+    if not product_ids:
+        return []
+    candidates = select(literal(user_id), Product.id, literal(datetime.utcnow())).where(
+        Product.id.in_(set(product_ids)), Product.owner_id != user_id)
+    if model is Cart:
+        candidates = candidates.where(Product.is_sold == False)  # noqa: E712
+    stmt = _insert_ignore(model.__table__).from_select(['user_id', 'product_id', 'added_at'], candidates)
+    if _dialect(model.__table__).insert_returning:
+        return sorted(db.session.execute(stmt.returning(model.product_id)).scalars())
+    before = _present(model, user_id, set(product_ids))
+    db.session.execute(stmt)
+    return sorted(_present(model, user_id, set(product_ids)) - before)
+
+
+def remove_items(model, user_id, product_ids):
+    """Remove products from the user's cart or wishlist; returns the ids removed"""
+    if not product_ids:
+        return []
+    stmt = delete(model).where(model.user_id == user_id, model.product_id.in_(set(product_ids)))
+    if _dialect(model.__table__).delete_returning:
+        return sorted(db.session.execute(stmt.returning(model.product_id)).scalars())
+    removed = _present(model, user_id, set(product_ids))
+    db.session.execute(stmt)
+    return sorted(removed)
+
+
+def count_items(model, user_id):
+    """Number of items in the user's cart or wishlist"""
+    return db.session.scalar(select(func.count(model.id)).where(model.user_id == user_id))
+
+
+def summary(model, user_id):
+    """Item count, available count and total price of the available items"""
+    available = Product.is_sold == False  # noqa: E712
+    items, available_items, total = db.session.execute(
+        select(func.count(model.id),
+               func.coalesce(func.sum(case((available, 1), else_=0)), 0),
+               func.coalesce(func.sum(case((available, Product.price), else_=0)), 0))
+        .select_from(model).join(Product, Product.id == model.product_id)
+        .where(model.user_id == user_id)).one()
+    return {'items': items, 'available': int(available_items), 'total': round(float(total), 2)}
+
+
+def list_items(model, user_id):
+    """The user's items, newest first, as dicts for the API"""
+    rows = db.session.execute(
+        select(Product.id, Product.title, Product.price, Product.is_sold, Product.image_url, model.added_at)
+        .select_from(model).join(Product, Product.id == model.product_id)
+        .where(model.user_id == user_id)
+        .order_by(model.added_at.desc(), model.id.desc()))
+    return [{'product_id': row.id, 'title': row.title, 'price': row.price, 'is_sold': row.is_sold,
+             'image_url': row.image_url, 'added_at': row.added_at.isoformat() if row.added_at else None}
+            for row in rows]
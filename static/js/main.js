@@ -108,20 +108,64 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Add to cart with feedback
-    const cartButtons = document.querySelectorAll('a[href*="add_to_cart"]');
+    // Cart and wishlist changes go through the JSON API without leaving the page.
+    // Anything not added falls back to the plain link so the server explains why.
+    const cartButtons = document.querySelectorAll('[data-cart-add]');
     cartButtons.forEach(button => {
         button.addEventListener('click', function(e) {
-            // Add visual feedback
+            e.preventDefault();
             const originalText = this.innerHTML;
             this.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i>Adding...';
             this.classList.add('loading');
-            
-            // Allow the navigation to proceed
-            setTimeout(() => {
-                this.innerHTML = originalText;
+            updateList('cart', 'POST', [Number(this.dataset.cartAdd)]).then(result => {
+                if (!result.added.length) {
+                    window.location = this.href;
+                    return;
+                }
+                showCartSummary(result.summary);
+                this.innerHTML = '<i class="fas fa-check me-1"></i>In Cart';
                 this.classList.remove('loading');
-            }, 1000);
+                this.classList.add('disabled');
+            }).catch(() => {
+                this.innerHTML = originalText;
+                window.location = this.href;
+            });
+        });
+    });
+
+    const cartRemoveButtons = document.querySelectorAll('[data-cart-remove]');
+    cartRemoveButtons.forEach(button => {
+        button.addEventListener('click', function(e) {
+            // The inline confirm() already cancelled the click
+            if (e.defaultPrevented) return;
+            e.preventDefault();
+            const productId = Number(this.dataset.cartRemove);
+            updateList('cart', 'DELETE', [productId]).then(result => {
+                const item = document.querySelector(`[data-cart-item="${productId}"]`);
+                if (item) item.remove();
+                showCartSummary(result.summary);
+                // The empty cart and "nothing available" states are rendered by the server
+                if (!result.summary.available) window.location.reload();
+            }).catch(() => {
+                window.location = this.href;
+            });
+        });
+    });
+
+    const wishlistButtons = document.querySelectorAll('[data-wishlist-add]');
+    wishlistButtons.forEach(button => {
+        button.addEventListener('click', function(e) {
+            e.preventDefault();
+            updateList('wishlist', 'POST', [Number(this.dataset.wishlistAdd)]).then(result => {
+                if (!result.added.length) {
+                    window.location = this.href;
+                    return;
+                }
+                this.classList.add('disabled');
+                this.title = 'In your wishlist';
+            }).catch(() => {
+                window.location = this.href;
+            });
         });
     });
 
@@ -157,15 +201,6 @@ document.addEventListener('DOMContentLoaded', function() {
         lazyImages.forEach(img => imageObserver.observe(img));
     }
 
-    // Cart count update
-    function updateCartCount() {
-        const cartBadge = document.querySelector('.navbar-nav .badge');
-        if (cartBadge) {
-            // This would be enhanced with AJAX calls in a real application
-            // For now, the count is updated on page reload
-        }
-    }
-
     // Back to top button
     const backToTopBtn = document.createElement('button');
     backToTopBtn.innerHTML = '<i class="fas fa-chevron-up"></i>';
@@ -228,6 +263,163 @@ function formatDate(date) {
     }).format(new Date(date));
 }
 
+// Batch add (POST) or remove (DELETE) products through /api/cart or /api/wishlist
+function updateList(kind, method, productIds) {
+    const token = document.querySelector('meta[name="csrf-token"]');
+    return fetch(`/api/${kind}/items`, {
+        method: method,
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': token ? token.content : ''
+        },
+        body: JSON.stringify({ product_ids: productIds })
+    }).then(response => {
+        if (!response.ok) throw new Error(response.statusText);
+        return response.json();
+    });
+}
+
+function showCartSummary(summary) {
+    setBadge('cart-badge', summary.items);
+    const fields = {
+        'cart-items': summary.items,
+        'cart-available': summary.available,
+        'cart-total': formatCurrency(summary.total)
+    };
+    Object.entries(fields).forEach(([id, value]) => {
+        const field = document.getElementById(id);
+        if (field) field.textContent = value;
+    });
+}
+
+// Live badge counts pushed by the server over /events
+function setBadge(id, count) {
+    const badge = document.getElementById(id);
+    if (!badge) return;
+    badge.textContent = count > 99 ? '99+' : count;
+    badge.classList.toggle('d-none', !count);
+}
+
+function connectEvents() {
+    const url = document.body.dataset.eventsUrl;
+    if (!url || !window.EventSource) return;
+
+    // EventSource reconnects on its own; the first event after a reconnect is a fresh count
+    const source = new EventSource(url);
+    source.addEventListener('counts', function(e) {
+        const counts = JSON.parse(e.data);
+        setBadge('notifications-badge', counts.notifications);
+        setBadge('messages-badge', counts.messages);
+    });
+    window.addEventListener('pagehide', function() {
+        source.close();
+    });
+}
+
+document.addEventListener('DOMContentLoaded', connectEvents);
+
+// Search suggestions from /api/suggest, fetched once typing pauses
+const SUGGEST_DELAY_MS = 150;
+
+function setupSuggestions(input) {
+    const form = input.form;
+    const menu = document.createElement('div');
+    menu.className = 'dropdown-menu w-100';
+    menu.style.cssText = 'top: 100%; left: 0;';
+    menu.setAttribute('role', 'listbox');
+    input.parentNode.classList.add('position-relative');
+    input.parentNode.appendChild(menu);
+    let timer = null;
+    let pending = null;
+    let active = -1;
+
+    function close() {
+        menu.classList.remove('show');
+        active = -1;
+    }
+
+    function choose(item) {
+        input.value = item.dataset.query;
+        const category = form.querySelector('select[name="category"]');
+        if (item.dataset.category && category) category.value = item.dataset.category;
+        close();
+        form.submit();
+    }
+
+    function addItem(label, query, category) {
+        const item = document.createElement('button');
+        item.type = 'button';
+        item.className = 'dropdown-item';
+        item.setAttribute('role', 'option');
+        item.textContent = label;
+        item.dataset.query = query;
+        if (category) item.dataset.category = category;
+        // mousedown fires before the input's blur closes the menu
+        item.addEventListener('mousedown', function(e) {
+            e.preventDefault();
+            choose(this);
+        });
+        menu.appendChild(item);
+    }
+
+    function show(result) {
+        menu.innerHTML = '';
+        if (result.corrected && result.suggestions.length) {
+            const header = document.createElement('h6');
+            header.className = 'dropdown-header';
+            header.textContent = 'Did you mean';
+            menu.appendChild(header);
+        }
+        result.suggestions.forEach(text => addItem(text, text));
+        result.categories.forEach(category => addItem(`in ${category}`, input.value.trim(), category));
+        menu.classList.toggle('show', menu.children.length > 0 && document.activeElement === input);
+        active = -1;
+    }
+
+    function fetchSuggestions() {
+        const query = input.value;
+        if (!query.trim()) {
+            close();
+            return;
+        }
+        // Only the answer for the latest keystroke matters
+        if (pending) pending.abort();
+        pending = new AbortController();
+        fetch(`/api/suggest?q=${encodeURIComponent(query)}`, { signal: pending.signal })
+            .then(response => response.ok ? response.json() : null)
+            .then(result => {
+                if (result && result.query === input.value.slice(0, 100)) show(result);
+            })
+            .catch(() => {});
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(fetchSuggestions, SUGGEST_DELAY_MS);
+    });
+
+    input.addEventListener('keydown', function(e) {
+        const items = menu.querySelectorAll('.dropdown-item');
+        if (!menu.classList.contains('show') || !items.length) return;
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            active = (active + (e.key === 'ArrowDown' ? 1 : -1) + items.length) % items.length;
+            items.forEach((item, index) => item.classList.toggle('active', index === active));
+        } else if (e.key === 'Enter' && active >= 0) {
+            e.preventDefault();
+            choose(items[active]);
+        } else if (e.key === 'Escape') {
+            close();
+        }
+    });
+
+    input.addEventListener('blur', close);
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('input[data-suggest]').forEach(setupSuggestions);
+});
+
 // Error handling for images
 document.addEventListener('error', function(e) {
     if (e.target.tagName === 'IMG') {
@@ -0,0 +1,278 @@
+"""Search suggestions for /api/suggest: word completion and one-typo corrections.
+
+Each web process keeps a SuggestIndex of the words in unsold listing titles,
+each with the number of listings that use it, plus the category names. The
+words are kept in a sorted list, so the completions of a prefix are the
+slice between two bisects. The slices of one and two letter prefixes span
+much of the vocabulary, so their best completions are cached. A word the
+index does not know is corrected to the most used known word one edit away
+(a deletion, transposition, substitution or insertion). Those candidates are
+a few hundred dictionary lookups, not a scan.
+
+Memory is bounded by SUGGEST_MAX_TERMS: only the most used words are kept.
+The index is built in a background thread the first time it is asked for,
+and suggestions are empty until it is ready. After that, listings added
+since the last look are folded into a copy of the index at most every
+SUGGEST_REFRESH_SECONDS, and the copy replaces it. The
+index is rebuilt from scratch every SUGGEST_REBUILD_SECONDS, so words of
+sold, edited and deleted listings drop out.
+"""
+import copy
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from itertools import groupby
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from models import Product
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+')
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+# Prefixes this short have their best completions cached
+CACHED_PREFIX_LENGTH = 2
+MAX_SUGGESTIONS = 10
+# Typos are only corrected in words at least this long
+MIN_CORRECTION_LENGTH = 3
+
+
+def words(text):
+    """Lowercase words of text, as the index stores them"""
+    return [word for word in WORD_RE.findall(text.lower()) if len(word) > 1]
+
+
+def edits(word):
+    """Strings one deletion, transposition, substitution or insertion away from word"""
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    candidates = set()
+    for head, tail in splits:
+        if tail:
+            candidates.add(head + tail[1:])
+            for letter in ALPHABET:
+                candidates.add(head + letter + tail[1:])
+        if len(tail) > 1:
+            candidates.add(head + tail[1] + tail[0] + tail[2:])
+        for letter in ALPHABET:
+            candidates.add(head + letter + tail)
+    candidates.discard(word)
+    return candidates
+
+
+class SuggestIndex:
+    """Known title words with their listing counts, and the category names"""
+
+    def __init__(self, counts, categories=(), max_terms=200000, last_id=0):
+        if len(counts) > max_terms:
+            counts = dict(heapq.nlargest(max_terms, counts.items(), key=lambda item: item[1]))
+        self.counts = dict(counts)
+        self.terms = sorted(self.counts)
+        self.categories = sorted(set(categories))
+        self.max_terms = max_terms
+        self.last_id = last_id
+        self._cached = {}
+        for length in range(1, CACHED_PREFIX_LENGTH + 1):
+            for prefix, group in groupby(self.terms, key=lambda term: term[:length]):
+                if len(prefix) == length:
+                    self._cached[prefix] = heapq.nlargest(MAX_SUGGESTIONS, group, key=self.counts.__getitem__)
+
+    @classmethod
+    def build(cls, rows, max_terms=200000):
+        """Index (id, title, category) rows"""
+        counts = {}
+        categories = set()
+        last_id = 0
+        for product_id, title, category in rows:
+            for word in set(words(title)):
+                counts[word] = counts.get(word, 0) + 1
+            if category:
+                categories.add(category)
+            last_id = max(last_id, product_id)
+        return cls(counts, categories, max_terms, last_id)
+
+    def add(self, rows):
+        """A copy of the index with (id, title, category) rows of new listings folded in.
+
+        The index itself is left alone, since requests may be reading it.
+        New words are only taken while there is room under max_terms; the
+        next rebuild decides which words are worth keeping.
+        """
+        index = copy.copy(self)
+        index.counts = dict(self.counts)
+        index.terms = list(self.terms)
+        index.categories = list(self.categories)
+        index._cached = dict(self._cached)
+        index._fold(rows)
+        return index
+
+    def _fold(self, rows):
+        for product_id, title, category in rows:
+            for word in set(words(title)):
+                if word in self.counts:
+                    self.counts[word] += 1
+                elif len(self.counts) < self.max_terms:
+                    self.counts[word] = 1
+                    insort(self.terms, word)
+                else:
+                    continue
+                for length in range(1, min(len(word), CACHED_PREFIX_LENGTH) + 1):
+                    self._cached.pop(word[:length], None)
+            if category and category not in self.categories:
+                insort(self.categories, category)
+            self.last_id = max(self.last_id, product_id)
+
+    def complete(self, prefix, limit=MAX_SUGGESTIONS):
+        """Known words starting with prefix, most used first"""
+        if len(prefix) <= CACHED_PREFIX_LENGTH:
+            best = self._cached.get(prefix)
+            if best is None:
+                best = self._cached[prefix] = self._best(prefix, MAX_SUGGESTIONS)
+            return best[:limit]
+        return self._best(prefix, limit)
+
+    def _best(self, prefix, limit):
+        start = bisect_left(self.terms, prefix)
+        end = bisect_left(self.terms, prefix + '\U0010ffff', start)
+        return heapq.nlargest(limit, self.terms[start:end], key=self.counts.__getitem__)
+
+    def correct(self, word):
+        """The most used known word one edit from word, or None"""
+        if word in self.counts or len(word) < MIN_CORRECTION_LENGTH:
+            return None
+        known = [candidate for candidate in edits(word) if candidate in self.counts]
+        return max(known, key=self.counts.__getitem__) if known else None
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        """Completions of query's last word and matching categories.
+
+        Earlier words with a typo are corrected. So is the last word, once
+        it has no completions as typed. Returns a dict for the API.
+        """
+        # Unlike the index, keep one letter words: the last one is a prefix being typed
+        typed = WORD_RE.findall(query.lower())
+        if not typed:
+            return {'suggestions': [], 'categories': [], 'corrected': False}
+        head = []
+        corrected = False
+        for word in typed[:-1]:
+            fix = self.correct(word)
+            corrected = corrected or fix is not None
+            head.append(fix or word)
+        last = typed[-1]
+        if query[-1:].isspace():
+            # The last word is finished; only fix it
+            fix = self.correct(last)
+            completions = [fix] if fix else []
+            corrected = corrected or fix is not None
+        else:
+            completions = self.complete(last, limit)
+            if not completions and len(last) >= MIN_CORRECTION_LENGTH:
+                candidates = set()
+                for prefix in edits(last):
+                    candidates.update(self.complete(prefix, limit))
+                completions = heapq.nlargest(limit, candidates, key=self.counts.__getitem__)
+                corrected = bool(completions)
+        prefix = ' '.join(head + [last])
+        categories = [category for category in self.categories
+                      if category.lower().startswith(prefix)
+                      or any(word.startswith(last) for word in words(category))]
+        return {'suggestions': [' '.join(head + [word]) for word in completions],
+                'categories': categories[:limit], 'corrected': corrected}
+
+    def did_you_mean(self, query):
+        """query with each misspelled word corrected, or None if nothing changed"""
+        typed = WORD_RE.findall(query.lower())
+        fixed = [self.correct(word) or word for word in typed]
+        return ' '.join(fixed) if fixed != typed else None
+
+
+def _listings(after_id=0):
+    return (select(Product.id, Product.title, Product.category)
+            .where(Product.is_sold == False, Product.id > after_id)  # noqa: E712
+            .order_by(Product.id))
+
+
+class Suggester:
+    """The process's SuggestIndex, kept fresh as described in the module docstring"""
+
+    def __init__(self):
+        self.index = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._built_at = 0.0
+        self._refreshed_at = 0.0
+
+    def get(self):
+        """The current index, or None while the first build runs"""
+        config = current_app.config
+        now = time.monotonic()
+        if self.index is None or now - self._built_at >= config['SUGGEST_REBUILD_SECONDS']:
+            self._start_build(current_app._get_current_object())
+        elif now - self._refreshed_at >= config['SUGGEST_REFRESH_SECONDS']:
+            self.refresh()
+        return self.index
+
+    def _start_build(self, app):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build, args=(app,), name='suggest-build', daemon=True).start()
+
+    def _build(self, app):
+        start = time.perf_counter()
+        try:
+            with app.app_context():
+                rows = db.session.execute(_listings().execution_options(yield_per=10000))
+                index = SuggestIndex.build(rows, app.config['SUGGEST_MAX_TERMS'])
+                db.session.remove()
+            with self._lock:
+                self.index = index
+                self._built_at = self._refreshed_at = time.monotonic()
+            logger.info('Built the suggestion index (%d words) in %.0f ms',
+                        len(index.terms), (time.perf_counter() - start) * 1000)
+        except Exception:
+            logger.exception('Building the suggestion index failed')
+        finally:
+            self._building = False
+
+    def refresh(self):
+        """Fold in listings added since the index last looked"""
+        if self.index is None or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._refreshed_at = time.monotonic()
+            # Swapped in whole: requests holding the old index never see a half-added one
+            self.index = self.index.add(db.session.execute(_listings(self.index.last_id)))
+        finally:
+            self._lock.release()
+
+
+suggester = Suggester()
+
+
+def suggest(query, limit=MAX_SUGGESTIONS):
+    """SuggestIndex.suggest() on the process's index; empty while it is being built"""
+    index = suggester.get()
+    if index is None:
+        return {'suggestions': [], 'categories': [], 'corrected': False}
+    return index.suggest(query, limit)
+
+
+def did_you_mean(query):
+    """query with its typos corrected, or None"""
+    index = suggester.get()
+    return index.did_you_mean(query) if index is not None else None
+
+
+def init_app(app):
+    app.config.setdefault('SUGGEST_MAX_TERMS', 200000)
+    app.config.setdefault('SUGGEST_REFRESH_SECONDS', 30)
+    app.config.setdefault('SUGGEST_REBUILD_SECONDS', 3600)
+    app.config.setdefault('SUGGEST_MAX_AGE', 60)
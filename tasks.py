@@ -0,0 +1,139 @@
+"""Jobs run by `flask jobs worker`, and the view counter that feeds one of them."""
+import os
+import threading
+import time
+
+from flask import current_app, url_for
+from sqlalchemy import case, update
+
+import duplicates
+import jobs
+import offers
+import retention
+import saved_searches
+import trending
+import wishlist_alerts
+from app import db
+from models import Product
+from utils import create_notification, delete_uploads, optimize_upload
+
+# Uploads are resized when saved; this finishes images.optimize jobs queued before that.
+# Pure function without database access, so it can run in the process pool
+jobs.job('images.optimize', lane='low', cpu=True)(optimize_upload)
+jobs.job('uploads.delete', lane='low')(delete_uploads)
+
+
+@jobs.job('images.backfill_hashes', lane='low')
+def backfill_image_hashes():
+    duplicates.backfill(os.path.join(current_app.root_path, 'static', 'uploads'),
+                        max_decode_bytes=current_app.config['IMAGE_MAX_DECODE_MB'] * 1024 * 1024)
+
+
+@jobs.job('listings.duplicates')
+def check_duplicates(product_id):
+    """Hash a listing's new photos, then warn its seller if other listings have the same ones"""
+    product = db.session.get(Product, product_id)
+    if product is None:
+        return
+    duplicates.hash_listing(product, max_decode_bytes=current_app.config['IMAGE_MAX_DECODE_MB'] * 1024 * 1024)
+    db.session.commit()
+    matches = duplicates.find_duplicates(product, current_app.config['DUPLICATE_IMAGE_DISTANCE'])
+    if not matches:
+        return
+    # Same photos as another listing usually means the same item listed twice
+    current_app.logger.info('Product %s looks like a duplicate of %s', product.id, [match.id for match, _ in matches])
+    titles = ', '.join(f'"{match.title}"' for match, _ in matches)
+    if any(match.owner_id == product.owner_id for match, _ in matches):
+        message = (f'The photos of "{product.title}" look like ones on your listings {titles}. If this is '
+                   'the same item, please edit or delete the older listing instead of listing it twice.')
+    else:
+        message = (f'The photos of "{product.title}" look like ones on other listings ({titles}). '
+                   'Please only list items you own and photographed yourself.')
+    create_notification(product.owner_id, 'Possible duplicate listing', message, 'warning',
+                        url_for('edit_product', id=product.id))
+
+
+@jobs.job('searches.match')
+def match_saved_searches(product_ids):
+    saved_searches.match_new_listings(product_ids)
+
+
+@jobs.job('wishlist.alerts')
+def send_wishlist_alerts(product_id, kind, old_price=None, new_price=None):
+    wishlist_alerts.send_alerts(product_id, kind, old_price, new_price,
+                                window_hours=current_app.config['WISHLIST_ALERT_WINDOW_HOURS'])
+
+
+@jobs.job('offers.expire', lane='high')
+def expire_offers():
+    offers.expire_offers(now=jobs.current_time())
+
+
+@jobs.job('views.flush', lane='low')
+def add_views(counts):
+    """Add buffered product view counts in one UPDATE"""
+    counts = {int(product_id): count for product_id, count in counts.items()}
+    added = case(counts, value=Product.id, else_=0)
+    # pending_views is consumed by trending.rollup
+    db.session.execute(
+        update(Product).where(Product.id.in_(counts))
+        .values(views=Product.views + added, pending_views=Product.pending_views + added))
+    db.session.commit()
+
+
+@jobs.job('trending.rollup', lane='low')
+def rollup_trending():
+    trending.rollup()
+
+
+@jobs.job('retention.run', lane='low')
+def apply_retention():
+    retention.run(current_app.config)
+
+
+class ViewCounter:
+    """Buffers product views in memory and hands them to a views.flush job.
+
+    Replaces an UPDATE + commit per product page view. Views counted since
+    the last flush are lost if the process dies.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, product_id):
+        """Count a view; enqueues (but does not commit) a flush when one is due"""
+        config = current_app.config
+        with self._lock:
+            self._counts[product_id] = self._counts.get(product_id, 0) + 1
+            due = (time.monotonic() - self._last_flush >= config['VIEW_FLUSH_SECONDS']
+                   or len(self._counts) >= config['VIEW_FLUSH_MAX_PRODUCTS'])
+            if not due:
+                return False
+            counts, self._counts = self._counts, {}
+            self._last_flush = time.monotonic()
+        jobs.enqueue('views.flush', counts)
+        return True
+
+
+view_counter = ViewCounter()
+
+
+def init_app(app):
+    app.config.setdefault('VIEW_FLUSH_SECONDS', 10)
+    app.config.setdefault('VIEW_FLUSH_MAX_PRODUCTS', 500)
+    app.config.setdefault('OFFER_SWEEP_SECONDS', 60)
+    if app.config['OFFER_SWEEP_SECONDS']:
+        jobs.every(app.config['OFFER_SWEEP_SECONDS'], 'offers.expire')
+    app.config.setdefault('TRENDING_ROLLUP_SECONDS', 300)
+    if app.config['TRENDING_ROLLUP_SECONDS']:
+        jobs.every(app.config['TRENDING_ROLLUP_SECONDS'], 'trending.rollup')
+    app.config.setdefault('RETENTION_SECONDS', 3600)
+    app.config.setdefault('RETENTION_BATCH_SIZE', 500)
+    app.config.setdefault('ARCHIVE_SOLD_AFTER_DAYS', 90)
+    app.config.setdefault('MESSAGE_ARCHIVE_AFTER_DAYS', 365)
+    app.config.setdefault('NOTIFICATION_RETENTION_DAYS', 30)
+    if app.config['RETENTION_SECONDS']:
+        jobs.every(app.config['RETENTION_SECONDS'], 'retention.run')
@@ -0,0 +1,139 @@
+-- Schema the original models created (db.create_all() on SQLite), before any migration.
+-- tests/test_database.py upgrades a database created from it with database.sync_schema.
+
+CREATE TABLE user (
+	id INTEGER NOT NULL,
+	username VARCHAR(80) NOT NULL,
+	email VARCHAR(120) NOT NULL,
+	password_hash VARCHAR(256) NOT NULL,
+	first_name VARCHAR(50),
+	last_name VARCHAR(50),
+	bio TEXT,
+	location VARCHAR(100),
+	phone VARCHAR(20),
+	avatar_url VARCHAR(200),
+	is_verified BOOLEAN,
+	total_sales INTEGER,
+	total_purchases INTEGER,
+	created_at DATETIME,
+	last_active DATETIME,
+	PRIMARY KEY (id),
+	UNIQUE (username),
+	UNIQUE (email)
+);
+
+CREATE TABLE product (
+	id INTEGER NOT NULL,
+	title VARCHAR(200) NOT NULL,
+	description TEXT NOT NULL,
+	category VARCHAR(50) NOT NULL,
+	price FLOAT NOT NULL,
+	image_url VARCHAR(200),
+	condition VARCHAR(20),
+	location VARCHAR(100),
+	views INTEGER,
+	created_at DATETIME,
+	is_sold BOOLEAN,
+	is_featured BOOLEAN,
+	owner_id INTEGER NOT NULL,
+	PRIMARY KEY (id),
+	FOREIGN KEY(owner_id) REFERENCES user (id)
+);
+
+CREATE TABLE notification (
+	id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	title VARCHAR(200) NOT NULL,
+	message TEXT NOT NULL,
+	type VARCHAR(50),
+	is_read BOOLEAN,
+	link VARCHAR(200),
+	created_at DATETIME,
+	PRIMARY KEY (id),
+	FOREIGN KEY(user_id) REFERENCES user (id)
+);
+
+CREATE TABLE cart (
+	id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	product_id INTEGER NOT NULL,
+	added_at DATETIME,
+	PRIMARY KEY (id),
+	CONSTRAINT unique_user_product UNIQUE (user_id, product_id),
+	FOREIGN KEY(user_id) REFERENCES user (id),
+	FOREIGN KEY(product_id) REFERENCES product (id)
+);
+
+CREATE TABLE purchase_history (
+	id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	product_id INTEGER NOT NULL,
+	purchase_date DATETIME,
+	price_paid FLOAT NOT NULL,
+	PRIMARY KEY (id),
+	FOREIGN KEY(user_id) REFERENCES user (id),
+	FOREIGN KEY(product_id) REFERENCES product (id)
+);
+
+CREATE TABLE product_image (
+	id INTEGER NOT NULL,
+	product_id INTEGER NOT NULL,
+	image_url VARCHAR(200) NOT NULL,
+	is_primary BOOLEAN,
+	order_index INTEGER,
+	created_at DATETIME,
+	PRIMARY KEY (id),
+	FOREIGN KEY(product_id) REFERENCES product (id)
+);
+
+CREATE TABLE review (
+	id INTEGER NOT NULL,
+	product_id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	rating INTEGER NOT NULL,
+	comment TEXT,
+	created_at DATETIME,
+	PRIMARY KEY (id),
+	FOREIGN KEY(product_id) REFERENCES product (id),
+	FOREIGN KEY(user_id) REFERENCES user (id)
+);
+
+CREATE TABLE wishlist (
+	id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	product_id INTEGER NOT NULL,
+	added_at DATETIME,
+	PRIMARY KEY (id),
+	CONSTRAINT unique_wishlist UNIQUE (user_id, product_id),
+	FOREIGN KEY(user_id) REFERENCES user (id),
+	FOREIGN KEY(product_id) REFERENCES product (id)
+);
+
+CREATE TABLE offer (
+	id INTEGER NOT NULL,
+	product_id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	amount FLOAT NOT NULL,
+	message TEXT,
+	status VARCHAR(20),
+	created_at DATETIME,
+	expires_at DATETIME,
+	PRIMARY KEY (id),
+	FOREIGN KEY(product_id) REFERENCES product (id),
+	FOREIGN KEY(user_id) REFERENCES user (id)
+);
+
+CREATE TABLE message (
+	id INTEGER NOT NULL,
+	sender_id INTEGER NOT NULL,
+	recipient_id INTEGER NOT NULL,
+	product_id INTEGER,
+	subject VARCHAR(200),
+	content TEXT NOT NULL,
+	is_read BOOLEAN,
+	created_at DATETIME,
+	PRIMARY KEY (id),
+	FOREIGN KEY(sender_id) REFERENCES user (id),
+	FOREIGN KEY(recipient_id) REFERENCES user (id),
+	FOREIGN KEY(product_id) REFERENCES product (id)
+);
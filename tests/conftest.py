@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from flask import g
+
+import database
+from app import create_app, db
+from models import Product, User
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    """The database the app fixture uses; override it to start from existing tables"""
+    return f'sqlite:///{tmp_path / "test.db"}'
+
+
+@pytest.fixture
+def app(database_url, monkeypatch):
+    """An app on a fresh SQLite database (see database_url), with an app context pushed"""
+    monkeypatch.setenv('DATABASE_URL', database_url)
+    monkeypatch.delenv('DATABASE_REPLICA_URL', raising=False)
+    monkeypatch.setenv('APP_ENV', 'testing')
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        database.create_schema(db)
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(username):
+        user = User(username=username, email=f'{username}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make_user
+
+
+@pytest.fixture
+def make_product(app):
+    def make_product(owner, title='Vintage lamp', price=10.0, category='Furniture', **fields):
+        product = Product(title=title, description=f'{title} for sale', price=price,
+                          category=category, owner_id=owner.id, **fields)
+        db.session.add(product)
+        db.session.commit()
+        return product
+    return make_product
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(app):
+    def login(client, user):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        # Requests share the fixture's app context, where Flask-Login caches the user
+        g.pop('_login_user', None)
+    return login
+
+
+@pytest.fixture
+def uploads(app):
+    """Removes the files tests upload into static/uploads"""
+    upload_dir = os.path.join(app.root_path, 'static', 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    before = set(os.listdir(upload_dir))
+    yield
+    for name in set(os.listdir(upload_dir)) - before:
+        os.remove(os.path.join(upload_dir, name))
@@ -0,0 +1,94 @@
+import io
+import json
+
+import ratings
+from app import db
+from bulk_listings import delete_listings, export_listings, import_listings
+from models import Cart, Job, Offer, Product, ProductImage, Review, User, Wishlist
+
+CSV = '''title,description,category,condition,price,location,is_featured
+Oak table,Solid oak,Furniture,Good,80,Leeds,yes
+No price,Missing a price,Furniture,Good,,,
+Desk lamp,Brass,Furniture,Like New,12.5,,
+Camera,Film camera,Electronics,Good,40,,
+'''
+
+
+def test_import_listings_reports_each_row_and_inserts_in_batches(app, make_user):
+    seller = make_user('seller')
+    results = list(import_listings(seller.id, io.BytesIO(CSV.encode()), 'csv', batch_size=2))
+
+    assert [result.get('status') for result in results[:-1]] == ['error', 'ok', 'ok', 'ok']
+    assert results[0] == {'row': 2, 'status': 'error', 'errors': {'price': ['This field is required.']}}
+    assert results[-1] == {'summary': {'rows': 4, 'imported': 3, 'failed': 1, 'image_errors': 0}}
+    table = Product.query.filter_by(title='Oak table').one()
+    assert (table.owner_id, table.price, table.location, table.is_featured) == (seller.id, 80.0, 'Leeds', True)
+    # One searches.match job per inserted batch
+    assert [json.loads(job.args) for job in Job.query.filter_by(name='searches.match').order_by(Job.id)] == [
+        [[table.id, table.id + 1]], [[table.id + 2]]]
+
+
+def test_import_listings_rejects_images_without_a_source(app, make_user):
+    seller = make_user('seller')
+    row = {'title': 'Lamp', 'description': 'd', 'category': 'Furniture', 'price': 5, 'image': 'lamp.jpg'}
+    results = list(import_listings(seller.id, io.BytesIO(json.dumps(row).encode() + b'\n[1]\n'), 'jsonl'))
+    assert results[0]['errors'] == {'image': ['Row references images but no image source was given']}
+    assert results[1]['errors'] == {'row': ['Each line must be a JSON object']}
+    assert Product.query.count() == 0
+
+
+def test_export_listings_pages_through_one_sellers_listings(app, make_user, make_product):
+    seller, other = make_user('seller'), make_user('other')
+    lamp = make_product(seller, title='Lamp', image_url='uploads/lamp.jpg')
+    make_product(other, title='Their chair')
+    chair = make_product(seller, title='Chair')
+    db.session.add_all([ProductImage(product_id=lamp.id, image_url='uploads/lamp-2.jpg', order_index=1),
+                        ProductImage(product_id=lamp.id, image_url='uploads/lamp-3.jpg', order_index=2)])
+    db.session.commit()
+
+    chunks = list(export_listings(seller.id, 'csv', chunk_size=1))
+    assert len(chunks) == 3 and chunks[0].startswith('id,title,')
+    assert chunks[1].endswith(',uploads/lamp.jpg,uploads/lamp-2.jpg|uploads/lamp-3.jpg\r\n')
+
+    records = [json.loads(line) for line in ''.join(export_listings(seller.id, 'jsonl')).splitlines()]
+    assert [record['id'] for record in records] == [lamp.id, chair.id]
+    assert records[0]['images'] == ['uploads/lamp-2.jpg', 'uploads/lamp-3.jpg']
+    assert records[1]['image'] == ''
+
+
+def review(product, user, rating):
+    db.session.add(Review(product_id=product.id, user_id=user.id, rating=rating))
+    ratings.record_review(product.id, rating)
+    db.session.commit()
+
+
+def test_delete_listings_removes_children_and_seller_rating_totals(app, make_user, make_product):
+    seller, buyer, other = make_user('seller'), make_user('buyer'), make_user('other')
+    doomed = make_product(seller, title='Oak table')
+    kept = make_product(seller, title='Chair')
+    theirs = make_product(other, title='Their lamp')
+    review(doomed, buyer, 2)
+    review(kept, buyer, 5)
+    db.session.add_all([Cart(user_id=buyer.id, product_id=doomed.id), Wishlist(user_id=buyer.id, product_id=doomed.id),
+                        Offer(product_id=doomed.id, user_id=buyer.id, amount=5.0),
+                        ProductImage(product_id=doomed.id, image_url='uploads/oak.jpg')])
+    db.session.commit()
+
+    # Listings of other sellers are left alone
+    assert delete_listings(seller.id, [doomed.id, theirs.id]) == 1
+
+    assert {product.title for product in Product.query} == {'Chair', 'Their lamp'}
+    assert Cart.query.count() == Wishlist.query.count() == Offer.query.count() == ProductImage.query.count() == 0
+    assert [row.product_id for row in Review.query] == [kept.id]
+    seller = db.session.get(User, seller.id)
+    assert (seller.seller_rating_count, seller.seller_rating_sum) == (1, 5)
+
+
+def test_delete_listing_route_only_deletes_own_listings(app, client, login, make_user, make_product):
+    seller, other = make_user('seller'), make_user('other')
+    mine = make_product(seller, title='Oak table')
+    theirs = make_product(other, title='Their lamp')
+    login(client, seller)
+    response = client.post('/delete_listings', data={'product_ids': [str(mine.id), str(theirs.id)]})
+    assert response.status_code == 302
+    assert [product.id for product in Product.query] == [theirs.id]
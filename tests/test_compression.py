@@ -0,0 +1,18 @@
+import gzip
+
+
+def test_json_responses_get_an_etag_and_304(client):
+    response = client.get('/api/quick_help/sell')
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    again = client.get('/api/quick_help/sell', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+
+def test_html_pages_get_no_etag(client):
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert b'csrf-token' in gzip.decompress(response.data)
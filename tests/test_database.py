@@ -0,0 +1,89 @@
+import json
+import os
+import sqlite3
+
+import pytest
+import sqlalchemy as sa
+
+import messaging
+from app import db
+from bulk_listings import delete_listings
+from models import (ArchivedProduct, Cart, Job, Message, Offer, Product, ProductImage, PurchaseHistory, Review,
+                    User, Wishlist)
+
+BASELINE_SCHEMA = os.path.join(os.path.dirname(__file__), 'baseline_schema.sql')
+CREATED = '2026-01-01 00:00:00.000000'
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    """A database in the original schema with a few rows in it; the app fixture migrates it"""
+    path = tmp_path / 'baseline.db'
+    connection = sqlite3.connect(path)
+    with open(BASELINE_SCHEMA) as f:
+        connection.executescript(f.read())
+    connection.executescript(f'''
+        INSERT INTO user (id, username, email, password_hash, total_sales, total_purchases, created_at)
+        VALUES (1, 'seller', 'seller@example.com', 'x', 1, 0, '{CREATED}'),
+               (2, 'buyer', 'buyer@example.com', 'x', 0, 1, '{CREATED}');
+        INSERT INTO product (id, title, description, category, price, image_url, condition, views,
+                             created_at, is_sold, is_featured, owner_id)
+        VALUES (1, 'Sold lamp', 'd', 'Furniture', 10, 'uploads/sold.jpg', 'Good', 0, '{CREATED}', 1, 0, 1),
+               (2, 'Oak table', 'd', 'Furniture', 80, 'uploads/table.jpg', 'Good', 0, '{CREATED}', 0, 0, 1),
+               (3, 'Kept chair', 'd', 'Furniture', 20, '', 'Good', 0, '{CREATED}', 0, 0, 1);
+        INSERT INTO purchase_history (user_id, product_id, purchase_date, price_paid) VALUES (2, 1, '{CREATED}', 10);
+        INSERT INTO cart (user_id, product_id, added_at) VALUES (2, 2, '{CREATED}'), (2, 3, '{CREATED}');
+        INSERT INTO wishlist (user_id, product_id, added_at) VALUES (2, 2, '{CREATED}');
+        INSERT INTO offer (product_id, user_id, amount, status, created_at) VALUES (2, 2, 70, 'pending', '{CREATED}');
+        INSERT INTO product_image (product_id, image_url, is_primary, order_index, created_at)
+        VALUES (1, 'uploads/sold-2.jpg', 0, 1, '{CREATED}'), (2, 'uploads/table-2.jpg', 0, 1, '{CREATED}');
+        INSERT INTO review (product_id, user_id, rating, created_at) VALUES (1, 2, 5, '{CREATED}');
+        INSERT INTO message (sender_id, recipient_id, product_id, content, is_read, created_at)
+        VALUES (2, 1, 2, 'Is the table still available?', 0, '{CREATED}');
+    ''')
+    connection.close()
+    return f'sqlite:///{path}'
+
+
+def foreign_keys(table):
+    return {(tuple(fk['constrained_columns']), fk['referred_table']): fk['options'].get('ondelete')
+            for fk in sa.inspect(db.engine).get_foreign_keys(table)}
+
+
+def test_sync_schema_adds_on_delete_actions_to_a_baseline_database(app):
+    for table in ('cart', 'wishlist', 'offer', 'product_image', 'review'):
+        assert foreign_keys(table)[(('product_id',), 'product')] == 'CASCADE'
+    assert foreign_keys('message')[(('product_id',), 'product')] == 'SET NULL'
+    assert (('product_id',), 'product') not in foreign_keys('purchase_history')
+
+    # The rebuilt tables kept their rows, indexes and references
+    assert [Product.query.count(), Cart.query.count(), Wishlist.query.count(), Offer.query.count(),
+            ProductImage.query.count(), Review.query.count(), Message.query.count()] == [3, 2, 1, 1, 2, 1, 1]
+    assert 'unique_user_product' in {c['name'] for c in sa.inspect(db.engine).get_unique_constraints('cart')}
+    assert db.session.execute(sa.text('PRAGMA foreign_keys')).scalar() == 1
+    assert db.session.execute(sa.text('PRAGMA foreign_key_check')).all() == []
+    # Rating totals added to existing listings and sellers were filled in from the reviews
+    assert (db.session.get(Product, 1).rating_count, db.session.get(Product, 1).rating_sum) == (1, 5)
+    assert db.session.get(User, 1).seller_rating_count == 1
+    # and the existing message was threaded into a conversation the inbox lists
+    rows, _ = messaging.inbox(1)
+    assert [(row.other_username, row.product_id, row.unread) for row in rows] == [('buyer', 2, 1)]
+    assert messaging.unread_count(1) == 1
+
+
+def test_deleting_listings_of_a_migrated_database_cascades(app):
+    assert delete_listings(1, [1, 2]) == 2
+
+    assert [product.id for product in Product.query] == [3]
+    assert [row.product_id for row in Cart.query] == [3]
+    assert Wishlist.query.count() == Offer.query.count() == ProductImage.query.count() == Review.query.count() == 0
+    assert Message.query.one().product_id is None
+
+    # The bought listing lives on in the archive, with its photos, for the buyer's history
+    purchase = PurchaseHistory.query.one()
+    assert purchase.listing.title == 'Sold lamp'
+    assert isinstance(purchase.listing, ArchivedProduct)
+    assert purchase.listing.all_images == ['uploads/sold.jpg', 'uploads/sold-2.jpg']
+
+    job = Job.query.filter_by(name='uploads.delete').one()
+    assert json.loads(job.args) == [['uploads/table-2.jpg', 'uploads/table.jpg']]
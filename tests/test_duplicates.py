@@ -0,0 +1,53 @@
+import io
+
+from PIL import Image
+
+import jobs
+from models import ImageHash, Notification, Product
+
+
+def photo(size=(1200, 900), rotate=False):
+    img = Image.effect_mandelbrot(size, (-2.0, -1.2, 0.8, 1.2), 64).convert('RGB')
+    if rotate:
+        img = img.transpose(Image.Transpose.ROTATE_180)
+    data = io.BytesIO()
+    img.save(data, 'PNG')
+    data.seek(0)
+    return data
+
+
+def add_listing(client, title, image):
+    return client.post('/add_product', data={
+        'title': title, 'description': 'A nice item', 'category': 'Furniture', 'condition': 'Good',
+        'price': '12.5', 'image': (image, 'photo.png')}, content_type='multipart/form-data')
+
+
+def test_new_listing_is_hashed_and_checked_by_a_job(app, client, login, make_user, uploads):
+    alice, bob = make_user('alice'), make_user('bob')
+    login(client, alice)
+    assert add_listing(client, 'Oak table', photo()).status_code == 302
+    # The request only resizes the upload; hashing waits for the job
+    assert ImageHash.query.count() == 0
+    jobs.Worker(app).run_batch()
+    assert ImageHash.query.count() == 1
+    assert Notification.query.filter_by(user_id=alice.id).count() == 0
+
+    login(client, bob)
+    add_listing(client, 'Table', photo(size=(1000, 750)))
+    jobs.Worker(app).run_batch()
+    copy = Product.query.filter_by(owner_id=bob.id).one()
+    notification = Notification.query.filter_by(user_id=bob.id).one()
+    assert notification.title == 'Possible duplicate listing'
+    assert '"Oak table"' in notification.message
+    assert notification.link == f'/edit_product/{copy.id}'
+    assert Notification.query.filter_by(user_id=alice.id).count() == 0
+
+
+def test_unrelated_photos_are_not_flagged(app, client, login, make_user, uploads):
+    alice = make_user('alice')
+    login(client, alice)
+    add_listing(client, 'Oak table', photo())
+    add_listing(client, 'Lamp', photo(rotate=True))
+    jobs.Worker(app).run_batch()
+    assert ImageHash.query.count() == 2
+    assert Notification.query.count() == 0
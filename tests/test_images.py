@@ -0,0 +1,40 @@
+import io
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from models import ImageHash
+from utils import save_image, upload_path
+
+GPS = 0x8825
+ORIENTATION = 0x0112
+
+
+def upload(fmt, size=(2000, 1000), filename='photo.jpg'):
+    img = Image.new('RGB', size, (200, 40, 40))
+    exif = Image.Exif()
+    exif[ORIENTATION] = 6
+    exif.get_ifd(GPS)[2] = (51.0, 30.0, 0.0)
+    data = io.BytesIO()
+    img.save(data, fmt, exif=exif)
+    data.seek(0)
+    return FileStorage(data, filename=filename)
+
+
+@pytest.mark.parametrize('fmt, filename', [('JPEG', 'photo.jpg'), ('PNG', 'photo.png')])
+@pytest.mark.parametrize('defer', [True, False])
+def test_saved_uploads_are_shrunk_upright_and_without_exif(app, uploads, fmt, filename, defer):
+    image_url = save_image(upload(fmt, filename=filename), defer=defer)
+
+    with Image.open(upload_path(image_url)) as saved:
+        assert saved.format == fmt
+        # Turned upright from orientation 6, then fitted into 800x800
+        assert saved.height > saved.width and max(saved.size) <= 800
+        assert not saved.getexif()
+    # Deferred uploads are hashed by the listings.duplicates job
+    assert (ImageHash.query.count() == 0) == defer
+
+
+def test_files_that_are_not_images_are_rejected(app, uploads):
+    assert save_image(FileStorage(io.BytesIO(b'not an image'), filename='photo.jpg')) == ''
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from app import db
+from models import Job
+
+NOW = datetime(2026, 1, 1, 12, 0)
+ran = []
+
+
+@jobs.job('tests.record', lane='low')
+def record(value):
+    ran.append(value)
+
+
+@jobs.job('tests.urgent', lane='high')
+def urgent(value):
+    ran.append(value)
+
+
+@jobs.job('tests.fail', max_attempts=2)
+def fail():
+    raise RuntimeError('boom')
+
+
+@pytest.fixture(autouse=True)
+def clear_ran():
+    ran.clear()
+
+
+def worker(app, now=NOW, **options):
+    return jobs.Worker(app, clock=lambda: now, **options)
+
+
+def test_enqueue_with_a_key_returns_the_existing_job(app):
+    first = jobs.enqueue('tests.record', 1, key='once', now=NOW)
+    db.session.commit()
+    assert jobs.enqueue('tests.record', 2, key='once', now=NOW).id == first.id
+    db.session.commit()
+    assert Job.query.count() == 1
+
+
+def test_higher_lanes_run_first(app):
+    jobs.enqueue('tests.record', 'low', now=NOW - timedelta(minutes=5))
+    jobs.enqueue('tests.urgent', 'high', now=NOW)
+    db.session.commit()
+    assert worker(app, batch_size=1).run_batch() == 1
+    assert worker(app, batch_size=1).run_batch() == 1
+    assert ran == ['high', 'low']
+
+
+def test_jobs_not_due_yet_wait(app):
+    jobs.enqueue('tests.record', 'later', delay=60, now=NOW)
+    db.session.commit()
+    assert worker(app).run_batch() == 0
+    assert worker(app, now=NOW + timedelta(seconds=60)).run_batch() == 1
+    assert ran == ['later']
+
+
+def test_a_claimed_job_is_not_claimed_again(app):
+    jobs.enqueue('tests.record', 1, now=NOW)
+    db.session.commit()
+    assert len(worker(app).claim(10)) == 1
+    assert worker(app).claim(10) == []
+
+
+def test_failed_jobs_are_retried_with_backoff_then_kept_as_failed(app):
+    job = jobs.enqueue('tests.fail', now=NOW)
+    db.session.commit()
+
+    worker(app).run_batch()
+    db.session.refresh(job)
+    assert (job.status, job.attempts) == ('queued', 1)
+    assert job.run_at >= NOW + timedelta(seconds=app.config['JOBS_BACKOFF_SECONDS'])
+    assert 'RuntimeError: boom' in job.last_error
+
+    assert worker(app).run_batch() == 0
+    worker(app, now=job.run_at).run_batch()
+    db.session.refresh(job)
+    assert (job.status, job.attempts) == ('failed', 2)
+
+
+def test_unknown_jobs_fail_without_retrying(app):
+    db.session.add(Job(name='tests.missing', args='[]', priority=1, status='queued', attempts=0,
+                       max_attempts=5, run_at=NOW, created_at=NOW))
+    db.session.commit()
+    worker(app).run_batch()
+    job = Job.query.one()
+    assert (job.status, job.last_error) == ('failed', 'No job registered as tests.missing')
+
+
+def test_expired_leases_are_recovered_unless_the_worker_renews_them(app):
+    lease = timedelta(seconds=app.config['JOBS_LEASE_SECONDS'])
+    abandoned = jobs.enqueue('tests.record', 'abandoned', now=NOW)
+    running = jobs.enqueue('tests.record', 'running', now=NOW)
+    db.session.commit()
+    dead, alive = worker(app), worker(app)
+    dead.name, alive.name = 'dead', 'alive'
+    dead.claim(1)
+    alive.claim(1)
+    alive._claimed = {running.id}
+
+    later = worker(app, now=NOW + lease + timedelta(seconds=1))
+    alive.clock = later.clock
+    assert alive.heartbeat() == 1
+    later.recover_expired()
+
+    db.session.refresh(abandoned)
+    db.session.refresh(running)
+    assert (abandoned.status, abandoned.locked_by) == ('queued', None)
+    assert (running.status, running.locked_by, running.locked_at) == ('running', 'alive', later.clock())
+
+
+def test_jobs_out_of_attempts_fail_when_their_lease_expires(app):
+    job = jobs.enqueue('tests.record', 'stuck', now=NOW)
+    db.session.commit()
+    worker(app).claim(1)
+    job.attempts = job.max_attempts
+    db.session.commit()
+
+    later = worker(app, now=NOW + timedelta(seconds=app.config['JOBS_LEASE_SECONDS'] + 1))
+    later.recover_expired()
+    db.session.refresh(job)
+    assert (job.status, job.last_error, job.finished_at) == ('failed', 'Lease expired', later.clock())
+    # prune() picks failed jobs by finished_at
+    assert jobs.prune(0, now=later.clock() + timedelta(seconds=1)) == 1
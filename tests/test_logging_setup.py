@@ -0,0 +1,26 @@
+import logging
+
+from flask import Flask
+
+from logging_setup import configure_logging
+
+
+def configured(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    configure_logging(app)
+    return app
+
+
+def test_log_level_names_are_case_insensitive():
+    app = configured(APP_ENV='production', LOG_LEVEL='debug')
+    assert logging.getLogger().level == logging.DEBUG
+    assert app.logger.level == logging.DEBUG
+    assert logging.getLogger('werkzeug').level == logging.WARNING
+
+
+def test_unknown_log_level_falls_back_to_info(capsys):
+    app = configured(APP_ENV='production', LOG_LEVEL='verbose')
+    assert logging.getLogger().level == logging.INFO
+    assert app.config['LOG_LEVEL'] == 'INFO'
+    assert "Unknown LOG_LEVEL 'VERBOSE'" in capsys.readouterr().err
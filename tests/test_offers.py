@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from app import db
+from models import Notification, Offer, PurchaseHistory, User
+from offers import OfferError, accept_offer, decline_offers_for_sold, expire_offers, reject_offer
+
+NOW = datetime(2026, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def listing(make_user, make_product):
+    seller = make_user('seller')
+    return make_product(seller, price=50.0)
+
+
+def make_offer(product, user, amount, expires_at=NOW + timedelta(hours=72)):
+    offer = Offer(product_id=product.id, user_id=user.id, amount=amount, created_at=NOW - timedelta(hours=1),
+                  expires_at=expires_at)
+    db.session.add(offer)
+    db.session.commit()
+    return offer
+
+
+def notification_titles(user):
+    return sorted(db.session.scalars(db.select(Notification.title).where(Notification.user_id == user.id)))
+
+
+def test_accept_sells_the_listing_and_rejects_competing_offers(app, make_user, make_product, listing):
+    alice, bob, carol = make_user('alice'), make_user('bob'), make_user('carol')
+    other = make_product(listing.owner, title='Oak table')
+    winner = make_offer(listing, alice, 40.0)
+    loser = make_offer(listing, bob, 35.0)
+    elsewhere = make_offer(other, carol, 20.0)
+
+    with app.test_request_context():
+        assert accept_offer(winner, now=NOW) == 1
+
+    assert listing.is_sold
+    assert (winner.status, winner.resolved_at) == ('accepted', NOW)
+    assert (loser.status, loser.resolved_at) == ('rejected', NOW)
+    assert elsewhere.status == 'pending'
+    purchase = PurchaseHistory.query.filter_by(user_id=alice.id).one()
+    assert (purchase.product_id, purchase.price_paid) == (listing.id, 40.0)
+    assert db.session.get(User, listing.owner_id).total_sales == 1
+    assert alice.total_purchases == 1
+    assert notification_titles(alice) == ['Offer Accepted!']
+    assert notification_titles(bob) == ['Offer Declined']
+    assert notification_titles(carol) == []
+
+
+def test_the_buyer_is_not_told_their_other_offer_lost(app, make_user, listing):
+    alice, bob = make_user('alice'), make_user('bob')
+    winner = make_offer(listing, alice, 40.0)
+    second = make_offer(listing, alice, 42.0)
+    make_offer(listing, bob, 35.0)
+    with app.test_request_context():
+        assert accept_offer(winner, now=NOW) == 2
+    assert second.status == 'rejected'
+    assert notification_titles(alice) == ['Offer Accepted!']
+    assert notification_titles(bob) == ['Offer Declined']
+
+
+@pytest.mark.parametrize('update_returning', [True, False])
+def test_offers_resolve_with_and_without_update_returning(app, monkeypatch, make_user, make_product, listing,
+                                                           update_returning):
+    monkeypatch.setattr(db.engine.dialect, 'update_returning', update_returning)
+    alice, bob = make_user('alice'), make_user('bob')
+    winner = make_offer(listing, alice, 40.0)
+    loser = make_offer(listing, bob, 35.0)
+    other = make_product(listing.owner, title='Oak table')
+    sold_elsewhere = make_offer(other, bob, 20.0)
+    due = make_offer(other, alice, 15.0, expires_at=NOW - timedelta(minutes=1))
+    with app.test_request_context():
+        assert accept_offer(winner, now=NOW) == 1
+        assert expire_offers(now=NOW) == 1
+        assert decline_offers_for_sold([other.id], now=NOW) == 1
+    assert (loser.status, sold_elsewhere.status, due.status) == ('rejected', 'rejected', 'expired')
+    assert notification_titles(bob) == ['Offer Declined', 'Offer Declined']
+    assert notification_titles(alice) == ['Offer Accepted!', 'Offer Expired']
+
+
+def test_accept_fails_once_the_listing_is_sold(app, make_user, listing):
+    first = make_offer(listing, make_user('alice'), 40.0)
+    second = make_offer(listing, make_user('bob'), 45.0)
+    with app.test_request_context():
+        accept_offer(first, now=NOW)
+        with pytest.raises(OfferError):
+            accept_offer(second, now=NOW)
+    assert PurchaseHistory.query.count() == 1
+
+
+def test_accept_leaves_the_offer_open_when_the_listing_sold_through_checkout(app, make_user, listing):
+    offer = make_offer(listing, make_user('alice'), 40.0)
+    listing.is_sold = True
+    db.session.commit()
+    with app.test_request_context():
+        with pytest.raises(OfferError):
+            accept_offer(offer, now=NOW)
+    assert offer.status == 'pending'
+    assert PurchaseHistory.query.count() == 0
+
+
+def test_reject_declines_only_that_offer(app, make_user, listing):
+    alice, bob = make_user('alice'), make_user('bob')
+    rejected = make_offer(listing, alice, 20.0)
+    other = make_offer(listing, bob, 30.0)
+    with app.test_request_context():
+        reject_offer(rejected, now=NOW)
+        with pytest.raises(OfferError):
+            reject_offer(rejected, now=NOW)
+    assert (rejected.status, rejected.resolved_at) == ('rejected', NOW)
+    assert other.status == 'pending'
+    assert not listing.is_sold
+    assert notification_titles(alice) == ['Offer Declined']
+
+
+def test_expired_offers_can_no_longer_be_accepted_or_rejected(app, make_user, listing):
+    offer = make_offer(listing, make_user('alice'), 40.0, expires_at=NOW - timedelta(minutes=1))
+    with app.test_request_context():
+        with pytest.raises(OfferError):
+            accept_offer(offer, now=NOW)
+        with pytest.raises(OfferError):
+            reject_offer(offer, now=NOW)
+    assert offer.status == 'pending'
+    assert not listing.is_sold
+
+
+def test_expire_offers_walks_due_offers_in_batches(app, make_user, listing):
+    alice, bob = make_user('alice'), make_user('bob')
+    due = [make_offer(listing, alice, 10.0 + i, expires_at=NOW - timedelta(hours=i)) for i in range(5)]
+    open_offer = make_offer(listing, bob, 30.0, expires_at=NOW + timedelta(hours=1))
+
+    with app.test_request_context():
+        assert expire_offers(now=NOW, batch_size=2) == 5
+        assert expire_offers(now=NOW, batch_size=2) == 0
+
+    assert {offer.status for offer in due} == {'expired'}
+    assert {offer.resolved_at for offer in due} == {NOW}
+    assert open_offer.status == 'pending'
+    assert notification_titles(alice) == ['Offer Expired'] * 5
+    assert notification_titles(bob) == []
+
+
+def test_expire_job_uses_the_worker_clock(app, make_user, listing):
+    offer = make_offer(listing, make_user('alice'), 40.0, expires_at=NOW + timedelta(hours=1))
+    jobs.enqueue('offers.expire', now=NOW)
+    db.session.commit()
+
+    jobs.Worker(app, clock=lambda: NOW).run_batch()
+    db.session.expire_all()
+    assert offer.status == 'pending'
+
+    jobs.enqueue('offers.expire', now=NOW)
+    db.session.commit()
+    later = NOW + timedelta(hours=2)
+    jobs.Worker(app, clock=lambda: later).run_batch()
+    db.session.expire_all()
+    assert (offer.status, offer.resolved_at) == ('expired', later)
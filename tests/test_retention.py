@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import retention
+from app import db
+from models import (ArchivedMessage, ArchivedProduct, Cart, Message, Notification, Product, ProductImage,
+                    PurchaseHistory, Review)
+
+NOW = datetime(2026, 6, 1)
+OLD = NOW - timedelta(days=120)
+
+
+def sell(product, buyer, when):
+    product.is_sold = True
+    db.session.add(PurchaseHistory(user_id=buyer.id, product_id=product.id, price_paid=product.price,
+                                   purchase_date=when))
+    db.session.commit()
+
+
+def test_old_sold_listings_move_to_the_archive(app, make_user, make_product):
+    seller, buyer = make_user('seller'), make_user('buyer')
+    old = make_product(seller, title='Old lamp', image_url='uploads/old.jpg', created_at=OLD)
+    recent = make_product(seller, title='Recent lamp', created_at=OLD)
+    reviewed = make_product(seller, title='Reviewed lamp', created_at=OLD)
+    unsold = make_product(seller, title='Unsold lamp', created_at=OLD)
+    for product in (old, reviewed):
+        sell(product, buyer, OLD)
+    sell(recent, buyer, NOW - timedelta(days=10))
+    db.session.add_all([ProductImage(product_id=old.id, image_url='uploads/old-2.jpg'),
+                        Cart(user_id=buyer.id, product_id=old.id),
+                        Review(product_id=reviewed.id, user_id=buyer.id, rating=4)])
+    db.session.commit()
+    old_id = old.id
+
+    assert retention.archive_products(90, batch_size=1, now=NOW) == 1
+
+    assert {product.title for product in Product.query} == {'Recent lamp', 'Reviewed lamp', 'Unsold lamp'}
+    archived = db.session.get(ArchivedProduct, old_id)
+    assert (archived.title, archived.archived_at) == ('Old lamp', NOW)
+    assert archived.all_images == ['uploads/old.jpg', 'uploads/old-2.jpg']
+    assert Cart.query.count() == ProductImage.query.count() == 0
+    purchase = PurchaseHistory.query.filter_by(product_id=old_id).one()
+    assert purchase.listing.title == 'Old lamp'
+
+
+def test_old_messages_are_archived_and_read_notifications_pruned(app, make_user):
+    alice, bob = make_user('alice'), make_user('bob')
+    db.session.add_all([Message(sender_id=alice.id, recipient_id=bob.id, content='old', created_at=OLD),
+                        Message(sender_id=bob.id, recipient_id=alice.id, content='new', created_at=NOW)])
+    db.session.add_all([Notification(user_id=alice.id, title=title, message='m', is_read=is_read, created_at=when)
+                        for title, is_read, when in (('old read', True, OLD), ('old unread', False, OLD),
+                                                     ('new read', True, NOW))])
+    db.session.commit()
+
+    handled = retention.run({'RETENTION_BATCH_SIZE': 1, 'ARCHIVE_SOLD_AFTER_DAYS': 90,
+                             'MESSAGE_ARCHIVE_AFTER_DAYS': 90, 'NOTIFICATION_RETENTION_DAYS': 30}, now=NOW)
+
+    assert handled == {'products': 0, 'messages': 1, 'notifications': 1}
+    assert [message.content for message in Message.query] == ['new']
+    assert [message.content for message in ArchivedMessage.query] == ['old']
+    assert {notification.title for notification in Notification.query} == {'old unread', 'new read'}
+
+
+def test_a_setting_of_zero_turns_a_step_off(app, make_user):
+    alice, bob = make_user('alice'), make_user('bob')
+    db.session.add(Message(sender_id=alice.id, recipient_id=bob.id, content='old', created_at=OLD))
+    db.session.commit()
+    handled = retention.run({'RETENTION_BATCH_SIZE': 10, 'ARCHIVE_SOLD_AFTER_DAYS': 0,
+                             'MESSAGE_ARCHIVE_AFTER_DAYS': 0, 'NOTIFICATION_RETENTION_DAYS': 0}, now=NOW)
+    assert handled == {'products': 0, 'messages': 0, 'notifications': 0}
+    assert Message.query.count() == 1
@@ -0,0 +1,38 @@
+import saved_searches
+from app import db
+from models import Notification
+
+
+def save(user, **values):
+    search = saved_searches.save_search(user.id, values)
+    db.session.commit()
+    return search
+
+
+def test_new_listings_match_whole_search_words_in_any_order(app, make_user, make_product):
+    seller, buyer = make_user('seller'), make_user('buyer')
+    save(buyer, search='lamp brass')
+    save(buyer, search='lamp', max_price=20)
+    hit = make_product(seller, title='Brass desk lamp', price=30.0)
+    plural = make_product(seller, title='Brass lamps', price=10.0)
+    cheap = make_product(seller, title='Reading lamp', price=15.0)
+
+    with app.test_request_context():
+        assert saved_searches.match_new_listings([hit.id, plural.id, cheap.id]) == 2
+
+    messages = sorted(db.session.scalars(db.select(Notification.message).where(Notification.user_id == buyer.id)))
+    assert messages == ['"Brass desk lamp" matches your saved search "lamp brass".',
+                        '"Reading lamp" matches your saved search "lamp" $0-$20.00.']
+
+
+def test_sellers_are_not_alerted_about_their_own_listings(app, make_user, make_product):
+    seller = make_user('seller')
+    save(seller, category='Furniture')
+    product = make_product(seller, category='Furniture')
+    with app.test_request_context():
+        assert saved_searches.match_new_listings([product.id]) == 0
+
+
+def test_saved_searches_page_says_alerts_match_whole_words(client, login, make_user):
+    login(client, make_user('buyer'))
+    assert b'as whole words' in client.get('/saved_searches').data
@@ -0,0 +1,78 @@
+import pytest
+
+import shopping
+from app import db
+from models import Cart, Wishlist
+
+
+@pytest.fixture
+def listings(make_user, make_product):
+    seller = make_user('seller')
+    return [make_product(seller, title='Lamp', price=10.0), make_product(seller, title='Chair', price=25.5),
+            make_product(seller, title='Sold table', price=99.0, is_sold=True)]
+
+
+def test_add_items_skips_duplicates_sold_and_own_listings(app, make_user, make_product, listings):
+    buyer = make_user('buyer')
+    own = make_product(buyer, title='My own lamp')
+    lamp, chair, sold = listings
+
+    assert shopping.add_items(Cart, buyer.id, [lamp.id, sold.id, own.id, 999]) == [lamp.id]
+    assert shopping.add_items(Cart, buyer.id, [lamp.id, chair.id]) == [chair.id]
+    # Sold listings can still be wished for
+    assert shopping.add_items(Wishlist, buyer.id, [sold.id]) == [sold.id]
+    db.session.commit()
+    assert shopping.summary(Cart, buyer.id) == {'items': 2, 'available': 2, 'total': 35.5}
+    assert shopping.summary(Wishlist, buyer.id) == {'items': 1, 'available': 0, 'total': 0}
+
+
+def test_remove_items_reports_what_was_removed(app, make_user, listings):
+    buyer = make_user('buyer')
+    lamp, chair, _ = listings
+    shopping.add_items(Wishlist, buyer.id, [lamp.id, chair.id])
+    assert shopping.remove_items(Wishlist, buyer.id, [lamp.id, 999]) == [lamp.id]
+    assert shopping.remove_items(Wishlist, buyer.id, [lamp.id]) == []
+    assert [item['product_id'] for item in shopping.list_items(Wishlist, buyer.id)] == [chair.id]
+
+
+def test_dialects_without_returning_compare_before_and_after(app, monkeypatch, make_user, listings):
+    buyer = make_user('buyer')
+    lamp, chair, sold = listings
+    dialect = db.engine.dialect
+    monkeypatch.setattr(dialect, 'insert_returning', False)
+    monkeypatch.setattr(dialect, 'delete_returning', False)
+    shopping.add_items(Cart, buyer.id, [lamp.id])
+    assert shopping.add_items(Cart, buyer.id, [lamp.id, chair.id, sold.id]) == [chair.id]
+    assert shopping.remove_items(Cart, buyer.id, [chair.id, sold.id]) == [chair.id]
+
+
+def test_items_api(app, client, login, make_user, listings):
+    login(client, make_user('buyer'))
+    lamp, chair, sold = listings
+    response = client.post('/api/cart/items', json={'product_ids': [lamp.id, sold.id]})
+    assert response.get_json() == {'added': [lamp.id], 'skipped': [sold.id],
+                                   'summary': {'items': 1, 'available': 1, 'total': 10.0}}
+    response = client.delete('/api/cart/items', json={'product_ids': [lamp.id, chair.id]})
+    assert response.get_json()['removed'] == [lamp.id]
+
+
+@pytest.mark.parametrize('body', ['[1, 2]', '"x"', '3', 'null', '{}', '{"product_ids": [1, "2"]}', 'not json'])
+def test_items_api_rejects_bad_bodies(app, client, login, make_user, body):
+    login(client, make_user('buyer'))
+    response = client.post('/api/wishlist/items', data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'product_ids must be a non-empty list of integers'}
+
+
+def test_items_api_requires_login(client):
+    assert client.post('/api/cart/items', json={'product_ids': [1]}).status_code == 401
+
+
+def test_pages_render_the_cart_badge(app, client, login, make_user, listings):
+    buyer = make_user('buyer')
+    login(client, buyer)
+    assert b'bg-danger d-none" id="cart-badge"></span>' in client.get('/').data
+    shopping.add_items(Cart, buyer.id, [product.id for product in listings])
+    db.session.commit()
+    assert b'<span class="badge rounded-pill bg-danger" id="cart-badge">2</span>' in client.get('/').data
+    assert b'id="cart-badge">2</span>' in client.get('/cart').data
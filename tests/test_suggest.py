@@ -0,0 +1,77 @@
+import pytest
+
+import suggest
+from suggest import SuggestIndex
+
+ROWS = [(1, 'Vintage brass lamp', 'Furniture'), (2, 'Brass desk lamp', 'Furniture'),
+        (3, 'Lantern for camping', 'Sports'), (4, 'Leather jacket', 'Clothing'),
+        (5, 'Desk lamp with shade', 'Furniture')]
+
+
+@pytest.fixture
+def index():
+    return SuggestIndex.build(ROWS)
+
+
+def test_completions_are_ordered_by_listing_count(index):
+    assert index.complete('la') == ['lamp', 'lantern']
+    assert index.complete('lamp') == ['lamp']
+    assert index.complete('x') == []
+
+
+def test_typos_are_corrected_to_the_most_used_word(index):
+    assert index.correct('lmap') == 'lamp'
+    assert index.correct('lamp') is None
+    assert index.did_you_mean('brsas lmap') == 'brass lamp'
+    assert index.did_you_mean('brass lamp') is None
+
+
+def test_suggest_completes_the_last_word_and_fixes_the_others(index):
+    result = index.suggest('brsas la')
+    assert result['suggestions'] == ['brass lamp', 'brass lantern']
+    assert result['corrected'] is True
+    assert index.suggest('furn')['categories'] == ['Furniture']
+    # A finished word is only corrected, not completed
+    assert index.suggest('lamp ')['suggestions'] == []
+    assert index.suggest('lmap ')['suggestions'] == ['lamp']
+
+
+def test_max_terms_keeps_the_most_used_words():
+    index = SuggestIndex.build(ROWS, max_terms=2)
+    assert len(index.terms) == 2 and 'lamp' in index.terms
+
+
+def test_add_returns_an_updated_copy(index):
+    assert index.complete('la') == ['lamp', 'lantern']
+    updated = index.add([(6, 'Large lava lamp', 'Home')])
+    assert updated.complete('la') == ['lamp', 'lantern', 'large', 'lava']
+    assert updated.last_id == 6 and 'Home' in updated.categories
+    # Requests still holding the old index see it unchanged
+    assert index.complete('la') == ['lamp', 'lantern']
+    assert index.last_id == 5 and 'Home' not in index.categories
+
+
+def test_api_suggest_uses_the_built_index(app, client, monkeypatch, make_user, make_product):
+    monkeypatch.setattr(suggest, 'suggester', suggest.Suggester())
+    seller = make_user('seller')
+    make_product(seller, title='Brass lamp')
+    make_product(seller, title='Sold lantern', is_sold=True)
+
+    suggest.suggester._build(app)
+    response = client.get('/api/suggest', query_string={'q': 'brass l'})
+    assert response.get_json() == {'suggestions': ['brass lamp'], 'categories': [], 'corrected': False,
+                                   'query': 'brass l'}
+    assert response.cache_control.max_age == app.config['SUGGEST_MAX_AGE']
+
+    make_product(seller, title='Lava lamp')
+    suggest.suggester.refresh()
+    assert client.get('/api/suggest?q=lav').get_json()['suggestions'] == ['lava']
+
+
+def test_api_suggest_is_empty_and_uncached_while_building(app, client, monkeypatch):
+    building = suggest.Suggester()
+    monkeypatch.setattr(building, '_start_build', lambda app: None)
+    monkeypatch.setattr(suggest, 'suggester', building)
+    response = client.get('/api/suggest?q=lamp')
+    assert response.get_json()['suggestions'] == []
+    assert response.cache_control.max_age is None
@@ -0,0 +1,72 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import wishlist_alerts
+from app import create_app, db
+from models import Job, Notification, Product, User, Wishlist
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+def alert_jobs():
+    return [json.loads(job.args) for job in Job.query.filter_by(name='wishlist.alerts').order_by(Job.id)]
+
+
+@pytest.fixture
+def product(make_user, make_product):
+    return make_product(make_user('seller'), title='Oak table', price=80.0)
+
+
+def test_a_price_drop_enqueues_one_alert(app, product):
+    product.price = 90.0
+    db.session.commit()
+    product.price = 70.0
+    product.title = 'Oak dining table'
+    db.session.commit()
+    assert alert_jobs() == [[product.id, 'price_drop', 90.0, 70.0]]
+
+
+def test_old_values_of_expired_products_are_read_from_the_database(app, product):
+    product_id = product.id
+    db.session.commit()
+    # Expired by the commit; setting the price does not load the old one
+    product.price = 60.0
+    db.session.commit()
+    db.session.get(Product, product_id).is_sold = True
+    db.session.commit()
+    db.session.expire_all()
+    db.session.get(Product, product_id).is_sold = False
+    db.session.commit()
+    assert alert_jobs() == [[product_id, 'price_drop', 80.0, 60.0], [product_id, 'back_in_stock']]
+
+
+def test_the_hook_is_registered_once_and_follows_the_setting(app, product):
+    create_app()
+    product.price = 70.0
+    db.session.commit()
+    assert len(alert_jobs()) == 1
+
+    app.config['WISHLIST_ALERTS_ENABLED'] = False
+    product.price = 50.0
+    db.session.commit()
+    assert len(alert_jobs()) == 1
+
+
+@pytest.mark.parametrize('update_returning', [True, False])
+def test_send_alerts_skips_the_seller_and_users_alerted_recently(app, monkeypatch, make_user, product,
+                                                                 update_returning):
+    monkeypatch.setattr(db.engine.dialect, 'update_returning', update_returning)
+    fresh, recent = make_user('fresh'), make_user('recent')
+    recent.last_wishlist_alert_at = NOW - timedelta(hours=1)
+    db.session.add_all([Wishlist(user_id=user_id, product_id=product.id)
+                        for user_id in (fresh.id, recent.id, product.owner_id)])
+    db.session.commit()
+
+    with app.test_request_context():
+        assert wishlist_alerts.send_alerts(product.id, 'price_drop', 80.0, 60.0, now=NOW) == 1
+    notification = Notification.query.one()
+    assert (notification.user_id, notification.title) == (fresh.id, 'Price Drop')
+    assert '$80.00 to $60.00' in notification.message
+    assert db.session.get(User, fresh.id).last_wishlist_alert_at == NOW
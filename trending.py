@@ -0,0 +1,125 @@
+"""Time-decayed trending score for the homepage and the "popular" sort.
+
+Every event adds WEIGHTS[kind] * 2 ** ((t - EPOCH) / HALF_LIFE) to a
+product's score. Events grow with time instead of old scores shrinking, so
+ranking by the stored value at any moment is the same as ranking by a score
+that halves every HALF_LIFE_HOURS. No row ever needs to be re-decayed.
+Product.trending_score holds log2 of that sum, which keeps the numbers small
+(about one per half-life since EPOCH).
+
+New listings get their 'listed' event as a column default. Everything else
+is added by the trending.rollup job:
+- wishlist adds and offers since the last rollup,
+- views buffered in Product.pending_views by the views.flush job.
+The rollup moves its watermark in the same transaction as the scores. So an
+event is counted exactly once, and a concurrent rollup waits for the watermark
+row and then finds nothing left to do.
+"""
+import math
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, select, update
+
+EPOCH = datetime(2024, 1, 1)
+HALF_LIFE_HOURS = 24
+WEIGHTS = {'listed': 10, 'view': 1, 'wishlist': 5, 'offer': 8}
+# How far back the first rollup looks for events
+BACKFILL_DAYS = 7
+CHUNK = 500
+
+
+def decay_time(when):
+    """Half-lives between EPOCH and when"""
+    return (when - EPOCH).total_seconds() / 3600 / HALF_LIFE_HOURS
+
+
+def log_add(a, b):
+    """log2(2**a + 2**b) without overflow"""
+    if a < b:
+        a, b = b, a
+    return a + math.log2(1 + 2 ** (b - a))
+
+
+def event_score(kind, when, count=1):
+    return decay_time(when) + math.log2(WEIGHTS[kind] * count)
+
+
+def new_listing_score():
+    return event_score('listed', datetime.utcnow())
+
+
+def _add(increments, product_id, score):
+    current = increments.get(product_id)
+    increments[product_id] = score if current is None else log_add(current, score)
+
+
+def rollup(now=None):
+    """Add events since the last rollup to trending scores; returns products updated"""
+    from app import db
+    from models import Offer, Product, RollupWatermark, Wishlist
+
+    now = now or datetime.utcnow()
+    watermark = db.session.get(RollupWatermark, 'trending')
+    if watermark is None:
+        since = now - timedelta(days=BACKFILL_DAYS)
+        db.session.add(RollupWatermark(name='trending', until=now))
+        db.session.flush()
+        _backfill_listings(since)
+    else:
+        since = watermark.until
+        # Claims the window; a concurrent rollup blocks here, then matches no row
+        if not db.session.execute(
+                update(RollupWatermark).where(RollupWatermark.name == 'trending', RollupWatermark.until == since)
+                .values(until=now)).rowcount:
+            db.session.rollback()
+            return 0
+
+    increments = {}
+    for kind, column, when in (('wishlist', Wishlist.product_id, Wishlist.added_at),
+                               ('offer', Offer.product_id, Offer.created_at)):
+        for product_id, at in db.session.execute(select(column, when).where(when > since, when <= now)):
+            _add(increments, product_id, event_score(kind, at))
+
+    pending = db.session.execute(
+        select(Product.id, Product.pending_views).where(Product.pending_views > 0)).all()
+    for product_id, count in pending:
+        _add(increments, product_id, event_score('view', now, count))
+    if pending:
+        # Views flushed after the SELECT stay pending for the next rollup
+        product = Product.__table__
+        db.session.execute(
+            update(product).where(product.c.id == bindparam('product_id'))
+            .values(pending_views=product.c.pending_views - bindparam('consumed')),
+            [{'product_id': product_id, 'consumed': count} for product_id, count in pending])
+
+    product_ids = sorted(increments)
+    for start in range(0, len(product_ids), CHUNK):
+        chunk = product_ids[start:start + CHUNK]
+        scores = db.session.execute(
+            select(Product.id, Product.trending_score).where(Product.id.in_(chunk))).all()
+        _set_scores([(product_id, log_add(score, increments[product_id])) for product_id, score in scores])
+    db.session.commit()
+    return len(product_ids)
+
+
+def _set_scores(scores):
+    """Write (product id, trending score) pairs in one executemany"""
+    from app import db
+    from models import Product
+
+    if not scores:
+        return
+    product = Product.__table__
+    db.session.execute(
+        update(product).where(product.c.id == bindparam('product_id')).values(trending_score=bindparam('score')),
+        [{'product_id': product_id, 'score': score} for product_id, score in scores])
+
+
+def _backfill_listings(since):
+    """Give recent listings from before trending existed their 'listed' event"""
+    from app import db
+    from models import Product
+
+    rows = db.session.execute(
+        select(Product.id, Product.created_at).where(Product.created_at > since, Product.trending_score == 0)).all()
+    _set_scores([(product_id, event_score('listed', created_at)) for product_id, created_at in rows])
@@ -1,8 +1,9 @@
 import os
 import secrets
-from PIL import Image
-from flask import current_app
+from flask import current_app, has_app_context
 from werkzeug.utils import secure_filename
+import metrics
+import realtime
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -10,18 +11,130 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def save_image(form_image, max_size=(800, 800)):
-    """Save uploaded image and return the filename"""
-    if not form_image:
-        current_app.logger.warning("No image file provided")
-        return ''
+# Magic numbers of the formats we accept, checked before Pillow sees the file
+IMAGE_SIGNATURES = ((b'\xff\xd8\xff', 'JPEG'), (b'\x89PNG\r\n\x1a\n', 'PNG'),
+                    (b'GIF87a', 'GIF'), (b'GIF89a', 'GIF'))
+DEFAULT_MAX_DECODE_BYTES = 64 * 1024 * 1024
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+# Decode size for perceptual hashes; JPEGs decode at 1/8 scale or less
+HASH_DECODE_SIZE = (64, 64)
+
+def sniff_image_format(header):
+    """Format name for the first bytes of a file, or None if it is not an accepted image"""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+def _stored_box(img, max_size):
+    """max_size in the orientation the pixels are stored in (EXIF may rotate them for display)"""
+    if img.getexif().get(0x0112) in ROTATED_ORIENTATIONS:
+        return max_size[1], max_size[0]
+    return tuple(max_size)
+
+def open_image(stream, max_size=(800, 800), max_decode_bytes=DEFAULT_MAX_DECODE_BYTES):
+    """Open an image for resizing to max_size, reading only its header.
+
+    JPEGs are set up to decode straight at the smallest DCT scale (1/2, 1/4
+    or 1/8) that still covers max_size. Raises ValueError when the file is
+    not a JPEG, PNG or GIF, or when decoding it would take more than
+    max_decode_bytes of memory.
+    """
+    from PIL import Image, UnidentifiedImageError
+    header = stream.read(16)
+    stream.seek(0)
+    image_format = sniff_image_format(header)
+    if image_format is None:
+        raise ValueError('Only PNG, JPG, JPEG, and GIF images are allowed!')
+    try:
+        img = Image.open(stream, formats=[image_format])
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ValueError('The image file is damaged or not a supported image.')
+    box = _stored_box(img, max_size)
+    if img.format == 'JPEG':
+        scale = min(box[0] / img.width, box[1] / img.height, 1)
+        img.draft('RGB', (max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+    if img.width * img.height * len(img.getbands()) > max_decode_bytes:
+        raise ValueError(f'The image is too large ({img.width}x{img.height}); please upload a smaller one.')
+    return img
+
+def check_image(file_storage):
+    """Validate an upload from its header without decoding it; raises ValueError"""
+    max_decode_bytes = current_app.config['IMAGE_MAX_DECODE_MB'] * 1024 * 1024
+    try:
+        open_image(file_storage.stream, max_decode_bytes=max_decode_bytes)
+    finally:
+        file_storage.stream.seek(0)
+
+def _shrink(img, max_size):
+    """Decode img within max_size, turn it upright and flatten transparency onto white"""
+    from PIL import Image, ImageOps
+    box = _stored_box(img, max_size)
+    # Resize if image is too large; JPEGs decode at the scale set by open_image
+    if img.width > box[0] or img.height > box[1]:
+        img.thumbnail(box, Image.Resampling.LANCZOS)
+    # Rotating the small image is cheap; saving drops the EXIF with the tag
+    img = ImageOps.exif_transpose(img)
+    
+    # Convert RGBA to RGB if necessary
+    if img.mode == 'RGBA':
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    return img
+
+def image_dhash(img):
+    """64-bit difference hash of img: bit i is set when pixel i of a 9x8
+    grayscale thumbnail is brighter than its right neighbour. Resizing,
+    recompression and small edits change only a few bits.
     
-    if not form_image.filename:
-        current_app.logger.warning("Image file has no filename")
+    Decodes img into a small thumbnail in place, so call it last.
+    """
+    from PIL import Image
+    small = _shrink(img, HASH_DECODE_SIZE).convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def optimize_image(path, max_size=(800, 800), max_decode_bytes=DEFAULT_MAX_DECODE_BYTES):
+    """Shrink and recompress the image at path in place; runs as a CPU job"""
+    with open(path, 'rb') as f:
+        original = open_image(f, max_size, max_decode_bytes)
+        image_format = original.format
+        img = _shrink(original, max_size)
+        tmp_path = path + '.tmp'
+        img.save(tmp_path, format=image_format, optimize=True, quality=85)
+    # Readers see either the upload or the finished file, never half of one
+    os.replace(tmp_path, path)
+
+def upload_path(image_url):
+    """Filesystem path of an image_url like uploads/<name>"""
+    # Process pool workers have no app; app.py's root_path is this directory
+    root = current_app.root_path if has_app_context() else os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(root, 'static', image_url)
+
+def optimize_upload(image_url, max_size=(800, 800), max_decode_bytes=DEFAULT_MAX_DECODE_BYTES):
+    """optimize_image() for an uploaded image_url; the images.optimize job"""
+    optimize_image(upload_path(image_url), max_size, max_decode_bytes)
+
+def save_image(form_image, max_size=(800, 800), defer=False):
+    """Save uploaded image and return the filename.
+    
+    The upload is always shrunk and re-encoded before it is written, so its
+    EXIF data (GPS position included) never reaches the public uploads folder.
+    With defer its perceptual hash is left to the caller's listings.duplicates
+    job; otherwise the hash is added to the session for duplicate detection
+    (see duplicates.py).
+    """
+    if not form_image or not form_image.filename:
+        current_app.logger.debug("No image file provided")
         return ''
     
     if not allowed_file(form_image.filename):
-        current_app.logger.warning(f"File type not allowed: {form_image.filename}")
+        current_app.logger.warning("File type not allowed: %s", form_image.filename)
         return ''
     
     # Generate random filename
@@ -33,60 +146,70 @@ def save_image(form_image, max_size=(800, 800)):
     # Ensure uploads directory exists
     upload_dir = os.path.join(current_app.root_path, 'static/uploads')
     os.makedirs(upload_dir, exist_ok=True)
+    max_decode_bytes = current_app.config['IMAGE_MAX_DECODE_MB'] * 1024 * 1024
     
-    # Resize image to reduce file size
     try:
-        current_app.logger.info(f"Opening image: {form_image.filename}")
-        img = Image.open(form_image)
-        current_app.logger.info(f"Image size: {img.width}x{img.height}")
-        
-        # Convert RGBA to RGB if necessary
-        if img.mode == 'RGBA':
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        
-        # Resize if image is too large
-        if img.width > max_size[0] or img.height > max_size[1]:
-            current_app.logger.info(f"Resizing image from {img.width}x{img.height} to max {max_size}")
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        current_app.logger.info(f"Saving image to: {image_path}")
-        img.save(image_path, optimize=True, quality=85)
-        current_app.logger.info(f"Image saved successfully: {image_fn}")
+        with metrics.track('image'):
+            # JPEGs decode straight at the reduced scale open_image sets up
+            img = open_image(form_image.stream, max_size, max_decode_bytes)
+            original_size = img.size
+            image_format = img.format
+            img = _shrink(img, max_size)
+            img.save(image_path, format=image_format, optimize=True, quality=85)
+            current_app.logger.debug("Saved image %s (%dx%d -> %dx%d)", image_fn,
+                                     original_size[0], original_size[1], img.width, img.height)
+            if not defer:
+                import duplicates
+                duplicates.record(f'uploads/{image_fn}', image_dhash(img))
         return f'uploads/{image_fn}'
-    except Exception as e:
-        current_app.logger.error(f'Error saving image {form_image.filename}: {str(e)}')
-        import traceback
-        current_app.logger.error(f'Traceback: {traceback.format_exc()}')
+    except ValueError as e:
+        current_app.logger.warning('Rejected image %s: %s', form_image.filename, e)
         return ''
+    except Exception:
+        current_app.logger.exception('Error saving image %s', form_image.filename)
+        return ''
+
+def delete_uploads(paths):
+    """Remove uploaded image files that no listing refers to any more; runs as a job"""
+    from models import ArchivedProduct, ImageHash, Product, ProductImage
+    from app import db
+    from sqlalchemy import delete, select, union
+    
+    in_use = set(db.session.scalars(union(
+        select(Product.image_url).where(Product.image_url.in_(paths)),
+        select(ProductImage.image_url).where(ProductImage.image_url.in_(paths)),
+        select(ArchivedProduct.image_url).where(ArchivedProduct.image_url.in_(paths)))))
+    upload_dir = os.path.join(current_app.root_path, 'static', 'uploads')
+    removed = []
+    for path in paths:
+        full_path = os.path.realpath(os.path.join(current_app.root_path, 'static', path))
+        if path in in_use or os.path.dirname(full_path) != os.path.realpath(upload_dir):
+            continue
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            pass
+        removed.append(path)
+    if removed:
+        db.session.execute(delete(ImageHash).where(ImageHash.image_url.in_(removed)))
+    return len(removed)
 
-def save_multiple_images(form_images, max_files=5):
+def save_multiple_images(form_images, max_files=5, defer=False):
     """Save multiple uploaded images and return list of filenames"""
     if not form_images:
-        current_app.logger.info("No additional images provided")
         return []
     
     saved_images = []
-    count = 0
     
-    for i, form_image in enumerate(form_images):
-        if count >= max_files:
-            current_app.logger.info(f"Reached max file limit ({max_files}), skipping remaining images")
+    for form_image in form_images:
+        if len(saved_images) >= max_files:
+            current_app.logger.debug("Reached max file limit (%d), skipping remaining images", max_files)
             break
         
-        current_app.logger.info(f"Processing additional image {i+1}: {getattr(form_image, 'filename', 'Unknown')}")
-        
         if form_image and form_image.filename and allowed_file(form_image.filename):
-            image_url = save_image(form_image)
+            image_url = save_image(form_image, defer=defer)
             if image_url:
                 saved_images.append(image_url)
-                count += 1
-                current_app.logger.info(f"Successfully processed additional image {i+1}")
-            else:
-                current_app.logger.error(f"Failed to save additional image {i+1}: {form_image.filename}")
-        else:
-            current_app.logger.warning(f"Invalid or empty additional image {i+1}")
     
     return saved_images
 
@@ -104,8 +227,25 @@ def create_notification(user_id, title, message, notification_type='info', link=
     )
     db.session.add(notification)
     db.session.commit()
+    realtime.publish(user_id, 'notification', {'title': title, 'message': message, 'link': link})
+    realtime.publish_counts(user_id)
     return notification
 
+def create_notifications(notifications):
+    """Create many notifications in one INSERT; each item is a dict of Notification fields"""
+    from models import Notification
+    from app import db
+    from sqlalchemy import insert
+    
+    notifications = list(notifications)
+    if not notifications:
+        return 0
+    db.session.execute(insert(Notification), [dict(n, is_read=False) for n in notifications])
+    db.session.commit()
+    for user_id in {n['user_id'] for n in notifications}:
+        realtime.publish_counts(user_id)
+    return len(notifications)
+
 def get_condition_badge_class(condition):
     """Return Bootstrap badge class for product condition"""
     condition_classes = {
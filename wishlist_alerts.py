@@ -0,0 +1,115 @@
+"""Tell wishlisters when a product gets cheaper or comes back on sale.
+
+A session hook notices Product price drops and is_sold going back to False
+at flush time. It enqueues a wishlist.alerts job in the same transaction, so
+the seller's request does not wait on the wishlisters. The fan-out walks the
+(product_id, user_id) wishlist index in chunks. For each chunk it claims
+the users who are outside their alert window with one UPDATE ... RETURNING
+(on MySQL, which lacks it, by locking and reading them first), then notifies
+them with one multi-row insert.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app, url_for
+from sqlalchemy import and_, event, inspect, or_, select, update
+
+
+def _detect_changes(session, flush_context, instances):
+    if not current_app.config['WISHLIST_ALERTS_ENABLED']:
+        return
+    import jobs
+    from models import Product
+    changed = {}
+    for obj in session.dirty:
+        if not isinstance(obj, Product):
+            continue
+        state = inspect(obj)
+        if not state.persistent:
+            continue
+        price, sold = state.attrs.price.history, state.attrs.is_sold.history
+        if price.added or sold.added:
+            changed[state.identity[0]] = (price, sold)
+    if not changed:
+        return
+
+    # An expired product takes the new value without loading the old one, so
+    # its history has nothing deleted; read what the database still holds
+    unloaded = [product_id for product_id, (price, sold) in changed.items()
+                if (price.added and not price.deleted) or (sold.added and not sold.deleted)]
+    stored = {}
+    if unloaded:
+        stored = {row.id: row for row in session.execute(
+            select(Product.id, Product.price, Product.is_sold).where(Product.id.in_(unloaded)))}
+
+    for product_id, (price, sold) in changed.items():
+        if price.added:
+            old_price = price.deleted[0] if price.deleted else stored[product_id].price
+            new_price = price.added[0]
+            if old_price is not None and new_price is not None and new_price < old_price:
+                jobs.enqueue('wishlist.alerts', product_id, 'price_drop', old_price, new_price)
+        if sold.added:
+            was_sold = sold.deleted[0] if sold.deleted else stored[product_id].is_sold
+            if was_sold and not sold.added[0]:
+                jobs.enqueue('wishlist.alerts', product_id, 'back_in_stock')
+
+
+def send_alerts(product_id, kind, old_price=None, new_price=None, now=None, chunk_size=1000, window_hours=6):
+    """Notify everyone with product_id on their wishlist; returns the number notified.
+
+    A user notified in the last window_hours (any product) is skipped.
+    """
+    from app import db
+    from models import Product, User, Wishlist
+    from utils import create_notifications
+
+    now = now or datetime.utcnow()
+    product = db.session.get(Product, product_id)
+    if product is None or product.is_sold:
+        return 0
+    if kind == 'price_drop':
+        title = 'Price Drop'
+        message = f'"{product.title}" on your wishlist dropped from ${old_price:.2f} to ${new_price:.2f}.'
+    else:
+        title = 'Back in Stock'
+        message = f'"{product.title}" on your wishlist is available again.'
+    link = url_for('product_detail', id=product_id)
+
+    due = User.last_wishlist_alert_at.is_(None)
+    if window_hours:
+        due = or_(due, User.last_wishlist_alert_at < now - timedelta(hours=window_hours))
+
+    notified = 0
+    last_user_id = 0
+    while True:
+        user_ids = db.session.scalars(
+            select(Wishlist.user_id)
+            .where(Wishlist.product_id == product_id, Wishlist.user_id > last_user_id)
+            .order_by(Wishlist.user_id).limit(chunk_size)).all()
+        if not user_ids:
+            break
+        last_user_id = user_ids[-1]
+        claimable = and_(User.id.in_(user_ids), User.id != product.owner_id, due)
+        if db.session.get_bind(clause=User.__table__).dialect.update_returning:
+            claimed = db.session.scalars(
+                update(User).where(claimable).values(last_wishlist_alert_at=now).returning(User.id)).all()
+        else:
+            claimed = db.session.scalars(select(User.id).where(claimable).with_for_update()).all()
+            if claimed:
+                db.session.execute(update(User).where(User.id.in_(claimed)).values(last_wishlist_alert_at=now))
+        # Commits the claim and the notifications together
+        create_notifications(dict(user_id=user_id, title=title, message=message, type='info', link=link)
+                             for user_id in claimed)
+        db.session.commit()
+        notified += len(claimed)
+        if len(user_ids) < chunk_size:
+            break
+    return notified
+
+
+def init_app(app, db):
+    """Watch product updates on db.session and enqueue alert jobs"""
+    app.config.setdefault('WISHLIST_ALERTS_ENABLED', True)
+    app.config.setdefault('WISHLIST_ALERT_WINDOW_HOURS', 6)
+    # db.session outlives the app, so listen once; the hook checks the current app's setting
+    if not event.contains(db.session, 'before_flush', _detect_changes):
+        event.listen(db.session, 'before_flush', _detect_changes)